@@ -0,0 +1,52 @@
+"""Compares two benchmark results, e.g. before and after a change.
+
+Prints every measurement of both results with its relative change, marking
+changes for the worse beyond `--threshold` percent:
+    python -m benchmarks.compare benchmarks/results/abc1234.json benchmarks/results/def5678.json
+"""
+import argparse
+import json
+from typing import Dict, Iterator, Tuple
+
+# Lower is better for latencies and errors, higher for throughput
+LOWER_IS_BETTER = ("Ms", "errors")
+
+
+def flatten(results: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            yield from flatten(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+    print(
+        f"{baseline['environment']['commit']} -> {candidate['environment']['commit']}"
+    )
+
+    baseline.pop("environment")
+    candidate_values: Dict[str, float] = dict(flatten(candidate))
+    for name, before in flatten(baseline):
+        after = candidate_values.get(name)
+        if after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change if name.endswith(LOWER_IS_BETTER) else -change
+        marker = " !" if worse > args.threshold else ""
+        print(f"{name:60} {before:>10} {after:>10} {change:+7.1f}%{marker}")
+
+
+if __name__ == "__main__":
+    main()
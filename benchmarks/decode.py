@@ -0,0 +1,55 @@
+"""Compares image decode paths on large JPEG photos.
+
+Usage:
+    python -m benchmarks.decode --width 4000 --height 3000 --runs 20
+"""
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.synthetic import synthetic_image
+from src.modules.augmentations import letterbox
+from src.modules.loaders import decode_image
+
+
+def baseline_path(data: bytes, img_size: int) -> np.ndarray:
+    img0 = np.array(Image.open(BytesIO(data)).convert("RGB"))
+    return letterbox(img0, new_shape=img_size, auto=False)[0]
+
+
+def reduced_path(data: bytes, img_size: int) -> np.ndarray:
+    img0 = decode_image(data, img_size)
+    return letterbox(img0, new_shape=img_size, auto=False)[0]
+
+
+def measure(func, data: bytes, img_size: int, runs: int) -> float:
+    func(data, img_size)  # warmup
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(data, img_size)
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    data = synthetic_image(args.width, args.height)
+    print(
+        f"{args.width}x{args.height} JPEG, {len(data) / 1e6:.1f} MB, img_size={args.img_size}"
+    )
+    baseline = measure(baseline_path, data, args.img_size, args.runs)
+    reduced = measure(reduced_path, data, args.img_size, args.runs)
+    print(f"full decode:    {baseline * 1000:8.1f} ms/image")
+    print(f"reduced decode: {reduced * 1000:8.1f} ms/image ({baseline / reduced:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
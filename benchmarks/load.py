@@ -0,0 +1,196 @@
+"""HTTP load generator for the predict endpoints.
+
+Sends requests at fixed concurrency levels and reports latency percentiles
+and throughput, against a running server with `--url` or the app served
+in-process on a synthetic model. Requests are built from synthetic images,
+or replayed from a JSONL file of request bodies with `--replay`, e.g.:
+    python -m benchmarks.load --concurrency 1 4 16
+    python -m benchmarks.load --url http://localhost:8000 --replay requests.jsonl
+
+Each replayed line is a `PredictRequest` or `PredictBatchRequest` body,
+optionally with `path` of the endpoint, other lines are skipped.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import tempfile
+import time
+from itertools import cycle
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic import build_model, synthetic_image
+from src.config import settings
+
+SINGLE_PATH = f"{settings.API_V1_PREFIX}/object-detection/predict"
+BATCH_PATH = f"{settings.API_V1_PREFIX}/object-detection/predict/batch"
+
+Request = Tuple[str, Dict[str, Any]]
+
+
+def synthetic_requests(
+    images: int = 16, batch_size: int = 8, width: int = 1280, height: int = 720
+) -> Dict[str, List[Request]]:
+    """Returns single and batch request bodies of distinct images, avoiding result cache hits."""
+    encoded = [
+        base64.b64encode(synthetic_image(width, height, seed=seed)).decode()
+        for seed in range(images)
+    ]
+    return {
+        "single": [(SINGLE_PATH, {"image": image}) for image in encoded],
+        "batch": [
+            (BATCH_PATH, {"images": encoded[i : i + batch_size]})
+            for i in range(0, images, batch_size)
+        ],
+    }
+
+
+def replay_requests(path: str) -> List[Request]:
+    requests = []
+    with open(path) as file:
+        for line in file:
+            try:
+                body = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(body, dict):
+                continue
+            if "image" in body:
+                requests.append((body.pop("path", SINGLE_PATH), body))
+            elif "images" in body:
+                requests.append((body.pop("path", BATCH_PATH), body))
+    return requests
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    requests: List[Request],
+    concurrency: int,
+    total: int,
+) -> Dict[str, float]:
+    latencies, errors = [], 0
+    pending = iter(range(total))
+    bodies = cycle(requests)
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            path, body = next(bodies)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {
+        "requests": total,
+        "errors": errors,
+        "requestsPerSecond": round(total / elapsed, 2),
+        "meanMs": round(float(np.mean(latencies)) * 1000, 2),
+        "p50Ms": round(p50, 2),
+        "p90Ms": round(p90, 2),
+        "p99Ms": round(p99, 2),
+    }
+
+
+def in_process_app():
+    """Returns the app serving a synthetic model, with result cache disabled."""
+    model_dir = tempfile.mkdtemp(prefix="benchmark-models-")
+    build_model(model_dir, "synthetic")
+    settings.MODEL_DIR = model_dir
+    settings.WANDB_DEFAULT_TAG = "synthetic"
+    settings.MODEL_DEFAULT_BACKEND = "torchscript"
+    settings.RESULT_CACHE_MAX_ENTRIES = 0
+
+    from src.main import app
+
+    return app
+
+
+async def run(
+    client: httpx.AsyncClient,
+    scenarios: Dict[str, List[Request]],
+    concurrency: Sequence[int] = (1, 4, 16),
+    requests_per_level: int = 64,
+) -> Dict[str, Any]:
+    # Warmup loads the model in-process, and opens connections to the server
+    for requests in scenarios.values():
+        await run_load(client, requests, 1, min(len(requests), 2))
+
+    return {
+        name: {
+            f"concurrency{level}": await run_load(
+                client, requests, level, requests_per_level
+            )
+            for level in concurrency
+        }
+        for name, requests in scenarios.items()
+    }
+
+
+async def run_app(scenarios: Dict[str, List[Request]], url: Optional[str], **kwargs):
+    if url:
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            return await run(client, scenarios, **kwargs)
+
+    app = in_process_app()
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+        ) as client:
+            return await run(client, scenarios, **kwargs)
+    finally:
+        await app.router.shutdown()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--url", help="Running server, the app is served in-process if not set"
+    )
+    parser.add_argument("--replay", help="JSONL file of request bodies to replay")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument(
+        "--requests", type=int, default=64, help="Requests per concurrency level"
+    )
+
+
+def scenarios_from_args(args: argparse.Namespace) -> Dict[str, List[Request]]:
+    if args.replay:
+        return {"replay": replay_requests(args.replay)}
+    return synthetic_requests()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = scenarios_from_args(args)
+    if not any(scenarios.values()):
+        parser.error(f"No request bodies found in '{args.replay}'.")
+
+    results = asyncio.run(
+        run_app(
+            scenarios,
+            args.url,
+            concurrency=args.concurrency,
+            requests_per_level=args.requests,
+        )
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
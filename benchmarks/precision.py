@@ -0,0 +1,79 @@
+"""Compares reduced precision model with the fp32 baseline.
+
+Runs both models on a folder of images and reports detection agreement and
+throughput, e.g.:
+    python -m benchmarks.precision --backend onnx --precision int8-static --images calibration
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from src.config import settings
+from src.modules.detector import Detector, batches_by_shape
+from src.modules.model import Model
+from src.modules.quantization import IMAGE_SUFFIXES, PRECISIONS, compare_detections
+
+
+def run(detector: Detector, datas, batch_size: int):
+    start = time.perf_counter()
+    preprocessed = list(map(detector.preprocess, datas))
+    results = [None] * len(datas)
+    # Images of different aspect ratios are letterboxed to different input shapes
+    for indices in batches_by_shape([img for img, _ in preprocessed], batch_size):
+        imgs, img0s = zip(*(preprocessed[i] for i in indices))
+        for i, result in zip(indices, detector.infer(imgs, img0s)):
+            results[i] = result.detections
+    return results, len(datas) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tag", default=settings.WANDB_DEFAULT_TAG)
+    parser.add_argument("--backend", default=settings.MODEL_DEFAULT_BACKEND)
+    parser.add_argument("--precision", choices=PRECISIONS, required=True)
+    parser.add_argument("--images", default=settings.MODEL_CALIBRATION_DIR)
+    parser.add_argument("--batch-size", type=int, default=settings.MAX_BATCH_SIZE)
+    args = parser.parse_args()
+
+    datas = [
+        path.read_bytes()
+        for path in sorted(Path(args.images).iterdir())
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+    detectors = {
+        precision: Detector(
+            model=Model(
+                model_root=settings.MODEL_DIR,
+                tag=args.tag,
+                backend=args.backend,
+                precision=precision,
+            ),
+            confidence_threshold=settings.DEFAULT_CONFIDENCE_THRESHOLD,
+            iou_threshold=settings.DEFAULT_IOU_THRESHOLD,
+            shape_buckets=settings.SHAPE_BUCKETS,
+        )
+        for precision in ("fp32", args.precision)
+    }
+    # Warmup both models before measuring throughput
+    for detector in detectors.values():
+        run(detector, datas[: args.batch_size], args.batch_size)
+
+    baseline, baseline_throughput = run(detectors["fp32"], datas, args.batch_size)
+    candidate, candidate_throughput = run(
+        detectors[args.precision], datas, args.batch_size
+    )
+
+    report = compare_detections(baseline, candidate)
+    report.update(
+        images=len(datas),
+        fp32ImagesPerSecond=round(baseline_throughput, 2),
+        candidateImagesPerSecond=round(candidate_throughput, 2),
+        speedup=round(candidate_throughput / baseline_throughput, 2),
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Compares memory allocated by batch preprocessing paths.
+
+The copying path letterboxes with a padded copy, transposes to a contiguous
+CHW copy per image, stacks the batch and normalizes into a new float tensor,
+as preprocessing did before. The buffered path letterboxes straight into
+the padded array and writes the batch into reused input buffers. Decoding
+is the same for both and is not measured, e.g.:
+    python -m benchmarks.preprocess --batch-size 8 --width 1920 --height 1080
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List
+
+import numpy as np
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+from benchmarks.synthetic import synthetic_image
+from src.modules.augmentations import letterbox, letterbox_into
+from src.modules.buffers import InputBuffers
+from src.modules.loaders import decode_image
+
+
+def copying_path(img0s: List[np.ndarray], img_size: int) -> torch.Tensor:
+    imgs = []
+    for img0 in img0s:
+        img = letterbox(img0, new_shape=img_size, auto=False)[0]
+        imgs.append(np.ascontiguousarray(img.transpose(2, 0, 1)))
+    return torch.from_numpy(np.stack(imgs)) / 255.0
+
+
+def buffered_path(buffers: InputBuffers) -> Callable:
+    def run(img0s: List[np.ndarray], img_size: int) -> None:
+        # Padded arrays are the one allocation per image, they outlive the
+        # scheduler queue before being written into the batch buffer
+        imgs = [
+            letterbox_into(img0, np.empty((img_size, img_size, 3), np.uint8))
+            for img0 in img0s
+        ]
+        with buffers.batch(imgs):
+            pass
+
+    return run
+
+
+def measure(func: Callable, img0s: List[np.ndarray], img_size: int, runs: int):
+    func(img0s, img_size)  # warmup, fills buffer pool
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(img0s, img_size)
+    seconds = (time.perf_counter() - start) / runs
+
+    # NumPy arrays are traced by tracemalloc and tensors by the profiler,
+    # measured in separate runs as the profiler allocates itself
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    func(img0s, img_size)
+    numpy_peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        func(img0s, img_size)
+    torch_allocated = sum(
+        max(event.self_cpu_memory_usage, 0) for event in prof.key_averages()
+    )
+    return seconds, numpy_peak, torch_allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    img0s = [
+        decode_image(synthetic_image(args.width, args.height, seed=seed), args.img_size)
+        for seed in range(args.batch_size)
+    ]
+    print(
+        f"{args.batch_size} x {args.width}x{args.height} images, img_size={args.img_size}"
+    )
+    paths = {
+        "copying": copying_path,
+        "buffered": buffered_path(InputBuffers(torch.device("cpu"))),
+    }
+    for name, func in paths.items():
+        seconds, numpy_peak, torch_allocated = measure(
+            func, img0s, args.img_size, args.runs
+        )
+        print(
+            f"{name:10} {seconds * 1000:8.2f} ms/batch, numpy peak {numpy_peak / 1e6:7.2f} MB, "
+            f"torch allocated {torch_allocated / 1e6:7.2f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
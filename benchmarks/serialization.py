@@ -0,0 +1,97 @@
+"""Compares time spent rendering detection responses.
+
+The validated path builds the response model, which FastAPI validates again
+against `response_model` and encodes with the stdlib JSON encoder, as
+responses were rendered before. The other paths render plain dicts with
+orjson and msgpack, in default and compact format, e.g.:
+    python -m benchmarks.serialization --detections 300
+"""
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from src.modules.detector import ImageDetections
+from src.modules.serialization import (
+    ResponseFormat,
+    ResultFormat,
+    default_detections,
+    msgpack,
+)
+from src.schemas import PredictResponse
+
+CLASS_NAMES = [f"class{i}" for i in range(80)]
+FIELD = create_response_field(name="Response", type_=PredictResponse)
+LOOP = asyncio.new_event_loop()
+
+
+def synthetic_detections(count: int, seed: int = 0) -> List[List[Any]]:
+    rng = random.Random(seed)
+    detections = []
+    for _ in range(count):
+        x0, y0 = rng.random() * 0.9, rng.random() * 0.9
+        x1, y1 = x0 + rng.random() * 0.1, y0 + rng.random() * 0.1
+        class_id = rng.randrange(len(CLASS_NAMES))
+        detections.append([x0, y0, x1, y1, round(rng.random(), 2), class_id])
+    return detections
+
+
+def validated_path(result: ImageDetections) -> bytes:
+    response = PredictResponse(
+        detections=default_detections(result.detections, CLASS_NAMES),
+        truncated=result.truncated,
+        time=0.1,
+        model="synthetic",
+    )
+    content = LOOP.run_until_complete(
+        serialize_response(field=FIELD, response_content=response)
+    )
+    return JSONResponse(content).body
+
+
+def dict_path(response_format: ResponseFormat) -> Callable[[ImageDetections], bytes]:
+    detector = SimpleNamespace(class_names=CLASS_NAMES)
+
+    def run(result: ImageDetections) -> bytes:
+        content = response_format.image(result, detector)
+        content.update(time=0.1, model="synthetic", profile=None)
+        return response_format.response(content, detector).body
+
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--detections", type=int, default=300)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    result = ImageDetections(synthetic_detections(args.detections))
+    paths = {
+        "validated": validated_path,
+        "orjson": dict_path(ResponseFormat()),
+        "orjson-compact": dict_path(ResponseFormat(ResultFormat.compact)),
+    }
+    if msgpack is not None:
+        paths["msgpack-compact"] = dict_path(
+            ResponseFormat(ResultFormat.compact, msgpack=True)
+        )
+
+    print(f"{args.detections} detections")
+    for name, func in paths.items():
+        body = func(result)  # warmup
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            func(result)
+        seconds = (time.perf_counter() - start) / args.runs
+        print(f"{name:16} {seconds * 1000:8.3f} ms, {len(body) / 1000:7.1f} kB")
+
+
+if __name__ == "__main__":
+    main()
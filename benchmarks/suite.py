@@ -0,0 +1,96 @@
+"""Runs the benchmark suite and stores results as JSON.
+
+Measures in-process detector throughput and HTTP latency of the single and
+batch endpoints, saving results with the git commit they were measured at
+to `benchmarks/results/<commit>.json`, to be compared with
+`benchmarks.compare`, e.g.:
+    python -m benchmarks.suite
+    python -m benchmarks.suite --url http://localhost:8000 --skip-throughput
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks import load, throughput
+from src.config import settings
+from src.modules.executors import INFERENCE_WORKERS, TORCH_NUM_THREADS
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment() -> dict:
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpus": os.cpu_count(),
+        "inferenceWorkers": INFERENCE_WORKERS,
+        "torchThreads": TORCH_NUM_THREADS,
+        "microBatchMaxSize": settings.MICRO_BATCH_MAX_SIZE,
+        "microBatchMaxWaitMs": settings.MICRO_BATCH_MAX_WAIT_MS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    throughput.add_arguments(parser)
+    load.add_arguments(parser)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--skip-throughput", action="store_true")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--output", help="Results file, named by commit if not set")
+    args = parser.parse_args()
+
+    results = {"environment": environment()}
+    if not args.skip_throughput:
+        detector = throughput.create_detector(args.model_dir, args.tag, args.backend)
+        results["throughput"] = throughput.run(
+            detector,
+            args.resolutions,
+            args.formats,
+            args.images,
+            args.batch_sizes,
+            args.runs,
+        )
+    if not args.skip_http:
+        results["http"] = asyncio.run(
+            load.run_app(
+                load.scenarios_from_args(args),
+                args.url,
+                concurrency=args.concurrency,
+                requests_per_level=args.requests,
+            )
+        )
+
+    output = Path(
+        args.output
+        or Path(__file__).parent
+        / "results"
+        / f"{results['environment']['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Saved results to '{output}'.")
+
+
+if __name__ == "__main__":
+    main()
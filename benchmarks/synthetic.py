@@ -0,0 +1,156 @@
+"""Synthetic model and images, so that benchmarks run offline.
+
+The model is a small TorchScript network with YOLOv5 output format, an
+`(batch, anchors, 5 + classes)` tensor of xywh boxes, objectness and class
+scores, which goes through the same post-processing as the real models.
+"""
+import inspect
+import json
+from io import BytesIO
+from itertools import product
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from torch import nn
+
+RESOLUTIONS = ((320, 240), (640, 480), (1280, 720), (1920, 1080), (4000, 3000))
+FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+class SyntheticYolo(nn.Module):
+    def __init__(self, num_classes: int = 80, anchors: int = 3) -> None:
+        super().__init__()
+        self.num_classes = num_classes
+        self.anchors = anchors
+        self.stride = 32
+        self.backbone = nn.Sequential(
+            nn.Conv2d(3, 16, 3, stride=2, padding=1),
+            nn.SiLU(),
+            nn.Conv2d(16, 32, 3, stride=2, padding=1),
+            nn.SiLU(),
+            nn.Conv2d(32, 64, 3, stride=2, padding=1),
+            nn.SiLU(),
+            nn.Conv2d(64, 128, 3, stride=4, padding=1),
+            nn.SiLU(),
+            # Random weights barely respond to smooth images, normalizing
+            # features keeps scores varying across the image
+            nn.InstanceNorm2d(128),
+        )
+        self.head = nn.Conv2d(128, anchors * (5 + num_classes), 1)
+
+        # Spread out scores with low objectness and class priors, as in trained
+        # models, so that a few dozen candidates per image pass the threshold
+        with torch.no_grad():
+            self.head.weight.mul_(3)
+            bias = self.head.bias.view(anchors, 5 + num_classes)
+            bias[:, 4] = -3.0
+            bias[:, 5:] = -2.0
+
+    def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor]:
+        y = self.head(self.backbone(x)).sigmoid()
+        b, _, h, w = y.shape
+        y = y.view(b, self.anchors, 5 + self.num_classes, h, w).permute(0, 1, 3, 4, 2)
+
+        # Boxes centered in their grid cells, sized up to a few cells
+        gy, gx = torch.meshgrid(
+            torch.arange(h, device=x.device),
+            torch.arange(w, device=x.device),
+            indexing="ij",
+        )
+        grid = torch.stack((gx, gy), -1).to(y.dtype)
+        xy = (grid + y[..., :2]) * self.stride
+        wh = (y[..., 2:4] * 4) ** 2 * self.stride
+        y = torch.cat((xy, wh, y[..., 4:]), -1)
+        return (y.reshape(b, -1, 5 + self.num_classes),)
+
+
+def build_model(
+    model_root: str, tag: str = "synthetic", num_classes: int = 80, seed: int = 0
+) -> Path:
+    """Saves synthetic TorchScript model to `model_root/tag`, as cached models are stored."""
+    torch.manual_seed(seed)
+    model = torch.jit.script(SyntheticYolo(num_classes).eval())
+    path = Path(model_root, tag, "model.torchscript")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    config = {"stride": 32, "names": [f"class{i}" for i in range(num_classes)]}
+    torch.jit.save(model, str(path), _extra_files={"config.txt": json.dumps(config)})
+    return path
+
+
+def build_onnx_model(
+    model_root: str,
+    tag: str = "synthetic",
+    num_classes: int = 80,
+    seed: int = 0,
+    batch_size: Optional[int] = None,
+) -> Path:
+    """Exports synthetic model to `model_root/tag` as ONNX, with YOLOv5 export metadata.
+
+    Height and width are dynamic, batch size is fixed if `batch_size` is given,
+    like models exported without dynamic batch axis.
+    """
+    import onnx
+
+    torch.manual_seed(seed)
+    model = SyntheticYolo(num_classes).eval()
+    path = Path(model_root, tag, "model.onnx")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    axes = (
+        {2: "height", 3: "width"}
+        if batch_size
+        else {0: "batch", 2: "height", 3: "width"}
+    )
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the torch.export based exporter
+        options["dynamo"] = False
+    torch.onnx.export(
+        model,
+        torch.zeros(batch_size or 1, 3, 256, 256),
+        str(path),
+        input_names=["images"],
+        output_names=["output0"],
+        dynamic_axes={"images": axes},
+        opset_version=13,
+        **options,
+    )
+
+    onnx_model = onnx.load(str(path))
+    metadata = {"stride": 32, "names": {i: f"class{i}" for i in range(num_classes)}}
+    for key, value in metadata.items():
+        onnx_model.metadata_props.add(key=key, value=str(value))
+    onnx.save(onnx_model, str(path))
+    return path
+
+
+def synthetic_image(
+    width: int, height: int, format: str = "JPEG", quality: int = 90, seed: int = 0
+) -> bytes:
+    # Smooth gradients with noise compress like photos, unlike pure noise
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    noise = np.random.default_rng(seed).normal(0, 12, (height, width, 3))
+    img = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1) + noise
+    buffer = BytesIO()
+    options = {"quality": quality} if format in ("JPEG", "WEBP") else {}
+    Image.fromarray(img.clip(0, 255).astype(np.uint8)).save(
+        buffer, format=format, **options
+    )
+    return buffer.getvalue()
+
+
+def image_sets(
+    resolutions: Sequence[Tuple[int, int]] = RESOLUTIONS,
+    formats: Sequence[str] = FORMATS,
+    images: int = 8,
+) -> Dict[str, list]:
+    """Returns `images` distinct images per resolution and format, keyed like '640x480.jpeg'."""
+    return {
+        f"{width}x{height}.{format.lower()}": [
+            synthetic_image(width, height, format, seed=seed) for seed in range(images)
+        ]
+        for (width, height), format in product(resolutions, formats)
+    }
@@ -0,0 +1,145 @@
+"""Measures in-process inference pipeline throughput on synthetic image sets.
+
+Runs all images of a set concurrently through `InferencePipeline.detect`,
+merged into batches by the micro-batching scheduler as concurrent requests,
+and through `InferencePipeline.detect_batch` at each batch size, reporting
+images per second per resolution and format, e.g.:
+    python -m benchmarks.throughput --batch-sizes 1 8 16 --formats JPEG PNG
+The result cache is disabled, so that every run goes through the model.
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from benchmarks.synthetic import FORMATS, RESOLUTIONS, build_model, image_sets
+from src.config import settings
+from src.modules.batching import BatchScheduler
+from src.modules.cache import ResultCache
+from src.modules.detector import Detector
+from src.modules.executors import INFERENCE_WORKERS
+from src.modules.model import Model
+from src.modules.pipeline import InferencePipeline
+
+
+def create_detector(
+    model_dir: Optional[str] = None,
+    tag: str = "synthetic",
+    backend: str = "torchscript",
+    precision: str = "fp32",
+) -> Detector:
+    """Loads detector of a cached model, or of a synthetic model without `model_dir`."""
+    if model_dir is None:
+        model_dir = tempfile.mkdtemp(prefix="benchmark-models-")
+        build_model(model_dir, tag)
+    return Detector(
+        model=Model(
+            model_root=model_dir, tag=tag, backend=backend, precision=precision
+        ),
+        confidence_threshold=settings.DEFAULT_CONFIDENCE_THRESHOLD,
+        iou_threshold=settings.DEFAULT_IOU_THRESHOLD,
+        shape_buckets=settings.SHAPE_BUCKETS,
+    )
+
+
+def create_pipeline(detector: Detector, batch_size: int) -> InferencePipeline:
+    scheduler = BatchScheduler(
+        detector=detector,
+        max_batch_size=settings.MICRO_BATCH_MAX_SIZE,
+        max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+        max_queue_size=settings.MICRO_BATCH_MAX_QUEUE_SIZE,
+        max_concurrent_batches=INFERENCE_WORKERS,
+    )
+    return InferencePipeline(
+        scheduler=scheduler,
+        result_cache=ResultCache(max_entries=0),
+        max_batch_size=batch_size,
+    )
+
+
+async def measure(
+    detector: Detector, datas: List[bytes], batch_sizes: Sequence[int], runs: int
+) -> Dict[str, float]:
+    async def images_per_second(func: Callable[[], Awaitable]) -> float:
+        await func()  # warmup
+        start = time.perf_counter()
+        for _ in range(runs):
+            await func()
+        return round(len(datas) * runs / (time.perf_counter() - start), 2)
+
+    pipeline = create_pipeline(detector, settings.MAX_BATCH_SIZE)
+    results = {
+        "detect": await images_per_second(
+            lambda: asyncio.gather(*(pipeline.detect(data) for data in datas))
+        )
+    }
+    await pipeline.scheduler.stop()
+    for batch_size in batch_sizes:
+        pipeline = create_pipeline(detector, batch_size)
+        results[f"detectBatch{batch_size}"] = await images_per_second(
+            lambda: pipeline.detect_batch(datas)
+        )
+    return results
+
+
+def run(
+    detector: Detector,
+    resolutions: Sequence = RESOLUTIONS,
+    formats: Sequence[str] = FORMATS,
+    images: int = 8,
+    batch_sizes: Sequence[int] = (1, 8),
+    runs: int = 3,
+) -> Dict[str, Any]:
+    return {
+        name: asyncio.run(measure(detector, datas, batch_sizes, runs))
+        for name, datas in image_sets(resolutions, formats, images).items()
+    }
+
+
+def parse_resolution(value: str):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--model-dir", help="Cached models directory, synthetic model if not set"
+    )
+    parser.add_argument("--tag", default="synthetic")
+    parser.add_argument("--backend", default="torchscript")
+    parser.add_argument(
+        "--resolutions",
+        nargs="+",
+        type=parse_resolution,
+        default=[r for r in RESOLUTIONS if r[0] <= 1920],
+        help="Image sizes as WIDTHxHEIGHT",
+    )
+    parser.add_argument(
+        "--formats", nargs="+", default=["JPEG", "PNG"], choices=FORMATS
+    )
+    parser.add_argument("--images", type=int, default=8, help="Images per set")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    detector = create_detector(args.model_dir, args.tag, args.backend)
+    results = run(
+        detector,
+        args.resolutions,
+        args.formats,
+        args.images,
+        args.batch_sizes,
+        args.runs,
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,9 @@ set -e
 
 . /venv/bin/activate
 
+# Several workers are pre-forked by gunicorn, sharing the preloaded model
+if [ "${WORKERS:-1}" -gt 1 ]; then
+    exec gunicorn src.main:app --config gunicorn.conf.py
+fi
+
 exec uvicorn src.main:app --host 0.0.0.0 --port 80
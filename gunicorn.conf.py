@@ -0,0 +1,66 @@
+"""Gunicorn configuration of multi-worker serving, used when WORKERS > 1.
+
+The app and its default model are loaded once in the master process before
+forking, so that workers share model weights copy-on-write instead of each
+loading a copy. Cores are split between workers, see `src.modules.executors`.
+"""
+import gc
+import os
+import tempfile
+from pathlib import Path
+
+# Metrics of all workers are aggregated from files, which has to be set up
+# before prometheus_client is imported with the app
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="metrics-"))
+for path in Path(os.environ["PROMETHEUS_MULTIPROC_DIR"]).glob("*.db"):
+    path.unlink()
+
+# Model activated in one worker is activated by the others through this file,
+# a new one per server start, so that restarts serve the configured default
+os.environ.setdefault(
+    "MODEL_ACTIVE_TAG_FILE",
+    str(Path(tempfile.mkdtemp(prefix="models-"), "active-tag")),
+)
+
+from src.config import settings
+
+bind = "0.0.0.0:80"
+workers = settings.WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    import torch
+
+    from src.dependencies import get_model_manager
+    from src.exceptions import ModelNotFound
+
+    # OpenMP thread pools do not survive fork, workers would hang on their
+    # first parallel region if the master ran one, so load and warm up
+    # the model single threaded
+    torch.set_num_threads(1)
+    if settings.LOAD_MODEL_ON_STARTUP:
+        manager = get_model_manager()
+        try:
+            manager.preload(manager.default_tag)
+        except ModelNotFound as exc:
+            server.log.error(f"Failed to preload default model: {exc}")
+
+    # Objects loaded so far are never collected, so that garbage collection
+    # in workers does not write to pages shared with the master
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+
+    from src.modules.executors import TORCH_NUM_THREADS
+
+    torch.set_num_threads(TORCH_NUM_THREADS)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
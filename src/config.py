@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseSettings
 
 
@@ -15,10 +17,102 @@ class Settings(BaseSettings):
     MODEL_DIR: str = "models"
     MODEL_DEVICE: str = "cpu"
     MODEL_DEFAULT_BACKEND: str = "torchscript"
+    # One of fp32, fp16, int8-dynamic or int8-static
+    MODEL_PRECISION: str = "fp32"
+    MODEL_CALIBRATION_DIR: str = "calibration"
+
+    ## Resident models, least recently used models are evicted over the budget
+    MODEL_MEMORY_BUDGET_MB: float = 2048
+    # Share of requests without explicit model sent to the canary model
+    MODEL_CANARY_TAG: Optional[str] = None
+    MODEL_CANARY_WEIGHT: float = 0.0
+    # Tags requests may select or activate besides the default and canary tags,
+    # ["*"] allows any tag, which is then fetched from the model registry
+    MODEL_ALLOWED_TAGS: List[str] = []
+    # Token required in X-Admin-Token header to activate models, disabled if not set
+    MODEL_ADMIN_TOKEN: Optional[str] = None
+    # File through which server workers share the activated tag, set by gunicorn config
+    MODEL_ACTIVE_TAG_FILE: Optional[str] = None
+
+    ## ONNX Runtime backend, intra-op threads default to TORCH_NUM_THREADS
+    ONNX_INTRA_OP_THREADS: Optional[int] = None
+    ONNX_INTER_OP_THREADS: int = 1
+    ONNX_GRAPH_OPTIMIZATION_LEVEL: str = "ORT_ENABLE_ALL"
 
     ## Inference
     DEFAULT_CONFIDENCE_THRESHOLD: float = 0.15
     DEFAULT_IOU_THRESHOLD: float = 0.25
+    MAX_DETECTIONS: int = 300
+    MIN_IMG_SIZE: int = 128
+    MAX_IMG_SIZE: int = 1280
+    MAX_BATCH_SIZE: int = 16
+    # Larger images are rejected, tiled ones are limited by TILE_MAX_PIXELS
+    MAX_IMAGE_PIXELS: int = 40_000_000
+    # Aspect ratios (short / long side) of input shapes images are letterboxed
+    # to and batched by, buckets failing warmup are disabled
+    SHAPE_BUCKETS: List[float] = [0.6, 0.75, 1.0]
+
+    ## Tiled inference of high resolution images, opt-in per request, in tiles
+    ## of the inference image size overlapping by a share of it
+    TILE_OVERLAP: float = 0.2
+    TILE_BATCH_SIZE: int = 8
+    # Images held decoded at full resolution at a time, of at most TILE_MAX_PIXELS
+    TILE_MAX_IMAGES: int = 2
+    TILE_MAX_PIXELS: int = 64_000_000
+
+    ## Startup, warmup runs forward passes at served batch sizes
+    LOAD_MODEL_ON_STARTUP: bool = True
+    WARMUP_RUNS: int = 2
+    WARMUP_BATCH_SIZES: List[int] = [1, 8]
+
+    ## Per-request profiling, traces are not recorded without trace directory,
+    ## which keeps the latest PROFILE_MAX_TRACES of them
+    PROFILE_ENABLED: bool = True
+    PROFILE_TRACE_DIR: Optional[str] = None
+    PROFILE_MAX_TRACES: int = 20
+
+    ## Micro-batching of concurrent single image requests
+    MICRO_BATCH_MAX_SIZE: int = 8
+    MICRO_BATCH_MAX_WAIT_MS: float = 5.0
+    MICRO_BATCH_MAX_QUEUE_SIZE: int = 256
+
+    ## Streamed batches, images read and held in memory at a time
+    STREAM_MAX_CONCURRENCY: int = 16
+
+    ## WebSocket frame streams, frames detected at a time per stream and frames
+    ## waiting for them, older waiting frames are dropped
+    FRAME_MAX_IN_FLIGHT: int = 2
+    FRAME_MAX_PENDING: int = 1
+
+    ## Batch jobs, stored in SQLite database and run by background workers
+    JOBS_DB: str = "jobs.db"
+    JOB_WORKERS: int = 1
+    JOB_MAX_CONCURRENCY: int = 16
+    JOB_MAX_IMAGES: int = 100_000
+
+    ## Server worker processes, more than one are pre-forked by gunicorn and share model weights
+    WORKERS: int = 1
+
+    ## Executors, inference workers and torch threads default to all cores of the worker
+    IO_WORKERS: int = 16
+    INFERENCE_WORKERS: Optional[int] = None
+    TORCH_NUM_THREADS: Optional[int] = None
+
+    ## Image fetching
+    FETCH_TIMEOUT: float = 10.0
+    FETCH_MAX_BYTES: int = 20 * 1024 * 1024
+    FETCH_MAX_CONNECTIONS: int = 100
+    FETCH_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    FETCH_MAX_CONNECTIONS_PER_HOST: int = 8
+
+    ## Binary uploads
+    UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+
+    ## Result cache, set max entries to 0 to disable it
+    RESULT_CACHE_MAX_ENTRIES: int = 1024
+    RESULT_CACHE_TTL: float = 3600.0
+    RESULT_CACHE_DIR: Optional[str] = None
+    RESULT_CACHE_DISK_MAX_ENTRIES: int = 100_000
 
     # WandB
     WANDB_ENTITY: str = "aeki-engineering"
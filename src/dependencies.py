@@ -1,17 +1,220 @@
+import secrets
+import time
 from functools import cache
+from typing import List, Optional
+from fastapi import Header, HTTPException, Query
+from src.modules.batching import BatchScheduler
+from src.modules.cache import ResultCache
 from src.modules.detector import Detector
+from src.modules.executors import INFERENCE_WORKERS
+from src.modules.fetcher import ImageFetcher
+from src.modules.jobs import JobManager, JobStore
+from src.modules.pipeline import InferencePipeline
+from src.modules.profiling import RequestProfile
+from src.schemas import InferenceParamsModel
 from src.modules.model import Model
+from src.modules.registry import ModelManager
+from src.modules.serialization import (
+    MSGPACK_MEDIA_TYPE,
+    ResponseFormat,
+    ResultFormat,
+    msgpack,
+)
 from src.config import settings
+from src.logger import get_logger
 
+log = get_logger(__name__)
 
-@cache
-def get_detector():
-    return Detector(
+
+def create_pipeline(tag: str, backend: str) -> InferencePipeline:
+    start_time = time.perf_counter()
+    detector = Detector(
         model=Model(
             model_root=settings.MODEL_DIR,
-            tag=settings.WANDB_DEFAULT_TAG,
-            backend=settings.MODEL_DEFAULT_BACKEND,
+            tag=tag,
+            backend=backend,
+            precision=settings.MODEL_PRECISION,
         ),
         confidence_threshold=settings.DEFAULT_CONFIDENCE_THRESHOLD,
         iou_threshold=settings.DEFAULT_IOU_THRESHOLD,
+        max_detections=settings.MAX_DETECTIONS,
+        shape_buckets=settings.SHAPE_BUCKETS,
+        max_pixels=settings.MAX_IMAGE_PIXELS,
+    )
+    load_time = time.perf_counter()
+
+    # Models are warmed up before they serve any request
+    if settings.WARMUP_RUNS:
+        detector.warmup(settings.WARMUP_BATCH_SIZES, settings.WARMUP_RUNS)
+    warmup_time = time.perf_counter()
+    log.info(
+        f"Prepared model '{tag}', load: {round(load_time - start_time, 3)}s, warmup: {round(warmup_time - load_time, 3)}s."
+    )
+
+    scheduler = BatchScheduler(
+        detector=detector,
+        max_batch_size=settings.MICRO_BATCH_MAX_SIZE,
+        max_wait_ms=settings.MICRO_BATCH_MAX_WAIT_MS,
+        max_queue_size=settings.MICRO_BATCH_MAX_QUEUE_SIZE,
+        max_concurrent_batches=INFERENCE_WORKERS,
+    )
+    return InferencePipeline(
+        scheduler=scheduler,
+        result_cache=get_result_cache(),
+        max_batch_size=settings.MAX_BATCH_SIZE,
+        tile_overlap=settings.TILE_OVERLAP,
+        tile_batch_size=settings.TILE_BATCH_SIZE,
+        max_tiled_images=settings.TILE_MAX_IMAGES,
+        max_tiled_pixels=settings.TILE_MAX_PIXELS,
+    )
+
+
+@cache
+def get_model_manager():
+    return ModelManager(
+        factory=create_pipeline,
+        default_tag=settings.WANDB_DEFAULT_TAG,
+        backend=settings.MODEL_DEFAULT_BACKEND,
+        memory_budget_mb=settings.MODEL_MEMORY_BUDGET_MB,
+        canary_tag=settings.MODEL_CANARY_TAG,
+        canary_weight=settings.MODEL_CANARY_WEIGHT,
+        allowed_tags=None
+        if "*" in settings.MODEL_ALLOWED_TAGS
+        else settings.MODEL_ALLOWED_TAGS,
+        active_tag_file=settings.MODEL_ACTIVE_TAG_FILE,
+    )
+
+
+@cache
+def get_fetcher():
+    return ImageFetcher(
+        timeout=settings.FETCH_TIMEOUT,
+        max_bytes=settings.FETCH_MAX_BYTES,
+        max_connections=settings.FETCH_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.FETCH_MAX_KEEPALIVE_CONNECTIONS,
+        max_connections_per_host=settings.FETCH_MAX_CONNECTIONS_PER_HOST,
+    )
+
+
+@cache
+def get_result_cache():
+    return ResultCache(
+        max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+        ttl=settings.RESULT_CACHE_TTL,
+        disk_dir=settings.RESULT_CACHE_DIR,
+        disk_max_entries=settings.RESULT_CACHE_DISK_MAX_ENTRIES,
     )
+
+
+@cache
+def get_job_manager():
+    return JobManager(
+        store=JobStore(settings.JOBS_DB),
+        models=get_model_manager(),
+        fetcher=get_fetcher(),
+        workers=settings.JOB_WORKERS,
+        max_concurrency=settings.JOB_MAX_CONCURRENCY,
+    )
+
+
+def require_admin(
+    x_admin_token: Optional[str] = Header(
+        None, description="Token set in MODEL_ADMIN_TOKEN setting."
+    )
+) -> None:
+    if settings.MODEL_ADMIN_TOKEN is None:
+        raise HTTPException(
+            status_code=403,
+            detail="Model activation is disabled, set MODEL_ADMIN_TOKEN to enable it.",
+        )
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token, settings.MODEL_ADMIN_TOKEN
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+
+async def get_pipeline(
+    model: Optional[str] = Query(
+        None, description="Model tag to run, defaults to the active model."
+    )
+) -> InferencePipeline:
+    return await get_model_manager().get_pipeline(model)
+
+
+def get_profile(
+    profile: bool = Query(
+        False, description="Return time spent in each detection stage."
+    ),
+    trace: bool = Query(
+        False, description="Also record torch.profiler trace of the request."
+    ),
+    x_profile: Optional[str] = Header(
+        None, description="Profile request, 'true' or 'trace' as the query flags."
+    ),
+) -> RequestProfile:
+    if not settings.PROFILE_ENABLED:
+        return RequestProfile()
+
+    if x_profile:
+        profile = profile or x_profile.lower() in ("1", "true")
+        trace = trace or x_profile.lower() == "trace"
+    return RequestProfile(
+        enabled=profile,
+        trace=trace and settings.PROFILE_TRACE_DIR is not None,
+        trace_dir=settings.PROFILE_TRACE_DIR,
+        max_traces=settings.PROFILE_MAX_TRACES,
+    )
+
+
+def get_inference_params(
+    confidence: Optional[float] = Query(
+        None, ge=0, le=1, description="Minimum detection score."
+    ),
+    iou: Optional[float] = Query(
+        None, ge=0, le=1, description="IoU threshold of non-maximum suppression."
+    ),
+    classes: Optional[List[str]] = Query(
+        None, description="Class names or ids to detect, all classes if not set."
+    ),
+    max_detections: Optional[int] = Query(
+        None, alias="maxDetections", ge=1, le=settings.MAX_DETECTIONS
+    ),
+    img_size: Optional[int] = Query(
+        None,
+        alias="imgSize",
+        ge=settings.MIN_IMG_SIZE,
+        le=settings.MAX_IMG_SIZE,
+        description="Inference image size, multiple of the model stride.",
+    ),
+    tiled: Optional[bool] = Query(
+        None,
+        description="Detect in overlapping tiles of the full resolution image, for very large images.",
+    ),
+) -> InferenceParamsModel:
+    # Constructed without validation, query parameters are validated above
+    return InferenceParamsModel.construct(
+        confidence=confidence,
+        iou=iou,
+        classes=classes,
+        maxDetections=max_detections,
+        imgSize=img_size,
+        tiled=tiled,
+    )
+
+
+def get_response_format(
+    format: ResultFormat = Query(
+        ResultFormat.default,
+        description="Detections as objects with corner points, or compact [x0, y0, x1, y1, score, classId] arrays with class names listed once.",
+    ),
+    accept: Optional[str] = Header(
+        None, description="'application/msgpack' for MessagePack instead of JSON body."
+    ),
+) -> ResponseFormat:
+    use_msgpack = accept is not None and MSGPACK_MEDIA_TYPE in accept
+    if use_msgpack and msgpack is None:
+        raise HTTPException(
+            status_code=406,
+            detail="MessagePack responses require msgpack, install it with 'msgpack' extra.",
+        )
+    return ResponseFormat(format, use_msgpack)
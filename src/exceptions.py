@@ -1,2 +1,30 @@
 class ModelNotFound(Exception):
     pass
+
+
+class UnknownModelTag(Exception):
+    pass
+
+
+class SchedulerOverloaded(Exception):
+    pass
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+class InvalidInferenceParams(Exception):
+    pass
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class JobNotFound(Exception):
+    pass
@@ -1,12 +1,30 @@
+import time
+
+# Measured before other imports to log how long importing the app takes
+import_start_time = time.perf_counter()
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.docs import (
     get_swagger_ui_html,
     get_swagger_ui_oauth2_redirect_html,
 )
-from fastapi.responses import JSONResponse
-
-from src.exceptions import ModelNotFound
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from src.dependencies import get_fetcher, get_job_manager, get_model_manager
+from src.logger import get_logger
+from src.exceptions import (
+    ImageFetchError,
+    ImageTooLarge,
+    InvalidImage,
+    InvalidInferenceParams,
+    JobNotFound,
+    ModelNotFound,
+    SchedulerOverloaded,
+    UnknownModelTag,
+)
+from src.modules.metrics import ERRORS, IN_FLIGHT, registry
 from .routers import v1
 from .config import settings
 
@@ -45,6 +63,8 @@ app.include_router(v1.router, prefix=settings.API_V1_PREFIX, tags=["v1"])
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+log = get_logger(__name__)
+
 
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
@@ -62,11 +82,115 @@ async def swagger_ui_redirect():
     return get_swagger_ui_oauth2_redirect_html()
 
 
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    with IN_FLIGHT.track_inprogress():
+        try:
+            return await call_next(request)
+        except Exception as exc:
+            ERRORS.labels(type(exc).__name__).inc()
+            raise
+
+
 @app.exception_handler(ModelNotFound)
 async def weights_not_found_handler(request: Request, exc: ModelNotFound):
+    ERRORS.labels("ModelNotFound").inc()
+    return JSONResponse(status_code=503, content={"message": str(exc)})
+
+
+@app.exception_handler(UnknownModelTag)
+async def unknown_model_tag_handler(request: Request, exc: UnknownModelTag):
+    ERRORS.labels("UnknownModelTag").inc()
+    return JSONResponse(status_code=404, content={"message": str(exc)})
+
+
+@app.exception_handler(SchedulerOverloaded)
+async def scheduler_overloaded_handler(request: Request, exc: SchedulerOverloaded):
+    ERRORS.labels("SchedulerOverloaded").inc()
     return JSONResponse(status_code=503, content={"message": str(exc)})
 
 
+@app.exception_handler(ImageFetchError)
+async def image_fetch_error_handler(request: Request, exc: ImageFetchError):
+    ERRORS.labels("ImageFetchError").inc()
+    return JSONResponse(status_code=400, content={"message": str(exc)})
+
+
+@app.exception_handler(InvalidImage)
+async def invalid_image_handler(request: Request, exc: InvalidImage):
+    ERRORS.labels("InvalidImage").inc()
+    return JSONResponse(status_code=400, content={"message": str(exc)})
+
+
+@app.exception_handler(InvalidInferenceParams)
+async def invalid_inference_params_handler(
+    request: Request, exc: InvalidInferenceParams
+):
+    ERRORS.labels("InvalidInferenceParams").inc()
+    return JSONResponse(status_code=422, content={"message": str(exc)})
+
+
+@app.exception_handler(ImageTooLarge)
+async def image_too_large_handler(request: Request, exc: ImageTooLarge):
+    ERRORS.labels("ImageTooLarge").inc()
+    return JSONResponse(status_code=413, content={"message": str(exc)})
+
+
+@app.exception_handler(JobNotFound)
+async def job_not_found_handler(request: Request, exc: JobNotFound):
+    ERRORS.labels("JobNotFound").inc()
+    return JSONResponse(status_code=404, content={"message": str(exc)})
+
+
+@app.on_event("startup")
+async def startup():
+    start_time = time.perf_counter()
+    log.info(f"Imported app in {round(start_time - import_start_time, 3)}s.")
+    get_fetcher().start()
+    await get_job_manager().start()
+
+    if settings.LOAD_MODEL_ON_STARTUP:
+        # Loaded in background, so that the server binds its socket and
+        # answers health checks meanwhile
+        manager = get_model_manager()
+        manager.load_in_background(manager.default_tag)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    job_manager = get_job_manager()
+    await job_manager.stop()
+    job_manager.store.close()
+    await get_model_manager().close()
+    await get_fetcher().aclose()
+
+
 @app.get("/", name="Index", description="Returns name of the API.")
 async def root():
     return {"message": "AEKI ENGINEERING | EST. 2022, GDANSK UNIVERSITY OF TECHNOLOGY"}
+
+
+@app.get(
+    "/health/live",
+    name="Liveness",
+    description="Returns 200 while the service process is running.",
+)
+async def liveness():
+    return {"status": "alive"}
+
+
+@app.get(
+    "/health/ready",
+    name="Readiness",
+    description="Returns 200 once the default model is loaded and warmed up, 503 before.",
+)
+async def readiness():
+    # Without loading on startup the default model is loaded by the first request
+    if settings.LOAD_MODEL_ON_STARTUP and not get_model_manager().ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(registry()), media_type=CONTENT_TYPE_LATEST)
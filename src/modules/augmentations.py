@@ -49,3 +49,29 @@ def letterbox(
         im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color
     )  # add border
     return im, ratio, (dw, dh)
+
+
+def letterbox_into(im, out, color=114):
+    """Letterboxes image into preallocated HWC array `out`, as `letterbox` with auto=False.
+
+    The image is resized straight into its place in `out` and only the
+    borders are filled, without intermediate resized and padded copies.
+    """
+    shape = im.shape[:2]
+    new_shape = out.shape[:2]
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = (new_shape[1] - new_unpad[0]) / 2, (new_shape[0] - new_unpad[1]) / 2
+    top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+    bottom, right = top + new_unpad[1], left + new_unpad[0]
+
+    out[:top] = color
+    out[bottom:] = color
+    out[top:bottom, :left] = color
+    out[top:bottom, right:] = color
+    region = out[top:bottom, left:right]
+    if shape[::-1] != new_unpad:
+        cv2.resize(im, new_unpad, dst=region, interpolation=cv2.INTER_LINEAR)
+    else:
+        region[...] = im
+    return out
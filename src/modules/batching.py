@@ -0,0 +1,267 @@
+import asyncio
+from dataclasses import dataclass
+from itertools import count
+from threading import Lock
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.exceptions import SchedulerOverloaded
+from src.logger import get_logger
+from src.modules.detector import Detector, ImageDetections, InferenceParams
+from src.modules.executors import run_inference, run_io
+from src.modules.metrics import QUEUE_DEPTH, STAGE_TIMINGS
+from src.modules.profiling import ACTIVE_PROFILE, RequestProfile
+
+log = get_logger(__name__)
+
+
+@dataclass
+class _QueueItem:
+    img: np.ndarray
+    img0: np.ndarray
+    future: asyncio.Future
+    params: InferenceParams
+    queued_at: float
+    profile: Optional[RequestProfile] = None
+
+
+class BatchScheduler:
+    """Micro-batching queue in front of the detector.
+
+    Concurrent single-image requests are collected for up to `max_wait_ms`
+    or until `max_batch_size` images are queued, and then run through the
+    detector as one batched forward pass, one per distinct inference
+    parameters and input shape bucket. While all `max_concurrent_batches` slots are busy, requests
+    keep queueing up and form larger batches. Bulk images, e.g. of jobs, are
+    only taken once no interactive requests are waiting.
+    """
+
+    def __init__(
+        self,
+        detector: Detector,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 256,
+        max_concurrent_batches: int = 1,
+    ) -> None:
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self.batches = 0
+        self.images = 0
+        self._pending = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = count()
+        self._task: Optional[asyncio.Task] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queueDepth": self.queue_depth,
+            "maxQueueSize": self.max_queue_size,
+            "maxBatchSize": self.max_batch_size,
+            "maxWaitMs": self.max_wait_ms,
+            "batches": self.batches,
+            "images": self.images,
+            "averageBatchSize": round(self.images / self.batches, 2)
+            if self.batches
+            else 0.0,
+        }
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue(maxsize=self.max_queue_size)
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = self._loop.create_task(self._run())
+        # Set on every change rather than read on scrape, which does not
+        # work with metrics aggregated from several worker processes
+        self._queue_depth = QUEUE_DEPTH.labels(self.detector.tag, self.detector.backend)
+        log.info(
+            f"Started batch scheduler, max_batch_size={self.max_batch_size}, max_wait_ms={self.max_wait_ms}"
+        )
+
+    async def stop(self, drain: bool = False) -> None:
+        if self._task is None:
+            return
+
+        cancelled = False
+        if drain:
+            # Let queued and running batches finish first
+            try:
+                while self._pending:
+                    await asyncio.sleep(self.max_wait_ms / 1000)
+                await asyncio.gather(*self._batch_tasks)
+            except asyncio.CancelledError:
+                # E.g. on shutdown while draining, stop right away instead
+                cancelled = True
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        QUEUE_DEPTH.remove(self.detector.tag, self.detector.backend)
+
+        # Requests of cancelled batches fail as the queued ones below
+        for task in self._batch_tasks:
+            task.cancel()
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+
+        # Fail requests that are still waiting in the queue
+        while not self._queue.empty():
+            _, _, item = self._queue.get_nowait()
+            self._fail([item])
+
+        if cancelled:
+            raise asyncio.CancelledError()
+
+    async def submit(
+        self,
+        data: bytes,
+        params: Optional[InferenceParams] = None,
+        bulk: bool = False,
+    ) -> ImageDetections:
+        """Queues single image and waits for its detections."""
+        # Scheduler is bound to the event loop it was started on
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            self.start()
+
+        params = params or self.detector.default_params
+        img, img0 = await run_io(self.detector.preprocess, data, params.img_size)
+
+        future = self._loop.create_future()
+        item = _QueueItem(
+            img=img,
+            img0=img0,
+            future=future,
+            params=params,
+            queued_at=self._loop.time(),
+            profile=ACTIVE_PROFILE.get(),
+        )
+        try:
+            # Interactive images go first, in submission order within priority
+            self._queue.put_nowait((int(bulk), next(self._sequence), item))
+            self._queue_depth.set(self.queue_depth)
+        except asyncio.QueueFull:
+            raise SchedulerOverloaded(
+                f"Inference queue is full ({self.max_queue_size} images)."
+            )
+        self._pending += 1
+        future.add_done_callback(self._on_done)
+
+        return await future
+
+    def _on_done(self, future: asyncio.Future) -> None:
+        self._pending -= 1
+
+    async def _run(self) -> None:
+        # Task inherits context of the request starting it, batch timings are
+        # instead collected per batch and copied to profiled requests
+        STAGE_TIMINGS.set(None)
+        ACTIVE_PROFILE.set(None)
+        while True:
+            await self._slots.acquire()
+            batch = await self._collect()
+
+            # Images with different parameters or input shapes can not share
+            # forward pass or NMS
+            groups: Dict[Tuple[InferenceParams, Tuple[int, ...]], List[_QueueItem]] = {}
+            for item in batch:
+                groups.setdefault((item.params, item.img.shape), []).append(item)
+
+            for i, group in enumerate(groups.values()):
+                if i:
+                    await self._slots.acquire()
+                # Running batches are kept referenced, to be awaited on stop
+                task = self._loop.create_task(self._process(group))
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+
+    async def _collect(self) -> List[_QueueItem]:
+        batch = [(await self._queue.get())[2]]
+        deadline = self._loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append((await asyncio.wait_for(self._queue.get(), timeout))[2])
+            except asyncio.TimeoutError:
+                break
+
+        self._queue_depth.set(self.queue_depth)
+        return batch
+
+    async def _process(self, batch: List[_QueueItem]) -> None:
+        try:
+            await self._process_batch(batch)
+        except asyncio.CancelledError:
+            self._fail(batch)
+            raise
+        finally:
+            self._slots.release()
+
+    def _fail(self, batch: List[_QueueItem]) -> None:
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(
+                    SchedulerOverloaded("Batch scheduler was stopped.")
+                )
+
+    async def _process_batch(self, batch: List[_QueueItem]) -> None:
+        # Skip requests which were cancelled while waiting, e.g. on client disconnect
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+
+        # Forward pass is traced once for the whole batch
+        traced = next(
+            (item.profile for item in batch if item.profile and item.profile.trace),
+            None,
+        )
+
+        started_at = self._loop.time()
+        timings = {}
+        tokens = STAGE_TIMINGS.set((timings, Lock())), ACTIVE_PROFILE.set(traced)
+        try:
+            results = await run_inference(
+                self.detector.infer,
+                [item.img for item in batch],
+                [item.img0 for item in batch],
+                batch[0].params,
+            )
+        except Exception as exc:
+            log.error(f"Batched inference failed: {exc}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(exc)
+            return
+        finally:
+            STAGE_TIMINGS.reset(tokens[0])
+            ACTIVE_PROFILE.reset(tokens[1])
+
+        self.batches += 1
+        self.images += len(batch)
+
+        for item in batch:
+            if item.profile:
+                with item.profile.timings_lock:
+                    item.profile.timings["queue_wait"] = started_at - item.queued_at
+                    item.profile.timings.update(timings)
+
+        for item, detections in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(detections)
@@ -0,0 +1,57 @@
+"""Reused input tensors of batched forward passes.
+
+Letterboxed HWC images are written straight into a preallocated
+`[B, 3, H, W]` float tensor, transposing, casting and normalizing in one
+pass, instead of stacking, transposing and normalizing into new arrays for
+every batch. On CUDA buffers are pinned, so that copies to the device are
+asynchronous. Buffers are taken from a pool for the duration of a batch, as
+concurrent batches can not share them.
+"""
+from contextlib import contextmanager
+from threading import Lock
+from typing import Iterator, List, Sequence
+
+import numpy as np
+import torch
+
+
+class InputBuffers:
+    def __init__(self, device: torch.device, max_buffers: int = 4) -> None:
+        self.pin_memory = device.type == "cuda"
+        self.max_buffers = max_buffers
+
+        self._free: List[torch.Tensor] = []
+        self._lock = Lock()
+
+    @contextmanager
+    def batch(self, imgs: Sequence[np.ndarray]) -> Iterator[torch.Tensor]:
+        """Yields images of equal shape as normalized batch tensor, valid until exit."""
+        height, width = imgs[0].shape[:2]
+        buffer = self._acquire(len(imgs), height, width)
+        try:
+            batch = buffer[: len(imgs)]
+            # Copy casts while transposing, unlike out= arithmetic which
+            # allocates a temporary of the promoted type
+            for img, out in zip(imgs, batch):
+                out.copy_(torch.from_numpy(img).permute(2, 0, 1))
+            yield batch.div_(255.0)
+        finally:
+            self._release(buffer)
+
+    def _acquire(self, batch_size: int, height: int, width: int) -> torch.Tensor:
+        with self._lock:
+            for i, buffer in enumerate(self._free):
+                if buffer.shape[2:] == (height, width) and len(buffer) >= batch_size:
+                    return self._free.pop(i)
+        return torch.empty(
+            (batch_size, 3, height, width),
+            dtype=torch.float32,
+            pin_memory=self.pin_memory,
+        )
+
+    def _release(self, buffer: torch.Tensor) -> None:
+        with self._lock:
+            self._free.append(buffer)
+            # Least recently used buffers go first, e.g. of image sizes no longer requested
+            if len(self._free) > self.max_buffers:
+                self._free.pop(0)
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock, get_ident
+from typing import Any, Dict, Optional, Tuple
+
+from src.logger import get_logger
+from src.modules.detector import Detector, ImageDetections, InferenceParams
+from src.modules.metrics import CACHE_HITS, CACHE_MISSES
+
+log = get_logger(__name__)
+
+# Part of the keys, bumped when format of detections changes, so that stale
+# entries in the disk cache are not served
+FORMAT_VERSION = 2
+
+
+class ResultCache:
+    """LRU cache of detections keyed by image content and inference settings.
+
+    Entries expire after `ttl` seconds. When `disk_dir` is set, results are
+    also stored as JSON files there, so they survive restarts and can be
+    shared between workers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 100_000,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_entries = disk_max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, Tuple[float, ImageDetections]]" = OrderedDict()
+        self._lock = Lock()
+        self._disk_lock = Lock()
+        self._disk_entries = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_entries = sum(1 for _ in self.disk_dir.glob("*/*.json"))
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(data: bytes, detector: Detector, params: InferenceParams) -> str:
+        digest = hashlib.sha256(data)
+        digest.update(
+            f"{FORMAT_VERSION}|{detector.tag}|{detector.backend}|{detector.precision}|{tuple(params)}".encode()
+        )
+        return digest.hexdigest()
+
+    def lookup(
+        self, data: bytes, detector: Detector, params: InferenceParams
+    ) -> Tuple[str, Optional[ImageDetections]]:
+        """Returns cache key of the image and its cached detections, if any."""
+        if not self.enabled:
+            return "", None
+
+        key = self.key(data, detector, params)
+        detections = self.get(key)
+        return key, detections
+
+    def get(self, key: str) -> Optional[ImageDetections]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_HITS.inc()
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        detections = self._read_disk(key)
+        with self._lock:
+            if detections is None:
+                self.misses += 1
+                CACHE_MISSES.inc()
+                return None
+            self.hits += 1
+            CACHE_HITS.inc()
+            self._store(key, detections, now)
+        return detections
+
+    def put(self, key: str, detections: ImageDetections) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._store(key, detections, time.monotonic())
+        self._write_disk(key, detections)
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / requests, 4) if requests else 0.0,
+        }
+
+    def _store(self, key: str, detections: ImageDetections, now: float) -> None:
+        self._entries[key] = (now + self.ttl, detections)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[ImageDetections]:
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return ImageDetections(**json.loads(path.read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _write_disk(self, key: str, detections: ImageDetections) -> None:
+        if not self.disk_dir:
+            return
+
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # Write to temporary file first, so readers never see partial entries
+            tmp_path = path.with_suffix(f".{os.getpid()}.{get_ident()}.tmp")
+            tmp_path.write_text(json.dumps(detections._asdict()))
+            tmp_path.replace(path)
+        except OSError as exc:
+            log.warning(f"Failed to write result cache entry: {exc}")
+            return
+
+        with self._disk_lock:
+            self._disk_entries += 1
+            if self._disk_entries > self.disk_max_entries:
+                self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        # Remove oldest tenth of the entries to not prune on every write
+        keep = int(self.disk_max_entries * 0.9)
+        entries = []
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except OSError:
+                pass
+        entries.sort()
+        for _, path in entries[: len(entries) - keep]:
+            path.unlink(missing_ok=True)
+        self._disk_entries = min(len(entries), keep)
@@ -1,19 +1,54 @@
 import json
-from typing import List, Tuple, Union
+import math
+from contextlib import ExitStack
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterator
 import numpy as np
 import torch
 from src.config import settings
-from src.exceptions import ModelNotFound
-from src.modules.loaders import ImagesLoader
+from src.exceptions import InvalidInferenceParams, ModelNotFound
+from src.modules.augmentations import letterbox_into
+from src.modules.buffers import InputBuffers
+from src.modules.loaders import decode_image
+from src.modules.metrics import observe_stage
+from src.modules.profiling import record_trace
+from src.modules.tiling import merge_tile_detections
 from src.modules.model import Model
 from src.modules.utils import non_max_suppression, scale_coords
 from src.logger import get_logger
 
 log = get_logger(__name__)
 
-from src.schemas import BaseImageModel
+
+class InferenceParams(NamedTuple):
+    """Per-request inference parameters, requests sharing them are batched together."""
+
+    confidence: float
+    iou: float
+    classes: Optional[Tuple[int, ...]]
+    max_detections: int
+    img_size: int
+    tiled: bool = False
+
+
+class ImageDetections(NamedTuple):
+    # Detections as [x0, y0, x1, y1, score, classId] arrays, box normalized by image size
+    detections: List[List[Any]]
+    # Whether detections were limited to the maximum number of detections
+    truncated: bool = False
+
+
+def batches_by_shape(
+    imgs: Sequence[np.ndarray], batch_size: int
+) -> Iterator[List[int]]:
+    """Yields indices of up to `batch_size` images of equal shape, which can share forward pass."""
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for i, img in enumerate(imgs):
+        groups.setdefault(img.shape, []).append(i)
+    for indices in groups.values():
+        for start in range(0, len(indices), batch_size):
+            yield indices[start : start + batch_size]
 
 
 class Detector:
@@ -24,112 +59,285 @@ class Detector:
         img_size: int = 640,
         confidence_threshold: float = 0.1,
         iou_threshold: float = 0.25,
+        max_detections: int = 300,
+        shape_buckets: Sequence[float] = (1.0,),
+        max_pixels: Optional[int] = 40_000_000,
     ) -> None:
         self.img_size = img_size
+        self.max_pixels = max_pixels
         self.confidence_threshold = confidence_threshold
         self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
 
         self.model = model()
 
         if not self.model:
             raise ModelNotFound(f"Model could not be loaded.")
 
+        self.tag = model.tag
         self.stride = model.stride
         self.names = model.names
+        # Class names indexed by class id, names may be stored as list or dict
+        self.class_names = (
+            [self.names[i] for i in range(len(self.names))] if self.names else None
+        )
         self.backend = model.backend
+        self.precision = model.precision
+        self.size_bytes = model.size_bytes
+
+        # Aspect ratios of input shapes, models exported with static shape
+        # accept only square inputs
+        self.shape_buckets = sorted({*shape_buckets, 1.0})
+        if getattr(self.model, "img_size", None):
+            self.shape_buckets = [1.0]
 
         self.device = torch.device(settings.MODEL_DEVICE)
+        # Buffers of both orientations of each bucket
+        self.input_buffers = InputBuffers(
+            self.device, max_buffers=2 * len(self.shape_buckets)
+        )
+        self.default_params = InferenceParams(
+            confidence=confidence_threshold,
+            iou=iou_threshold,
+            classes=None,
+            max_detections=max_detections,
+            img_size=img_size,
+        )
 
         log.info(
             f"Initializing detector class, backend='{self.backend}', device='{settings.MODEL_DEVICE}'"
         )
 
-    @torch.no_grad()
-    def predict(
-        self, x: Union[List[BaseImageModel], BaseImageModel]
-    ) -> List[Dict[str, Any]]:
-        # Load Images
-        dataset = ImagesLoader(
-            files=x,
-            img_size=self.img_size,
-            stride=self.stride,
-            auto=False if self.backend == "torchscript" else True,
+    def resolve_params(
+        self,
+        confidence: Optional[float] = None,
+        iou: Optional[float] = None,
+        classes: Optional[Iterable[Union[int, str]]] = None,
+        max_detections: Optional[int] = None,
+        img_size: Optional[int] = None,
+        tiled: Optional[bool] = None,
+    ) -> InferenceParams:
+        """Fills parameters missing in request with detector defaults."""
+        if img_size is not None:
+            if img_size % self.stride:
+                raise InvalidInferenceParams(
+                    f"Image size {img_size} is not a multiple of model stride {self.stride}."
+                )
+            # Models exported with static shape accept only the exported size
+            exported_size = getattr(self.model, "img_size", None)
+            if exported_size and img_size != exported_size:
+                raise InvalidInferenceParams(
+                    f"Model '{self.tag}' accepts only image size {exported_size}."
+                )
+        # Empty list of classes selects all of them, the same as not set
+        if classes:
+            classes = tuple(sorted({self._class_id(name) for name in classes}))
+        else:
+            classes = None
+
+        overrides = dict(
+            confidence=confidence,
+            iou=iou,
+            classes=classes,
+            max_detections=max_detections,
+            img_size=img_size,
+            tiled=tiled,
+        )
+        return self.default_params._replace(
+            **{name: value for name, value in overrides.items() if value is not None}
         )
 
-        results = []
-        for _, img, img0s, _ in dataset:
-            # Convert image to tensor
-            img_tensor = self._image_to_tensor(img)
+    def preprocess(
+        self, data: bytes, img_size: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Decodes and letterboxes image to the HWC input shape of its aspect ratio bucket."""
+        img_size = img_size or self.img_size
+        with observe_stage("image_decode"):
+            img0 = decode_image(data, img_size, self.max_pixels)
+
+        with observe_stage("letterbox"):
+            height, width = self.input_shape(img0.shape[:2], img_size)
+            img = letterbox_into(img0, np.empty((height, width, 3), np.uint8))
+        return img, img0
+
+    def input_shape(self, shape: Tuple[int, int], img_size: int) -> Tuple[int, int]:
+        """Returns height and width of the smallest bucket the image fits into.
+
+        Longer side is `img_size`, shorter side is rounded up to model stride.
+        """
+        height, width = shape
+        aspect = min(height, width) / max(height, width)
+        ratio = next(ratio for ratio in self.shape_buckets if ratio >= aspect)
+        short = self._short_side(ratio, img_size)
+        return (short, img_size) if width >= height else (img_size, short)
+
+    @torch.no_grad()
+    def infer(
+        self,
+        imgs: Sequence[np.ndarray],
+        img0s: Sequence[np.ndarray],
+        params: Optional[InferenceParams] = None,
+    ) -> List[ImageDetections]:
+        """Runs single forward pass on preprocessed images, returning detections per image.
+
+        Images have to be preprocessed to the same shape of `params.img_size`,
+        the default one if not set.
+        """
+        with record_trace(), ExitStack() as stack:
+            # Write images into reused batch tensor, held until detections are processed
+            with observe_stage("tensor_conversion"):
+                batch = stack.enter_context(self.input_buffers.batch(imgs))
+                img_tensor = self._to_device(batch)
 
             # Detect
-            all_detections = self._detect_image(img_tensor)
+            all_detections, truncated = self._detect_image(
+                img_tensor, params or self.default_params
+            )
 
-            # Process detections
-            for detection in all_detections:
-                results += self._process_detection(detection, img0s.copy(), img_tensor)
+            # Process detections, NMS returns one tensor per image
+            with observe_stage("postprocess"):
+                return [
+                    ImageDetections(
+                        self._process_detection(detection, img0.shape, img_tensor),
+                        image_truncated,
+                    )
+                    for detection, image_truncated, img0 in zip(
+                        all_detections, truncated, img0s
+                    )
+                ]
 
-        return results
+    @torch.no_grad()
+    def detect_tiles(
+        self,
+        img0: np.ndarray,
+        windows: Sequence[Tuple[int, int, int, int]],
+        params: InferenceParams,
+    ) -> List[torch.Tensor]:
+        """Runs single forward pass on (x0, y0, x1, y1) windows of equal size of
+        the image, returning (n,6) detections per tile in image coordinates."""
+        with observe_stage("letterbox"):
+            tiles = [img0[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+            height, width = self.input_shape(tiles[0].shape[:2], params.img_size)
+            imgs = [
+                letterbox_into(tile, np.empty((height, width, 3), np.uint8))
+                for tile in tiles
+            ]
 
-    def _image_to_tensor(self, img: np.ndarray) -> torch.Tensor:
-        img = torch.from_numpy(img).to(self.device)
-        img = img / 255.0
-        if len(img.shape) == 3:
-            img = img[None]
-        return img
+        with record_trace(), self.input_buffers.batch(imgs) as batch:
+            img_tensor = self._to_device(batch)
+            all_detections, _ = self._detect_image(img_tensor, params)
 
-    def _detect_image(self, img_tensor: torch.Tensor) -> Any:
-        detections = self.model(img_tensor)[0]
-        return non_max_suppression(
-            detections,
-            conf_thres=self.confidence_threshold,
-            iou_thres=self.iou_threshold,
-        )
+        with observe_stage("postprocess"):
+            for detection, tile, (x0, y0, _, _) in zip(all_detections, tiles, windows):
+                scale_coords(img_tensor.shape[2:], detection[:, :4], tile.shape)
+                detection[:, :4] += torch.tensor(
+                    [x0, y0, x0, y0], dtype=detection.dtype, device=detection.device
+                )
+        return all_detections
 
-    def _process_detection(
-        self, detection: torch.Tensor, image: np.ndarray, img_tensor: torch.Tensor
-    ) -> List[Any]:
-        all_detections = []
-        gain = torch.tensor(image.shape)[[1, 0, 1, 0]]
-
-        if len(detection):
-            detection[:, :4] = scale_coords(
-                img_tensor.shape[2:], detection[:, :4], image.shape
-            ).round()
-            for (
-                *xyxy,
-                confidence_score,
-                detected_class,
-            ) in reversed(detection):
-                result = self._prepare_results(
-                    xyxy,
-                    confidence_score,
-                    detected_class,
-                    gain,
+    def merge_tiles(
+        self,
+        detections: Sequence[torch.Tensor],
+        windows: Sequence[Tuple[int, int, int, int]],
+        image_shape: Tuple[int, ...],
+        params: InferenceParams,
+    ) -> ImageDetections:
+        """Merges detections of all tiles of the image, see `detect_tiles`."""
+        with observe_stage("nms"):
+            detection, truncated = merge_tile_detections(
+                detections,
+                windows,
+                image_shape[:2],
+                iou_thres=params.iou,
+                max_det=params.max_detections,
+            )
+        with observe_stage("postprocess"):
+            detection = detection.flip(0)
+            return ImageDetections(
+                self._format_detections(detection, image_shape), truncated
+            )
+
+    @torch.no_grad()
+    def warmup(self, batch_sizes: Sequence[int] = (1,), runs: int = 2) -> None:
+        """Runs forward passes on blank images of each shape bucket, so that the
+        first requests do not pay for lazy initialization and JIT profiling of
+        the model. Buckets of shapes the model fails on are disabled."""
+        for ratio in list(self.shape_buckets):
+            short = self._short_side(ratio, self.img_size)
+            shapes = {(short, self.img_size), (self.img_size, short)}
+            try:
+                for height, width in shapes:
+                    img = np.full((height, width, 3), 114, dtype=np.uint8)
+                    for batch_size in batch_sizes:
+                        for _ in range(runs):
+                            self.infer([img] * batch_size, [img] * batch_size)
+            except Exception as exc:
+                # E.g. traced models with input shape fixed on export
+                if ratio == 1.0:
+                    raise
+                log.warning(
+                    f"Disabled input shape bucket {ratio} of model '{self.tag}': {exc}"
                 )
-                all_detections.append(result)
+                self.shape_buckets.remove(ratio)
 
-        return all_detections
+    def _short_side(self, ratio: float, img_size: int) -> int:
+        return min(math.ceil(img_size * ratio / self.stride) * self.stride, img_size)
+
+    def _to_device(self, batch: torch.Tensor) -> torch.Tensor:
+        img = batch.to(self.device, non_blocking=True)
+        if self.precision == "fp16":
+            img = img.half()
+        return img
+
+    def _detect_image(
+        self, img_tensor: torch.Tensor, params: InferenceParams
+    ) -> Tuple[List[torch.Tensor], List[bool]]:
+        with observe_stage("forward"):
+            detections = self.model(img_tensor)[0]
+        with observe_stage("nms"):
+            return non_max_suppression(
+                detections,
+                conf_thres=params.confidence,
+                iou_thres=params.iou,
+                classes=params.classes,
+                max_det=params.max_detections,
+            )
 
-    def _prepare_results(
+    def _class_id(self, name: Union[int, str]) -> int:
+        num_classes = len(self.class_names) if self.class_names else None
+        if isinstance(name, int) or name.isdigit():
+            class_id = int(name)
+            if num_classes is None or class_id < num_classes:
+                return class_id
+        elif self.class_names and name in self.class_names:
+            return self.class_names.index(name)
+        raise InvalidInferenceParams(f"Unknown class '{name}' for model '{self.tag}'.")
+
+    def _process_detection(
         self,
-        xyxy: Tuple[torch.Tensor],
-        confidence_score: torch.Tensor,
-        detected_class: torch.Tensor,
-        gain: torch.Tensor,
-    ) -> Dict[str, Any]:
-        normalized_xyxy = (torch.tensor(xyxy).view(1, 4) / gain).view(-1).tolist()
-
-        x0, y0, x1, y1 = normalized_xyxy[:4]
-
-        return {
-            "name": self.names[int(detected_class.item())]
-            if self.names
-            else int(detected_class.item()),
-            "score": round(confidence_score.item(), 2),
-            "boundingBox": [
-                {"x": x0, "y": y0},
-                {"x": x1, "y": y0},
-                {"x": x1, "y": y1},
-                {"x": x0, "y": y1},
-            ],
-        }
+        detection: torch.Tensor,
+        image_shape: Tuple[int, ...],
+        img_tensor: torch.Tensor,
+    ) -> List[List[Any]]:
+        if not len(detection):
+            return []
+
+        # Keep the order of detections in the response, last detection first
+        detection = detection.flip(0)
+
+        # Scale boxes to the original image
+        scale_coords(img_tensor.shape[2:], detection[:, :4], image_shape)
+        return self._format_detections(detection, image_shape)
+
+    def _format_detections(
+        self, detection: torch.Tensor, image_shape: Tuple[int, ...]
+    ) -> List[List[Any]]:
+        # Boxes in image coordinates, normalized by its size
+        gain = torch.tensor(image_shape, dtype=torch.float32)[[1, 0, 1, 0]]
+        boxes = (detection[:, :4].round() / gain).tolist()
+        scores = detection[:, 4].double().mul(100).round().div(100).tolist()
+        classes = detection[:, 5].long().tolist()
+        return [
+            [*box, score, class_id]
+            for box, score, class_id in zip(boxes, scores, classes)
+        ]
@@ -0,0 +1,76 @@
+"""Executors keeping blocking work off the event loop.
+
+I/O and image decoding run in a wide thread pool, while forward passes run
+in a bounded inference pool, so that concurrent forward passes times torch
+intra-op threads do not oversubscribe the available cores, which are split
+evenly between server worker processes. Functions run
+in a copy of the caller's context, keeping request scoped context variables.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+import torch
+
+from src.config import settings
+from src.logger import get_logger
+
+log = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+def _worker_cores() -> int:
+    return max(1, (os.cpu_count() or 1) // settings.WORKERS)
+
+
+def _inference_workers() -> int:
+    cores = _worker_cores()
+    if settings.INFERENCE_WORKERS:
+        return settings.INFERENCE_WORKERS
+    if settings.TORCH_NUM_THREADS:
+        return max(1, cores // settings.TORCH_NUM_THREADS)
+    return max(1, cores // 4)
+
+
+def _torch_threads(inference_workers: int) -> int:
+    if settings.TORCH_NUM_THREADS:
+        return settings.TORCH_NUM_THREADS
+    return max(1, _worker_cores() // inference_workers)
+
+
+INFERENCE_WORKERS = _inference_workers()
+TORCH_NUM_THREADS = _torch_threads(INFERENCE_WORKERS)
+
+io_executor = ThreadPoolExecutor(
+    max_workers=settings.IO_WORKERS, thread_name_prefix="io"
+)
+inference_executor = ThreadPoolExecutor(
+    max_workers=INFERENCE_WORKERS, thread_name_prefix="inference"
+)
+
+torch.set_num_threads(TORCH_NUM_THREADS)
+log.info(
+    f"Configured executors, io_workers={settings.IO_WORKERS}, inference_workers={INFERENCE_WORKERS}, torch_threads={TORCH_NUM_THREADS}"
+)
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs blocking I/O or decoding function in the I/O thread pool."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        io_executor, partial(context.run, func, *args, **kwargs)
+    )
+
+
+async def run_inference(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs forward pass in the bounded inference thread pool."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        inference_executor, partial(context.run, func, *args, **kwargs)
+    )
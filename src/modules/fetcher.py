@@ -0,0 +1,105 @@
+import asyncio
+from collections import defaultdict
+from typing import Dict, Optional
+
+import httpx
+
+from src.exceptions import ImageFetchError
+from src.modules.metrics import observe_stage
+
+
+class ImageFetcher:
+    """Asynchronous image downloader sharing one keep-alive connection pool.
+
+    Downloads are streamed and cut off once they exceed `max_bytes` or take
+    longer than `timeout` seconds in total, and at most
+    `max_connections_per_host` downloads run concurrently against one host.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        max_connections_per_host: int = 8,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.transport = transport
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def start(self) -> None:
+        """Opens connection pool, which is bound to the running event loop until
+        `aclose`, so the app opens it on startup and closes it on shutdown."""
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+            ),
+            follow_redirects=True,
+            transport=self.transport,
+        )
+        self._host_slots = defaultdict(
+            lambda: asyncio.Semaphore(self.max_connections_per_host)
+        )
+
+    async def fetch(self, url: str) -> bytes:
+        """Downloads image body, raising `ImageFetchError` on any failure."""
+        # Opened on first use outside of the app, e.g. in scripts
+        if self._client is None:
+            self.start()
+        client = self._client
+
+        try:
+            async with self._host_slots[httpx.URL(url).host]:
+                with observe_stage("fetch"):
+                    return await asyncio.wait_for(
+                        self._download(client, url), timeout=self.timeout
+                    )
+        except asyncio.TimeoutError:
+            raise ImageFetchError(
+                f"Timed out fetching image from '{url}' after {self.timeout} seconds."
+            )
+        except httpx.HTTPStatusError as exc:
+            raise ImageFetchError(
+                f"Fetching image from '{url}' failed with status {exc.response.status_code}."
+            )
+        except httpx.InvalidURL:
+            raise ImageFetchError(f"Invalid image URL '{url}'.")
+        except httpx.HTTPError as exc:
+            raise ImageFetchError(
+                f"Fetching image from '{url}' failed: {type(exc).__name__}."
+            )
+
+    async def _download(self, client: httpx.AsyncClient, url: str) -> bytes:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+
+            content_length = response.headers.get("content-length")
+            if content_length and int(content_length) > self.max_bytes:
+                raise ImageFetchError(
+                    f"Image at '{url}' exceeds the size limit of {self.max_bytes} bytes."
+                )
+
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise ImageFetchError(
+                        f"Image at '{url}' exceeds the size limit of {self.max_bytes} bytes."
+                    )
+
+        return bytes(body)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,43 @@
+"""Frames of continuous detection streams, e.g. camera or video feeds.
+
+Frames are received as fast as the client sends them, but only the latest
+`max_pending` wait for detection. Older frames are dropped as newer ones
+arrive, so that detections keep up with the feed instead of lagging behind
+it when inference is slower than the frame rate.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Deque, NamedTuple
+
+
+class Frame(NamedTuple):
+    index: int
+    data: bytes
+    received_at: float
+
+
+class FrameQueue:
+    def __init__(self, max_pending: int = 1) -> None:
+        self.received = 0
+        self.dropped = 0
+
+        self._frames: Deque[Frame] = deque(maxlen=max_pending)
+        self._ready = asyncio.Event()
+
+    def put(self, data: bytes) -> bool:
+        """Queues frame, returns whether the oldest pending frame was dropped for it."""
+        dropped = len(self._frames) == self._frames.maxlen
+        self.dropped += dropped
+        # Full deque discards its oldest frame
+        self._frames.append(Frame(self.received, data, time.perf_counter()))
+        self.received += 1
+        self._ready.set()
+        return dropped
+
+    async def get(self) -> Frame:
+        """Waits for the oldest pending frame."""
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()
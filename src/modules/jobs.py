@@ -0,0 +1,398 @@
+"""Asynchronous detection jobs for batches too large for a single request.
+
+Jobs and their images are stored in a SQLite database, so that results can
+be paged through once ready and unfinished jobs resume after a restart.
+Workers process queued jobs page by page, with at most `max_concurrency`
+images in flight per job, submitted to the scheduler as bulk images which
+yield to interactive requests. With several server processes, jobs are run
+by the one holding the lock file next to the database, while any of them
+accepts submissions.
+"""
+import asyncio
+import fcntl
+import json
+import sqlite3
+import time
+import uuid
+from functools import partial
+from threading import Lock
+from typing import IO, Any, Dict, List, Optional, Tuple, Union
+
+import orjson
+
+from src.exceptions import JobNotFound
+from src.logger import get_logger
+from src.modules.detector import ImageDetections
+from src.modules.executors import run_io
+from src.modules.fetcher import ImageFetcher
+from src.modules.registry import ModelManager
+from src.modules.serialization import default_detections
+from src.schemas import BaseImageModel, ImageBytes, ImageURL
+
+log = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS images (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    url TEXT,
+    data TEXT,
+    done INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class JobStore:
+    """SQLite storage of jobs, their images and per-image results."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+
+    def create(
+        self,
+        job_id: str,
+        model: str,
+        params: Dict[str, Any],
+        images: List[BaseImageModel],
+    ) -> None:
+        rows = ((job_id, i, *_image_columns(image)) for i, image in enumerate(images))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (id, status, model, params, total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, model, json.dumps(params), len(images), time.time()),
+            )
+            self._connection.executemany(
+                "INSERT INTO images (job_id, idx, url, data) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {**dict(row), "params": json.loads(row["params"])}
+
+    def claim_next(self) -> Optional[str]:
+        """Marks the oldest queued job as running and returns its id."""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (RUNNING, time.time(), row["id"]),
+            )
+        return row["id"]
+
+    def requeue_running(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING)
+            )
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        """Sets final status, unless the job was already finished, e.g. cancelled."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+                (status, error, time.time(), job_id, QUEUED, RUNNING),
+            )
+
+    def pending(
+        self, job_id: str, after: int = -1, limit: int = 256
+    ) -> List[Tuple[int, BaseImageModel]]:
+        """Returns page of images which were not processed yet, in order."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT idx, url, data FROM images WHERE job_id = ? AND idx > ? AND done = 0 ORDER BY idx LIMIT ?",
+                (job_id, after, limit),
+            ).fetchall()
+        return [
+            (
+                row["idx"],
+                ImageURL(__root__=row["url"])
+                if row["url"]
+                else ImageBytes(__root__=row["data"]),
+            )
+            for row in rows
+        ]
+
+    def save_result(
+        self, job_id: str, idx: int, result: Union[ImageDetections, Exception]
+    ) -> str:
+        """Stores result of an image, returning job status to tell whether to go on."""
+        failed = isinstance(result, Exception)
+        with self._lock, self._connection:
+            # Image data is not needed anymore once processed
+            self._connection.execute(
+                "UPDATE images SET done = 1, data = NULL, result = ?, error = ? WHERE job_id = ? AND idx = ?",
+                (
+                    None if failed else orjson.dumps(result._asdict()),
+                    str(result) if failed else None,
+                    job_id,
+                    idx,
+                ),
+            )
+            self._connection.execute(
+                "UPDATE jobs SET processed = processed + 1, failed = failed + ? WHERE id = ?",
+                (int(failed), job_id),
+            )
+            return self._connection.execute(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()["status"]
+
+    def results(
+        self, job_id: str, offset: int = 0, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Returns page of processed images with their detections, in order."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT idx, url, result, error FROM images WHERE job_id = ? AND done = 1 ORDER BY idx LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            ).fetchall()
+
+        results = []
+        for row in rows:
+            result = ImageDetections(
+                **orjson.loads(row["result"] or '{"detections": []}')
+            )
+            results.append(
+                {
+                    "index": row["idx"],
+                    "source": row["url"] or f"images[{row['idx']}]",
+                    "detections": result.detections,
+                    "truncated": result.truncated,
+                    "error": row["error"],
+                }
+            )
+        return results
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class JobManager:
+    """Queues jobs and processes them in a pool of background workers."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        models: ModelManager,
+        fetcher: ImageFetcher,
+        workers: int = 1,
+        max_concurrency: int = 16,
+        page_size: int = 256,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self.store = store
+        self.models = models
+        self.fetcher = fetcher
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.page_size = page_size
+        self.poll_interval = poll_interval
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._lock_task: Optional[asyncio.Task] = None
+        self._lock_file: Optional[IO] = None
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        if self._acquire_lock():
+            await self._start_workers()
+            return
+
+        # Takes over once the server worker running jobs exits
+        log.info("Jobs are run by another server worker.")
+        self._lock_task = asyncio.get_running_loop().create_task(self._wait_for_lock())
+
+    async def stop(self) -> None:
+        tasks = [*self._tasks, self._lock_task] if self._lock_task else self._tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._lock_task = None
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def submit(
+        self, images: List[BaseImageModel], model: str, params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        await run_io(self.store.create, job_id, model, params, images)
+        self._wakeup.set()
+        log.info(f"Queued job '{job_id}' with {len(images)} images.")
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Dict[str, Any]:
+        return _describe(await self._get(job_id))
+
+    async def results(
+        self, job_id: str, offset: int = 0, limit: int = 100
+    ) -> Dict[str, Any]:
+        """Returns page of processed images, with job status to tell if more follow."""
+        job = await self._get(job_id)
+        results = await run_io(self.store.results, job_id, offset, limit)
+        return {
+            "id": job_id,
+            "status": job["status"],
+            "offset": offset,
+            "limit": limit,
+            "processed": job["processed"],
+            "results": results,
+        }
+
+    async def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Cancels queued or running job, images in flight are still stored."""
+        job = await self._get(job_id)
+        if job["status"] in (QUEUED, RUNNING):
+            await run_io(self.store.finish, job_id, CANCELLED)
+            log.info(f"Cancelled job '{job_id}'.")
+        return await self.get(job_id)
+
+    async def _get(self, job_id: str) -> Dict[str, Any]:
+        job = await run_io(self.store.get, job_id)
+        if job is None:
+            raise JobNotFound(f"Job '{job_id}' not found.")
+        return job
+
+    def _acquire_lock(self) -> bool:
+        self._lock_file = open(f"{self.store.path}.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+        return True
+
+    async def _wait_for_lock(self) -> None:
+        while not self._acquire_lock():
+            await asyncio.sleep(self.poll_interval)
+        log.info("Taking over jobs from another server worker.")
+        await self._start_workers()
+
+    async def _start_workers(self) -> None:
+        # Jobs left running by a previous process continue where they left off
+        await run_io(self.store.requeue_running)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+        log.info(f"Started {self.workers} job workers.")
+
+    async def _work(self) -> None:
+        while True:
+            self._wakeup.clear()
+            job_id = await run_io(self.store.claim_next)
+            if job_id is None:
+                # Jobs submitted to other server workers are only seen by polling
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job_id)
+            except Exception as exc:
+                log.error(f"Job '{job_id}' failed: {exc}")
+                await run_io(self.store.finish, job_id, FAILED, str(exc))
+
+    async def _process(self, job_id: str) -> None:
+        job = await run_io(self.store.get, job_id)
+        pipeline = await self.models.get_pipeline(job["model"])
+        params = pipeline.detector.resolve_params(**job["params"])
+        log.info(f"Running job '{job_id}' on {job['total']} images...")
+
+        status, after = RUNNING, -1
+        while status == RUNNING:
+            page = await run_io(self.store.pending, job_id, after, self.page_size)
+            if not page:
+                break
+            after = page[-1][0]
+
+            results = pipeline.detect_as_completed(
+                (partial(image.read, self.fetcher) for _, image in page),
+                params,
+                self.max_concurrency,
+                bulk=True,
+            )
+            try:
+                async for i, result in results:
+                    # Results are stored in default format, as they are returned
+                    if not isinstance(result, Exception):
+                        result = result._replace(
+                            detections=default_detections(
+                                result.detections, pipeline.detector.class_names
+                            )
+                        )
+                    status = await run_io(
+                        self.store.save_result, job_id, page[i][0], result
+                    )
+                    if status != RUNNING:
+                        break
+            finally:
+                # Stops images still in flight on cancellation
+                await results.aclose()
+
+        if status == RUNNING:
+            await run_io(self.store.finish, job_id, COMPLETED)
+            log.info(f"Finished job '{job_id}'.")
+
+
+def _describe(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "model": job["model"],
+        "total": job["total"],
+        "processed": job["processed"],
+        "failed": job["failed"],
+        "progress": round(job["processed"] / job["total"], 4) if job["total"] else 1.0,
+        "error": job["error"],
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"],
+    }
+
+
+def _image_columns(image: BaseImageModel) -> Tuple[Optional[str], Optional[str]]:
+    if isinstance(image, ImageURL):
+        return image.__root__, None
+    return None, image.__root__.decode()
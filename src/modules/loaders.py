@@ -1,49 +1,40 @@
-import base64
-from typing import List, Tuple, Union
+from io import BytesIO
+from typing import Optional
 import numpy as np
-
-from src.schemas import BaseImageModel
-
-from .augmentations import letterbox
-
-
-class ImagesLoader:
-    def __init__(
-        self,
-        files: Union[List[BaseImageModel], BaseImageModel],
-        img_size: int = 640,
-        stride: int = 32,
-        auto: bool = False,
-    ):
-        self.img_size = img_size
-        self.stride = stride
-        self.auto = auto
-
-        self.files = files if isinstance(files, list) else [files]
-        self.nf = len(self.files)
-
-    def __iter__(self):
-        self.count = 0
-        return self
-
-    def __next__(self) -> Tuple[str, np.ndarray, np.ndarray, str]:
-        if self.count == self.nf:
-            raise StopIteration
-
-        # Load image
-        file = self.files[self.count].to_pil_image()
-
-        # Load image
-        img0 = np.array(file)
-        # Padded resize (YOLOv5 inference)
-        img = letterbox(
-            img0, new_shape=self.img_size, stride=self.stride, auto=self.auto
-        )[0]
-
-        # Transform to RBG contiguous array
-        img = img.transpose(2, 0, 1)
-        img = np.ascontiguousarray(img)
-
-        self.count += 1
-
-        return "", img, img0, ""
+from PIL import Image, UnidentifiedImageError
+
+from src.exceptions import ImageTooLarge, InvalidImage
+
+
+def decode_image(
+    data: bytes, img_size: Optional[int] = 640, max_pixels: Optional[int] = None
+) -> np.ndarray:
+    """Decodes image bytes to RGB array.
+
+    JPEG images much larger than `img_size` are decoded at reduced scale
+    (1/2, 1/4 or 1/8), keeping the longer side at least `img_size` pixels,
+    as they are downscaled by letterbox anyway. Without `img_size` images
+    are decoded at full resolution, e.g. to be tiled.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+    except UnidentifiedImageError:
+        raise InvalidImage("Image format is not recognized.")
+    except Image.DecompressionBombError as exc:
+        # Pillow refuses images of over twice its own pixel limit
+        raise ImageTooLarge(str(exc))
+    if max_pixels and image.width * image.height > max_pixels:
+        raise ImageTooLarge(
+            f"Image of {image.width}x{image.height} pixels exceeds {max_pixels} pixels."
+        )
+    if img_size and image.format == "JPEG":
+        scale = img_size / max(image.size)
+        if scale < 0.5:
+            image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+    try:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.asarray(image)
+    except OSError as exc:
+        # Truncated or corrupt image data only fails once decoded
+        raise InvalidImage(f"Image could not be decoded: {exc}")
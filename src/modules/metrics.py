@@ -0,0 +1,97 @@
+"""Prometheus metrics of the service, exposed on `/metrics` endpoint.
+
+With several server workers, `PROMETHEUS_MULTIPROC_DIR` has to be set before
+the app is imported, metrics are then aggregated from files of all workers.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Iterator, Optional, Tuple
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+)
+
+# Stages take from sub-millisecond (letterbox) to seconds (fetch, forward pass)
+STAGE_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "stage_duration_seconds",
+    "Time spent in each stage of image detection.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+IMAGES = Counter("images_total", "Images run through detection.", ["model"])
+DETECTIONS = Counter("detections_total", "Objects detected in images.", ["model"])
+CACHE_HITS = Counter("result_cache_hits_total", "Detections served from cache.")
+CACHE_MISSES = Counter("result_cache_misses_total", "Detections missing in cache.")
+ERRORS = Counter("errors_total", "Failed requests and images.", ["type"])
+FRAMES = Counter("frames_total", "Frames received on streams.", ["model"])
+FRAMES_DROPPED = Counter(
+    "frames_dropped_total", "Stream frames replaced by newer ones.", ["model"]
+)
+QUEUE_DEPTH = Gauge(
+    "scheduler_queue_depth",
+    "Images waiting for micro-batching scheduler.",
+    ["model", "backend"],
+    multiprocess_mode="livesum",
+)
+IN_FLIGHT = Gauge(
+    "requests_in_flight",
+    "HTTP requests being processed.",
+    multiprocess_mode="livesum",
+)
+
+# Stage timings of the current request with the lock guarding them, collected
+# only when it is profiled
+STAGE_TIMINGS: ContextVar[Optional[Tuple[Dict[str, float], Lock]]] = ContextVar(
+    "stage_timings", default=None
+)
+
+
+def registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Records time spent in the block to stage duration histogram, and to
+    stage timings of the current request if it is profiled."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        stage_timings = STAGE_TIMINGS.get()
+        if stage_timings is not None:
+            # Stages of one request may run at once in threads of the I/O pool
+            timings, lock = stage_timings
+            with lock:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
@@ -1,34 +1,149 @@
+import ast
 import json
-from typing import Any, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pathlib import Path
+import numpy as np
 import torch
 
-import wandb
-
 from src.logger import get_logger
 from src.config import settings
+from src.modules.executors import TORCH_NUM_THREADS
+from src.modules.quantization import PRECISIONS, quantize_onnx
 
 log = get_logger(__name__)
 
+# Backend name, which is also the model file suffix, to loader function
+# returning (model, stride, names) for the model file
+BACKENDS: Dict[str, Callable[[Path], Tuple[Any, int, Any]]] = {}
+
+
+def register_backend(name: str):
+    def decorator(loader: Callable[[Path], Tuple[Any, int, Any]]):
+        BACKENDS[name] = loader
+        return loader
+
+    return decorator
+
+
+@register_backend("torchscript")
+def _load_torchscript(model_path: Path) -> Tuple[Any, int, Any]:
+    # TorchScript backend stores stride and names in config file
+    extra_files = {"config.txt": ""}
+    model = torch.jit.load(
+        model_path, map_location=settings.MODEL_DEVICE, _extra_files=extra_files
+    )
+    if extra_files["config.txt"]:  # load metadata dict
+        data = json.loads(
+            extra_files["config.txt"],
+            object_hook=lambda data: {
+                int(k) if k.isdigit() else k: v for k, v in data.items()
+            },
+        )
+        return model, int(data["stride"]), data["names"]
+    return model, 32, None
+
+
+@register_backend("pt")
+def _load_pt(model_path: Path) -> Tuple[Any, int, Any]:
+    # PyTorch format needs class in working directory
+    model = torch.load(model_path, map_location=settings.MODEL_DEVICE)
+    if isinstance(model, dict):  # training checkpoint
+        model = model.get("ema") or model["model"]
+    model = model.float().eval()
+    return model, max(int(model.stride.max()), 32), model.names
+
+
+class OnnxModel:
+    """Wraps ONNX Runtime session to be called like the torch models."""
+
+    def __init__(self, session: Any) -> None:
+        self.session = session
+        self.input = session.get_inputs()[0]
+        # Models exported without dynamic axes accept only fixed batch size
+        batch_size = self.input.shape[0]
+        self.batch_size = batch_size if isinstance(batch_size, int) else None
+        img_size = self.input.shape[2]
+        self.img_size = img_size if isinstance(img_size, int) else None
+
+    def __call__(self, x: torch.Tensor) -> List[torch.Tensor]:
+        x = x.cpu().numpy()
+        if self.batch_size and x.shape[0] != self.batch_size:
+            outputs = [self._run(x[i : i + 1]) for i in range(x.shape[0])]
+            return [torch.cat(output) for output in zip(*outputs)]
+        return self._run(x)
+
+    def _run(self, x: np.ndarray) -> List[torch.Tensor]:
+        outputs = self.session.run(None, {self.input.name: x})
+        return [torch.from_numpy(output) for output in outputs]
+
+
+@register_backend("onnx")
+def _load_onnx(model_path: Path) -> Tuple[Any, int, Any]:
+    try:
+        import onnxruntime
+    except ImportError:
+        log.error("ONNX backend requires onnxruntime, install it with 'onnx' extra.")
+        return None, None, None
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS or TORCH_NUM_THREADS
+    options.inter_op_num_threads = settings.ONNX_INTER_OP_THREADS
+    options.graph_optimization_level = getattr(
+        onnxruntime.GraphOptimizationLevel, settings.ONNX_GRAPH_OPTIMIZATION_LEVEL
+    )
+    session = onnxruntime.InferenceSession(
+        str(model_path), options, providers=["CPUExecutionProvider"]
+    )
+
+    # YOLOv5 export stores stride and names in model metadata
+    metadata = session.get_modelmeta().custom_metadata_map
+    stride = int(metadata.get("stride", 32))
+    names = ast.literal_eval(metadata["names"]) if "names" in metadata else None
+    return OnnxModel(session), stride, names
+
 
 class Model:
     def __init__(
-        self, model_root: str, tag: str, backend: str, cache: bool = True
+        self,
+        model_root: str,
+        tag: str,
+        backend: str,
+        cache: bool = True,
+        precision: str = "fp32",
     ) -> None:
         self.model_root = model_root
         self.tag = tag
         self.cache = cache
         self.backend = backend.lower()
+        self.precision = precision.lower()
+        self.model_path: Optional[Path] = None
 
         self.model, self.stride, self.names = self._load_model()
 
     def __call__(self, *args: Any, **kwds: Any) -> Any:
         return self.model
 
+    @property
+    def size_bytes(self) -> int:
+        """Approximates memory taken by model weights with the model file size."""
+        return self.model_path.stat().st_size if self.model_path else 0
+
     def _load_model(self) -> Tuple[Any, int, list]:
         log.info(f"Loading model, tag='{self.tag}', backend='{self.backend}'...")
         model_path = None
 
+        if self.backend not in BACKENDS:
+            log.error(
+                f"Unsupported backend type: {self.backend}, available backends: {', '.join(BACKENDS)}"
+            )
+            return None, None, None
+
+        if self.precision not in PRECISIONS:
+            log.error(
+                f"Unsupported precision: {self.precision}, available precisions: {', '.join(PRECISIONS)}"
+            )
+            return None, None, None
+
         # Serve model from cache if exists
         if self.cache and Path(self.model_root, self.tag).is_dir():
             try:
@@ -42,15 +157,24 @@ class Model:
 
         # Get model from model registry
         if model_path == None:
-            # Initialize WandB API
-            api = wandb.Api()
+            try:
+                # Import registry client only on local cache miss, it is slow to import
+                import wandb
 
-            # Download tag artifacts
-            log.info("Fetching model from WandB model registry...")
-            artifact = api.artifact(
-                f"{settings.WANDB_ENTITY}/{settings.WANDB_PROJECT}/{settings.WANDB_REGISTERED_MODEL}:{self.tag}"
-            )
-            artifact.download(root=f"{self.model_root}/{self.tag}")
+                # Initialize WandB API
+                api = wandb.Api()
+
+                # Download tag artifacts
+                log.info("Fetching model from WandB model registry...")
+                artifact = api.artifact(
+                    f"{settings.WANDB_ENTITY}/{settings.WANDB_PROJECT}/{settings.WANDB_REGISTERED_MODEL}:{self.tag}"
+                )
+                artifact.download(root=f"{self.model_root}/{self.tag}")
+            except Exception as exc:
+                log.error(
+                    f"Failed to fetch model tag='{self.tag}' from registry: {exc}"
+                )
+                return None, None, None
 
             # Get model path
             try:
@@ -61,36 +185,44 @@ class Model:
                 log.error(f"Failed to fetch model for backend='{self.backend}'")
                 return None, None, None
 
-        if self.backend == "torchscript":
-            # TorchScript backend stores stride and names in config file
-            extra_files = {"config.txt": ""}
-            model = torch.jit.load(Path(model_path), _extra_files=extra_files)
-            if extra_files["config.txt"]:  # load metadata dict
-                data = json.loads(
-                    extra_files["config.txt"],
-                    object_hook=lambda data: {
-                        int(k) if k.isdigit() else k: v for k, v in data.items()
-                    },
-                )
-                stride, names = int(data["stride"]), data["names"]
-            else:
-                stride = 32
-                names = None
-        elif self.backend == "pt":
-            # PyTorch format needs class in working directory
-            model = torch.load(Path(model_path))
-            stride = max(int(self.model.stride.max()), 32)
-            names = self.model.names
-        else:
-            log.error(f"Unsupported backend type: {self.backend}")
+        model_path = self._prepare_precision(Path(model_path))
+        if model_path is None:
             return None, None, None
 
+        model, stride, names = BACKENDS[self.backend](model_path)
+        if model is None:
+            return None, None, None
+        self.model_path = model_path
+
+        if self.precision == "fp16":
+            model = model.half()
+
         if names:
             log.info(
-                f"Successfully loaded '{self.backend}' model, with stride='{stride}' and {len(names)} classes."
+                f"Successfully loaded '{self.backend}' {self.precision} model, with stride='{stride}' and {len(names)} classes."
             )
         else:
             log.info(
-                f"Successfully loaded '{self.backend}' model, with stride='{stride}'"
+                f"Successfully loaded '{self.backend}' {self.precision} model, with stride='{stride}'"
             )
         return model, stride, names
+
+    def _prepare_precision(self, model_path: Path) -> Optional[Path]:
+        # Falls back to fp32 for precisions unsupported by backend or device
+        if self.precision == "fp16":
+            if self.backend == "onnx" or settings.MODEL_DEVICE == "cpu":
+                log.warning(
+                    f"Half precision is not supported for '{self.backend}' backend on '{settings.MODEL_DEVICE}', using fp32."
+                )
+                self.precision = "fp32"
+        elif self.precision.startswith("int8"):
+            if self.backend != "onnx":
+                log.warning(
+                    "Int8 quantization is supported only for 'onnx' backend, using fp32."
+                )
+                self.precision = "fp32"
+            else:
+                return quantize_onnx(
+                    model_path, self.precision, settings.MODEL_CALIBRATION_DIR
+                )
+        return model_path
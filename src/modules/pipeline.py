@@ -0,0 +1,242 @@
+import asyncio
+from itertools import islice
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from src.exceptions import ImageTooLarge, InvalidImage, SchedulerOverloaded
+from src.modules.batching import BatchScheduler
+from src.modules.cache import ResultCache
+from src.modules.detector import (
+    Detector,
+    ImageDetections,
+    InferenceParams,
+    batches_by_shape,
+)
+from src.logger import get_logger
+from src.modules.executors import run_inference, run_io
+from src.modules.loaders import decode_image
+from src.modules.metrics import DETECTIONS, ERRORS, IMAGES
+from src.modules.tiling import tile_windows
+
+log = get_logger(__name__)
+
+# Seconds bulk images wait before retrying on overloaded scheduler, doubled
+# on every retry
+OVERLOAD_RETRY_DELAY = 0.1
+OVERLOAD_RETRY_MAX_DELAY = 5.0
+
+
+class InferencePipeline:
+    """Runs raw image bytes through result cache, decoding and the detector.
+
+    Single images are merged with concurrent requests by the micro-batching
+    scheduler, while batches are run directly as chunks of `max_batch_size`.
+    Tiled images are split into tiles which are batched per image.
+    """
+
+    def __init__(
+        self,
+        scheduler: BatchScheduler,
+        result_cache: ResultCache,
+        max_batch_size: int = 16,
+        tile_overlap: float = 0.2,
+        tile_batch_size: int = 8,
+        max_tiled_images: int = 2,
+        max_tiled_pixels: Optional[int] = None,
+    ) -> None:
+        self.scheduler = scheduler
+        self.result_cache = result_cache
+        self.max_batch_size = max_batch_size
+        self.tile_overlap = tile_overlap
+        self.tile_batch_size = tile_batch_size
+        self.max_tiled_images = max_tiled_images
+        self.max_tiled_pixels = max_tiled_pixels
+
+        self._tile_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tile_slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def detector(self) -> Detector:
+        return self.scheduler.detector
+
+    async def detect(
+        self,
+        data: bytes,
+        params: Optional[InferenceParams] = None,
+        bulk: bool = False,
+        cache: bool = True,
+    ) -> ImageDetections:
+        """Detects single image, `cache` False skips the result cache, e.g. for
+        video frames which are not repeated."""
+        params = params or self.detector.default_params
+        key, detections = "", None
+        if cache:
+            key, detections = await run_io(
+                self.result_cache.lookup, data, self.detector, params
+            )
+        if detections is None:
+            if params.tiled:
+                detections = await self._detect_tiled(data, params)
+            else:
+                detections = await self.scheduler.submit(data, params, bulk)
+            if cache:
+                await run_io(self.result_cache.put, key, detections)
+        self._count([detections])
+        return detections
+
+    async def detect_batch(
+        self, datas: List[bytes], params: Optional[InferenceParams] = None
+    ) -> List[Union[ImageDetections, Exception]]:
+        """Detects batch of images, images which fail to decode are returned
+        as their exception instead of failing the whole batch."""
+        detector = self.detector
+        params = params or detector.default_params
+        if params.tiled:
+            # Tiles of each image are batched instead
+            return await asyncio.gather(
+                *(
+                    self._image_error(i, self.detect(data, params))
+                    for i, data in enumerate(datas)
+                )
+            )
+
+        # Serve repeated images from cache, only the rest goes through the model
+        cached = await asyncio.gather(
+            *(
+                run_io(self.result_cache.lookup, data, detector, params)
+                for data in datas
+            )
+        )
+        results = [detections for _, detections in cached]
+        missed = [i for i, detections in enumerate(results) if detections is None]
+
+        preprocessed = await asyncio.gather(
+            *(
+                self._image_error(
+                    i, run_io(detector.preprocess, datas[i], params.img_size)
+                )
+                for i in missed
+            )
+        )
+        for i, result in zip(missed, preprocessed):
+            if isinstance(result, Exception):
+                results[i] = result
+        missed = [i for i in missed if results[i] is None]
+        preprocessed = [result for result in preprocessed if isinstance(result, tuple)]
+
+        imgs = [img for img, _ in preprocessed]
+        for indices in batches_by_shape(imgs, self.max_batch_size):
+            imgs, img0s = zip(*(preprocessed[i] for i in indices))
+            batch_detections = await run_inference(detector.infer, imgs, img0s, params)
+            for i, detections in zip(indices, batch_detections):
+                results[missed[i]] = detections
+
+        await asyncio.gather(
+            *(run_io(self.result_cache.put, cached[i][0], results[i]) for i in missed)
+        )
+        self._count(
+            [result for result in results if isinstance(result, ImageDetections)]
+        )
+        return results
+
+    async def detect_as_completed(
+        self,
+        reads: Iterable[Callable[[], Awaitable[bytes]]],
+        params: Optional[InferenceParams] = None,
+        max_concurrency: int = 16,
+        bulk: bool = False,
+    ) -> AsyncIterator[Tuple[int, Union[ImageDetections, Exception]]]:
+        """Yields index and detections of each image as soon as it is done.
+
+        Images are read only once one of `max_concurrency` slots is free and
+        released when done, so that at most that many are held in memory.
+        Bulk images yield to interactive requests in the scheduler queue.
+        Concurrent images are merged into batches by the scheduler. Failed
+        images yield their exception, as the response is already underway.
+        Bulk images are retried with backoff while the scheduler is overloaded.
+        """
+
+        async def detect(i: int, read: Callable[[], Awaitable[bytes]]):
+            try:
+                data = await read()
+                delay = OVERLOAD_RETRY_DELAY
+                while True:
+                    try:
+                        return i, await self.detect(data, params, bulk)
+                    except SchedulerOverloaded:
+                        if not bulk:
+                            raise
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, OVERLOAD_RETRY_MAX_DELAY)
+            except Exception as exc:
+                log.warning(f"Detection of image {i} failed: {exc}")
+                ERRORS.labels(type(exc).__name__).inc()
+                return i, exc
+
+        reads = enumerate(reads)
+        pending = {
+            asyncio.ensure_future(detect(i, read))
+            for i, read in islice(reads, max_concurrency)
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                pending |= {
+                    asyncio.ensure_future(detect(i, read))
+                    for i, read in islice(reads, len(done))
+                }
+                for task in done:
+                    yield task.result()
+        finally:
+            # Stop remaining images when the client disconnects
+            for task in pending:
+                task.cancel()
+
+    async def _detect_tiled(
+        self, data: bytes, params: InferenceParams
+    ) -> ImageDetections:
+        # Slots are bound to the event loop, as the scheduler
+        if self._tile_loop is not asyncio.get_running_loop():
+            self._tile_loop = asyncio.get_running_loop()
+            self._tile_slots = asyncio.Semaphore(self.max_tiled_images)
+
+        # Full resolution images are held in memory by at most `max_tiled_images`
+        # requests, their tiles run in batches of `tile_batch_size`
+        async with self._tile_slots:
+            img0 = await run_io(decode_image, data, None, self.max_tiled_pixels)
+            windows = tile_windows(img0.shape[:2], params.img_size, self.tile_overlap)
+            detections = []
+            for start in range(0, len(windows), self.tile_batch_size):
+                detections += await run_inference(
+                    self.detector.detect_tiles,
+                    img0,
+                    windows[start : start + self.tile_batch_size],
+                    params,
+                )
+        return await run_inference(
+            self.detector.merge_tiles, detections, windows, img0.shape, params
+        )
+
+    async def _image_error(self, i: int, coro: Awaitable):
+        try:
+            return await coro
+        except (InvalidImage, ImageTooLarge) as exc:
+            log.warning(f"Detection of image {i} failed: {exc}")
+            ERRORS.labels(type(exc).__name__).inc()
+            return exc
+
+    def _count(self, results: List[ImageDetections]) -> None:
+        IMAGES.labels(self.detector.tag).inc(len(results))
+        DETECTIONS.labels(self.detector.tag).inc(
+            sum(len(result.detections) for result in results)
+        )
@@ -0,0 +1,124 @@
+"""Per-request profiling.
+
+Profiled requests collect time spent in each detection stage, which is
+returned in the response. Optionally, a `torch.profiler` trace of forward
+passes run for the request is written to `trace_dir`, viewable in Chrome
+tracing or TensorBoard. Traces of micro-batched requests include the other
+images of the batch, and only one trace is recorded at a time. Older traces
+are removed, keeping the latest `max_traces` of them.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+
+from src.logger import get_logger
+from src.modules.metrics import STAGE_TIMINGS
+
+log = get_logger(__name__)
+
+_trace_lock = Lock()
+
+
+class RequestProfile:
+    def __init__(
+        self,
+        enabled: bool = False,
+        trace: bool = False,
+        trace_dir: str = "traces",
+        max_traces: int = 20,
+    ) -> None:
+        self.enabled = enabled or trace
+        self.trace = trace
+        self.trace_dir = trace_dir
+        self.max_traces = max_traces
+        self.timings: Dict[str, float] = {}
+        self.timings_lock = Lock()
+        self.traces: List[str] = []
+
+        self._tokens: List[Any] = []
+        self._start_time = 0.0
+        self._total = 0.0
+
+    def __enter__(self) -> "RequestProfile":
+        if self.enabled:
+            self._tokens = [
+                STAGE_TIMINGS.set((self.timings, self.timings_lock)),
+                ACTIVE_PROFILE.set(self),
+            ]
+            self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.enabled:
+            self._total = time.perf_counter() - self._start_time
+            STAGE_TIMINGS.reset(self._tokens[0])
+            ACTIVE_PROFILE.reset(self._tokens[1])
+
+    def report(self) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self.timings_lock:
+            stages = {
+                stage: round(elapsed, 6) for stage, elapsed in self.timings.items()
+            }
+        return {
+            "stages": stages,
+            "total": round(self._total, 6),
+            "traces": self.traces,
+        }
+
+
+# Profile of the current request, set for profiled requests only
+ACTIVE_PROFILE: ContextVar[Optional[RequestProfile]] = ContextVar(
+    "active_profile", default=None
+)
+
+
+@contextmanager
+def record_trace() -> Iterator[None]:
+    """Records `torch.profiler` trace of the block, if current request asked for it.
+
+    Profiler records operators of the thread starting it, so the block has
+    to run in the thread running the forward pass.
+    """
+    profile = ACTIVE_PROFILE.get()
+    if profile is None or not profile.trace:
+        yield
+        return
+
+    if not _trace_lock.acquire(blocking=False):
+        log.warning("Another request is being traced, skipping trace.")
+        yield
+        return
+
+    try:
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        with torch.profiler.profile(
+            activities=activities, record_shapes=True
+        ) as profiler:
+            yield
+
+        Path(profile.trace_dir).mkdir(parents=True, exist_ok=True)
+        path = Path(
+            profile.trace_dir, f"{int(time.time())}-{uuid.uuid4().hex[:8]}.json"
+        )
+        profiler.export_chrome_trace(str(path))
+        profile.traces.append(str(path))
+        log.info(f"Saved request trace to '{path}'.")
+        _remove_old_traces(profile.trace_dir, profile.max_traces)
+    finally:
+        _trace_lock.release()
+
+
+def _remove_old_traces(trace_dir: str, max_traces: int) -> None:
+    traces = sorted(Path(trace_dir).glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for path in traces[: max(len(traces) - max_traces, 0)]:
+        path.unlink(missing_ok=True)
@@ -0,0 +1,169 @@
+"""Reduced precision inference modes.
+
+`int8-dynamic` and `int8-static` quantize ONNX models with ONNX Runtime
+quantization tools, static quantization calibrating activation ranges on a
+local folder of sample images. `fp16` casts PyTorch models to half
+precision on accelerators supporting it.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from src.logger import get_logger
+from src.modules.augmentations import letterbox
+from src.modules.loaders import decode_image
+
+log = get_logger(__name__)
+
+PRECISIONS = ("fp32", "fp16", "int8-dynamic", "int8-static")
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Detections of an image as [x0, y0, x1, y1, score, classId] arrays
+Detections = List[List[Any]]
+
+
+class ImageCalibrationReader:
+    """Feeds letterboxed sample images to ONNX Runtime static quantization."""
+
+    def __init__(
+        self,
+        input_name: str,
+        image_dir: str,
+        img_size: int = 640,
+        stride: int = 32,
+        max_images: int = 100,
+    ) -> None:
+        self.input_name = input_name
+        self.img_size = img_size
+        self.stride = stride
+        self.files = sorted(
+            path
+            for path in Path(image_dir).iterdir()
+            if path.suffix.lower() in IMAGE_SUFFIXES
+        )[:max_images]
+        self._files: Iterator[Path] = iter(self.files)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        path = next(self._files, None)
+        if path is None:
+            return None
+
+        img0 = decode_image(path.read_bytes(), self.img_size)
+        img = letterbox(img0, self.img_size, stride=self.stride, auto=False)[0]
+        img = img.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return {self.input_name: img}
+
+    def rewind(self) -> None:
+        self._files = iter(self.files)
+
+
+def quantize_onnx(
+    model_path: Path,
+    precision: str,
+    calibration_dir: Optional[str] = None,
+    img_size: int = 640,
+    stride: int = 32,
+) -> Optional[Path]:
+    """Quantizes ONNX model to int8, returning path of the quantized model.
+
+    Quantized models are stored in `quantized` directory next to the source
+    model and reused on subsequent loads.
+    """
+    try:
+        import onnx
+        from onnxruntime.quantization import (
+            QuantType,
+            quantize_dynamic,
+            quantize_static,
+        )
+    except ImportError as exc:
+        log.error(
+            f"ONNX quantization requires {exc.name}, install it with 'onnx' extra."
+        )
+        return None
+
+    output_path = (
+        model_path.parent / "quantized" / f"{model_path.stem}.{precision}.onnx"
+    )
+    if output_path.is_file():
+        log.info(f"Serving {precision} model from local cache...")
+        return output_path
+    output_path.parent.mkdir(exist_ok=True)
+
+    log.info(f"Quantizing model to {precision}...")
+    if precision == "int8-dynamic":
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    elif precision == "int8-static":
+        if not calibration_dir or not Path(calibration_dir).is_dir():
+            log.error(
+                f"Static quantization requires calibration images, directory '{calibration_dir}' does not exist."
+            )
+            return None
+
+        # Calibrate at the exported input size, if the model has static shape
+        model_input = onnx.load(str(model_path)).graph.input[0]
+        height = model_input.type.tensor_type.shape.dim[2].dim_value
+        reader = ImageCalibrationReader(
+            model_input.name, calibration_dir, height or img_size, stride
+        )
+        if not reader.files:
+            log.error(f"No calibration images found in '{calibration_dir}'.")
+            return None
+
+        log.info(f"Calibrating on {len(reader.files)} images...")
+        quantize_static(model_path, output_path, reader, per_channel=True)
+    else:
+        log.error(f"Unsupported ONNX quantization precision: {precision}")
+        return None
+
+    return output_path
+
+
+def compare_detections(
+    baseline: List[Detections], candidate: List[Detections], iou_threshold: float = 0.5
+) -> Dict[str, float]:
+    """Compares detections of reduced precision model with the fp32 baseline.
+
+    Detections are matched greedily per image by class and IoU. Precision
+    and recall measure agreement with the baseline, which approximates the
+    mAP change without annotated data.
+    """
+    matched, matched_iou, score_diff = 0, 0.0, 0.0
+    baseline_count = sum(map(len, baseline))
+    candidate_count = sum(map(len, candidate))
+
+    for expected, actual in zip(baseline, candidate):
+        unmatched = list(actual)
+        for detection in sorted(expected, key=lambda d: d[4], reverse=True):
+            best, best_iou = None, iou_threshold
+            for other in unmatched:
+                if other[5] != detection[5]:
+                    continue
+                iou = _box_iou(detection[:4], other[:4])
+                if iou >= best_iou:
+                    best, best_iou = other, iou
+            if best is not None:
+                unmatched.remove(best)
+                matched += 1
+                matched_iou += best_iou
+                score_diff += abs(best[4] - detection[4])
+
+    return {
+        "precision": matched / candidate_count if candidate_count else 1.0,
+        "recall": matched / baseline_count if baseline_count else 1.0,
+        "meanIoU": matched_iou / matched if matched else 0.0,
+        "meanScoreDiff": score_diff / matched if matched else 0.0,
+    }
+
+
+def _box_iou(box1: List[float], box2: List[float]) -> float:
+    # Bounding boxes are (x0, y0, x1, y1) corners
+    (ax0, ay0, ax1, ay1), (bx0, by0, bx1, by1) = box1, box2
+    w = min(ax1, bx1) - max(ax0, bx0)
+    h = min(ay1, by1) - max(ay0, by0)
+    inter = max(w, 0) * max(h, 0)
+    area1 = (ax1 - ax0) * (ay1 - ay0)
+    area2 = (bx1 - bx0) * (by1 - by0)
+    union = area1 + area2 - inter
+    return inter / union if union > 0 else 0.0
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from src.exceptions import UnknownModelTag
+from src.logger import get_logger
+from src.modules.pipeline import InferencePipeline
+
+log = get_logger(__name__)
+
+ModelKey = Tuple[str, str]
+
+# Registry aliases and versions, tags name directories of cached models
+TAG_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,63}")
+
+
+class ModelManager:
+    """Keeps inference pipelines of several models resident in memory.
+
+    Models are identified by tag and backend, loaded in a background thread
+    on first use and evicted in least recently used order once their total
+    size exceeds `memory_budget_mb`. The default model is never evicted and
+    is swapped atomically only after its replacement finished loading, so
+    requests keep being served by the previous model in the meantime.
+    Tags requested explicitly have to be the default or canary tag, or in
+    `allowed_tags`, any tag is allowed if it is None.
+
+    Server workers share the activated tag through `active_tag_file`, which
+    each worker checks at most once per `sync_interval` seconds and activates
+    the model written there by another worker.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str, str], InferencePipeline],
+        default_tag: str,
+        backend: str,
+        memory_budget_mb: float = 2048,
+        canary_tag: Optional[str] = None,
+        canary_weight: float = 0.0,
+        allowed_tags: Optional[Sequence[str]] = None,
+        active_tag_file: Optional[str] = None,
+        sync_interval: float = 1.0,
+    ) -> None:
+        self.factory = factory
+        self.default_tag = default_tag
+        self.backend = backend
+        self.memory_budget_mb = memory_budget_mb
+        self.canary_tag = canary_tag
+        self.canary_weight = canary_weight
+        self.allowed_tags = (
+            None
+            if allowed_tags is None
+            else {default_tag, canary_tag, *allowed_tags} - {None}
+        )
+        self.active_tag_file = active_tag_file
+        self.sync_interval = sync_interval
+
+        self._synced_at = 0.0
+        self._active_tag_mtime: Optional[int] = None
+        self._pipelines: "OrderedDict[ModelKey, InferencePipeline]" = OrderedDict()
+        self._loading: Dict[ModelKey, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="model-loader"
+        )
+
+    @property
+    def default_key(self) -> ModelKey:
+        return self.default_tag, self.backend
+
+    @property
+    def ready(self) -> bool:
+        """Whether the default model is loaded and serving requests."""
+        return self.default_key in self._pipelines
+
+    def resolve_tag(self, tag: Optional[str] = None) -> str:
+        """Returns requested tag, or default tag with share of traffic sent to canary."""
+        if tag:
+            self.check_tag(tag)
+            return tag
+        if self.canary_tag and random.random() < self.canary_weight:
+            return self.canary_tag
+        return self.default_tag
+
+    def check_tag(self, tag: str) -> None:
+        """Rejects malformed tags and tags not allowed to be requested."""
+        if not TAG_PATTERN.fullmatch(tag) or (
+            self.allowed_tags is not None and tag not in self.allowed_tags
+        ):
+            raise UnknownModelTag(f"Unknown model tag '{tag}'.")
+
+    async def get_pipeline(
+        self, tag: Optional[str] = None, backend: Optional[str] = None
+    ) -> InferencePipeline:
+        self._sync_active_tag()
+        key = (self.resolve_tag(tag), backend or self.backend)
+        if key in self._pipelines:
+            self._pipelines.move_to_end(key)
+            return self._pipelines[key]
+        return await self.load(*key)
+
+    async def load(self, tag: str, backend: Optional[str] = None) -> InferencePipeline:
+        """Loads model in background thread, concurrent loads of one model are shared."""
+        key = (tag, backend or self.backend)
+        if key in self._pipelines:
+            return self._pipelines[key]
+
+        if key not in self._loading:
+            log.info(f"Loading model '{tag}' ({key[1]}) in background...")
+            self._loading[key] = asyncio.get_running_loop().run_in_executor(
+                self._executor, self.factory, *key
+            )
+        try:
+            pipeline = await asyncio.shield(self._loading[key])
+        finally:
+            self._loading.pop(key, None)
+
+        if key not in self._pipelines:
+            self._pipelines[key] = pipeline
+            self._evict(keep=key)
+        return self._pipelines[key]
+
+    def preload(self, tag: str, backend: Optional[str] = None) -> InferencePipeline:
+        """Loads model in the calling thread, e.g. in the server master process,
+        so that forked workers share its weights instead of loading their own."""
+        key = (tag, backend or self.backend)
+        if key not in self._pipelines:
+            self._pipelines[key] = self.factory(*key)
+        return self._pipelines[key]
+
+    async def activate(self, tag: str) -> None:
+        """Loads model and makes it the default one, once it is ready."""
+        self.check_tag(tag)
+        await self.load(tag)
+        self.default_tag = tag
+        log.info(f"Activated model '{tag}' as default.")
+
+    def load_in_background(self, tag: str) -> None:
+        self._in_background(self.load(tag), f"Loading model '{tag}'")
+
+    def activate_in_background(self, tag: str) -> None:
+        self.check_tag(tag)
+        if self.active_tag_file:
+            # Replaced atomically, so that workers never read a partial tag
+            path = Path(self.active_tag_file)
+            path.with_suffix(".tmp").write_text(tag)
+            os.replace(path.with_suffix(".tmp"), path)
+            self._active_tag_mtime = path.stat().st_mtime_ns
+        self._in_background(self.activate(tag), f"Activating model '{tag}'")
+
+    def _sync_active_tag(self) -> None:
+        if not self.active_tag_file or (
+            time.monotonic() - self._synced_at < self.sync_interval
+        ):
+            return
+        self._synced_at = time.monotonic()
+
+        path = Path(self.active_tag_file)
+        try:
+            mtime = path.stat().st_mtime_ns
+            if mtime == self._active_tag_mtime:
+                return
+            tag = path.read_text()
+        except FileNotFoundError:
+            return
+        self._active_tag_mtime = mtime
+        if tag != self.default_tag:
+            log.info(f"Model '{tag}' was activated by another worker.")
+            self._in_background(self.activate(tag), f"Activating model '{tag}'")
+
+    def _in_background(self, coro: Awaitable, name: str) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(partial(self._on_done, name))
+
+    def _on_done(self, name: str, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            log.error(f"{name} failed: {task.exception()}")
+
+    def models(self) -> List[Dict[str, Any]]:
+        self._sync_active_tag()
+        return [
+            {
+                "tag": tag,
+                "backend": backend,
+                "precision": pipeline.detector.precision,
+                "sizeMb": round(pipeline.detector.size_bytes / 2**20, 2),
+                "default": (tag, backend) == self.default_key,
+            }
+            for (tag, backend), pipeline in self._pipelines.items()
+        ]
+
+    async def close(self) -> None:
+        # Draining schedulers of evicted models are stopped right away
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pipeline in self._pipelines.values():
+            await pipeline.scheduler.stop()
+        self._pipelines.clear()
+        self._executor.shutdown(wait=False)
+
+    def _size_mb(self) -> float:
+        return sum(p.detector.size_bytes for p in self._pipelines.values()) / 2**20
+
+    def _evict(self, keep: ModelKey) -> None:
+        while self._size_mb() > self.memory_budget_mb:
+            evictable = [
+                key for key in self._pipelines if key not in (keep, self.default_key)
+            ]
+            if not evictable:
+                log.warning(
+                    f"Resident models take {self._size_mb():.1f} MB, over the budget of {self.memory_budget_mb} MB."
+                )
+                return
+
+            # Requests already holding the pipeline are finished before stopping it
+            key = evictable[0]
+            pipeline = self._pipelines.pop(key)
+            self._in_background(
+                pipeline.scheduler.stop(drain=True), f"Stopping model '{key[0]}'"
+            )
+            log.info(f"Evicted model '{key[0]}' ({key[1]}).")
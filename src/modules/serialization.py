@@ -0,0 +1,86 @@
+"""Rendering of detection responses.
+
+Responses are built as plain dicts and encoded by orjson, or by msgpack when
+requested by `Accept` header, without validating them into nested pydantic
+models first. Response models of the endpoints document the default format.
+Detectors return detections in compact format, as `[x0, y0, x1, y1, score,
+classId]` arrays, which are sent with class names of the model once per
+response, and expanded to objects with corner points only for the default
+format. Streamed responses are encoded message by message, listing class
+names in the first message.
+"""
+from enum import Enum
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import orjson
+from fastapi.responses import ORJSONResponse, Response
+
+from src.modules.detector import Detector, ImageDetections
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+class ResultFormat(str, Enum):
+    default = "default"
+    compact = "compact"
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content)
+
+
+def default_detections(
+    detections: List[List[Any]], class_names: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Returns `[x0, y0, x1, y1, score, classId]` detections as objects with
+    corner points, names are class ids without `class_names`."""
+    return [
+        {
+            "name": class_names[class_id] if class_names else str(class_id),
+            "score": score,
+            "boundingBox": [
+                {"x": x0, "y": y0},
+                {"x": x1, "y": y0},
+                {"x": x1, "y": y1},
+                {"x": x0, "y": y1},
+            ],
+        }
+        for x0, y0, x1, y1, score, class_id in detections
+    ]
+
+
+class ResponseFormat(NamedTuple):
+    format: ResultFormat = ResultFormat.default
+    msgpack: bool = False
+
+    def image(self, result: ImageDetections, detector: Detector) -> Dict[str, Any]:
+        detections = result.detections
+        if self.format == ResultFormat.default:
+            detections = default_detections(detections, detector.class_names)
+        return {"detections": detections, "truncated": result.truncated}
+
+    def response(self, content: Dict[str, Any], detector: Detector) -> Response:
+        if self.format == ResultFormat.compact:
+            content["classes"] = detector.class_names
+        if self.msgpack:
+            return MsgpackResponse(content)
+        return ORJSONResponse(content)
+
+    def message(
+        self, content: Dict[str, Any], detector: Optional[Detector] = None
+    ) -> bytes:
+        """Encodes single message of a stream, with class names of compact
+        format if `detector` is given."""
+        if detector and self.format == ResultFormat.compact:
+            content["classes"] = detector.class_names
+        if self.msgpack:
+            return msgpack.packb(content)
+        return orjson.dumps(content)
@@ -0,0 +1,122 @@
+"""Tiled inference of images much larger than the inference image size.
+
+The image is split into overlapping tiles of the inference size, which are
+detected at full resolution instead of downscaling the whole image. Tiles
+of an image share their shape and are batched together. Detections of all
+tiles are mapped to image coordinates and merged across tiles.
+"""
+import math
+from itertools import accumulate
+from typing import List, Sequence, Tuple
+
+import torch
+import torchvision
+
+from src.modules.utils import box_area, box_ioa
+
+# Detections within this many pixels of a tile border inside the image are
+# considered cut by the tile
+BORDER_MARGIN = 2
+
+
+def _starts(length: int, tile: int, overlap: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    # Evenly spread tiles, the last one ending at the image border
+    n = math.ceil((length - overlap) / (tile - overlap))
+    return [round(i * (length - tile) / (n - 1)) for i in range(n)]
+
+
+def tile_windows(
+    shape: Tuple[int, int], tile_size: int, overlap: float = 0.2
+) -> List[Tuple[int, int, int, int]]:
+    """Returns (x0, y0, x1, y1) windows of tiles covering image of (height, width) `shape`.
+
+    Tiles are `tile_size` squares, clipped to smaller images, overlapping
+    by at least `overlap` share of the tile size.
+    """
+    height, width = shape
+    step_overlap = min(int(tile_size * overlap), tile_size - 1)
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in _starts(height, tile_size, step_overlap)
+        for x0 in _starts(width, tile_size, step_overlap)
+    ]
+
+
+def merge_tile_detections(
+    detections: Sequence[torch.Tensor],
+    windows: Sequence[Tuple[int, int, int, int]],
+    shape: Tuple[int, int],
+    iou_thres: float = 0.45,
+    ioa_thres: float = 0.5,
+    max_det: int = 300,
+) -> Tuple[torch.Tensor, bool]:
+    """Merges (n,6) detections of tiles in image coordinates [xyxy, conf, cls].
+
+    Objects cut by a tile border are detected partially, so cut detections
+    are dropped when at least `ioa_thres` of their area is covered by a
+    detection of the same class in another tile. Remaining duplicates of
+    objects detected in overlapping tiles are suppressed by class-wise NMS
+    of detections in the overlaps.
+
+    Returns:
+        detections sorted by score, whether they were limited to `max_det`
+    """
+    if len(detections) == 1:
+        # Detections of a single tile already went through NMS
+        return detections[0][:max_det], False
+
+    x = torch.cat(list(detections))
+    tiles = torch.cat(
+        [torch.full((len(d),), i, device=x.device) for i, d in enumerate(detections)]
+    )
+    bounds = [0, *accumulate(len(d) for d in detections)]
+
+    # Detections close to borders of their tile that are inside the image
+    window = torch.tensor(windows, dtype=x.dtype, device=x.device)
+    inner = torch.stack(
+        (
+            window[:, 0] > 0,
+            window[:, 1] > 0,
+            window[:, 2] < shape[1],
+            window[:, 3] < shape[0],
+        ),
+        1,
+    )[tiles]
+    near = torch.cat(
+        (
+            x[:, :2] - window[tiles, :2] <= BORDER_MARGIN,
+            window[tiles, 2:] - x[:, 2:4] <= BORDER_MARGIN,
+        ),
+        1,
+    )
+    is_cut = (inner & near).any(1)
+    area = box_area(x[:, :4].T)
+
+    # Cut detections are covered by whole detections, or by larger parts of
+    # the same object, only compared with detections of overlapping tiles
+    keep = torch.ones(len(x), dtype=torch.bool, device=x.device)
+    overlapping = (box_ioa(window, window) > 0).fill_diagonal_(False)
+    for a, b in overlapping.nonzero().tolist():
+        cut = is_cut[bounds[a] : bounds[a + 1]].nonzero(as_tuple=True)[0] + bounds[a]
+        other = slice(bounds[b], bounds[b + 1])
+        if not len(cut) or bounds[b] == bounds[b + 1]:
+            continue
+        covered = box_ioa(x[cut, :4], x[other, :4]) >= ioa_thres
+        covered &= x[cut, 5, None] == x[None, other, 5]
+        covered &= ~is_cut[None, other] | (area[None, other] > area[cut, None])
+        keep[cut[covered.any(1)]] = False
+    x = x[keep]
+
+    # Only detections in overlaps of tiles can have duplicates in other tiles
+    shared = ((box_ioa(x[:, :4], window) > 0).sum(1) > 1).nonzero(as_tuple=True)[0]
+    i = torchvision.ops.batched_nms(
+        x[shared, :4], x[shared, 4], x[shared, 5].long(), iou_thres
+    )
+    keep = torch.ones(len(x), dtype=torch.bool, device=x.device)
+    keep[shared] = False
+    keep[shared[i]] = True
+    x = x[keep]
+    x = x[x[:, 4].argsort(descending=True)]
+    return x[:max_det], len(x) > max_det
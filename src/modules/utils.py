@@ -3,7 +3,6 @@
 Stale forked form ultralytics/yolov5 repository.
 
 """
-import time
 import numpy as np
 import torchvision
 
@@ -46,6 +45,17 @@ def box_area(box):
     return (box[2] - box[0]) * (box[3] - box[1])
 
 
+def box_ioa(box1, box2, eps=1e-7):
+    """
+    Return intersection over area of box1 of boxes, in (x1, y1, x2, y2) format.
+    Returns:
+        ioa (Tensor[N, M]): the NxM matrix of areas of box1 covered by box2
+    """
+    (a1, a2), (b1, b2) = box1[:, None].chunk(2, 2), box2.chunk(2, 1)
+    inter = (torch.min(a2, b2) - torch.max(a1, b1)).clamp(0).prod(2)
+    return inter / (box_area(box1.T)[:, None] + eps)
+
+
 def non_max_suppression(
     prediction,
     conf_thres=0.25,
@@ -53,19 +63,22 @@ def non_max_suppression(
     classes=None,
     agnostic=False,
     multi_label=False,
-    labels=(),
     max_det=300,
+    max_nms=30000,
 ):
     """Non-Maximum Suppression (NMS) on inference results to reject overlapping bounding boxes
 
+    All images of the batch go through a single NMS call, boxes of each image
+    and class being kept apart by index offsets. Candidates are filtered by
+    objectness before class scores are computed, only for `classes` if set,
+    so the best of the requested classes is detected. At most `max_nms`
+    candidates and `max_det` detections with highest scores are kept per image.
+
     Returns:
-         list of detections, on (n,6) tensor per image [xyxy, conf, cls]
+         list of detections, on (n,6) tensor per image [xyxy, conf, cls],
+         list of flags, whether detections of the image were truncated
     """
 
-    bs = prediction.shape[0]  # batch size
-    nc = prediction.shape[2] - 5  # number of classes
-    xc = prediction[..., 4] > conf_thres  # candidates
-
     # Checks
     assert (
         0 <= conf_thres <= 1
@@ -74,85 +87,64 @@ def non_max_suppression(
         0 <= iou_thres <= 1
     ), f"Invalid IoU {iou_thres}, valid values are between 0.0 and 1.0"
 
-    # Settings
-    # min_wh = 2  # (pixels) minimum box width and height
-    max_wh = 7680  # (pixels) maximum box width and height
-    max_nms = 30000  # maximum number of boxes into torchvision.ops.nms()
-    time_limit = 0.3 + 0.03 * bs  # seconds to quit after
-    redundant = True  # require redundant detections
+    bs = prediction.shape[0]  # batch size
+    nc = prediction.shape[2] - 5  # number of classes
     multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
-    merge = False  # use merge-NMS
-
-    t = time.time()
-    output = [torch.zeros((0, 6), device=prediction.device)] * bs
-    for xi, x in enumerate(prediction):  # image index, image inference
-        # Apply constraints
-        # x[((x[..., 2:4] < min_wh) | (x[..., 2:4] > max_wh)).any(1), 4] = 0  # width-height
-        x = x[xc[xi]]  # confidence
-
-        # Cat apriori labels if autolabelling
-        if labels and len(labels[xi]):
-            lb = labels[xi]
-            v = torch.zeros((len(lb), nc + 5), device=x.device)
-            v[:, :4] = lb[:, 1:5]  # box
-            v[:, 4] = 1.0  # conf
-            v[range(len(lb)), lb[:, 0].long() + 5] = 1.0  # cls
-            x = torch.cat((x, v), 0)
-
-        # If none remain process next image
-        if not x.shape[0]:
-            continue
-
-        # Compute conf
-        x[:, 5:] *= x[:, 4:5]  # conf = obj_conf * cls_conf
-
-        # Box (center x, center y, width, height) to (x1, y1, x2, y2)
-        box = xywh2xyxy(x[:, :4])
-
-        # Detections matrix nx6 (xyxy, conf, cls)
-        if multi_label:
-            i, j = (x[:, 5:] > conf_thres).nonzero(as_tuple=False).T
-            x = torch.cat((box[i], x[i, j + 5, None], j[:, None].float()), 1)
-        else:  # best class only
-            conf, j = x[:, 5:].max(1, keepdim=True)
-            x = torch.cat((box, conf, j.float()), 1)[conf.view(-1) > conf_thres]
-
-        # Filter by class
-        if classes is not None:
-            x = x[(x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)]
-
-        # Apply finite constraint
-        # if not torch.isfinite(x).all():
-        #     x = x[torch.isfinite(x).all(1)]
-
-        # Check shape
-        n = x.shape[0]  # number of boxes
-        if not n:  # no boxes
-            continue
-        elif n > max_nms:  # excess boxes
-            x = x[x[:, 4].argsort(descending=True)[:max_nms]]  # sort by confidence
-
-        # Batched NMS
-        c = x[:, 5:6] * (0 if agnostic else max_wh)  # classes
-        boxes, scores = x[:, :4] + c, x[:, 4]  # boxes (offset by class), scores
-        i = torchvision.ops.nms(boxes, scores, iou_thres)  # NMS
-        if i.shape[0] > max_det:  # limit detections
-            i = i[:max_det]
-        if merge and (1 < n < 3e3):  # Merge NMS (boxes merged using weighted mean)
-            # update boxes as boxes(i,4) = weights(i,n) * boxes(n,4)
-            iou = box_iou(boxes[i], boxes) > iou_thres  # iou matrix
-            weights = iou * scores[None]  # box weights
-            x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(
-                1, keepdim=True
-            )  # merged boxes
-            if redundant:
-                i = i[iou.sum(1) > 1]  # require redundancy
-
-        output[xi] = x[i]
-        if (time.time() - t) > time_limit:
-            break  # time limit exceeded
-
-    return output
+
+    # Objectness candidates, class scores only for them and requested classes
+    image, anchor = (prediction[..., 4] > conf_thres).nonzero(as_tuple=True)
+    x = prediction[image, anchor]
+    if classes is not None:
+        classes = torch.tensor(classes, device=x.device)
+        scores = x[:, 5 + classes] * x[:, 4:5]
+    else:
+        scores = x[:, 5:] * x[:, 4:5]  # conf = obj_conf * cls_conf
+    box = xywh2xyxy(x[:, :4])
+
+    # Detections (xyxy, conf, cls) with image index
+    if multi_label:
+        i, j = (scores > conf_thres).nonzero(as_tuple=True)
+        box, conf, image = box[i], scores[i, j], image[i]
+    else:  # best class only
+        conf, j = scores.max(1)
+        i = conf > conf_thres
+        box, conf, j, image = box[i], conf[i], j[i], image[i]
+
+    if classes is not None:
+        j = classes[j]
+
+    # Keep highest scoring candidates of images with excess boxes
+    truncated = torch.bincount(image, minlength=bs) > max_nms
+    if truncated.any():
+        order = _group_by_image(image, conf.argsort(descending=True))
+        order = order[_rank_in_image(image[order], bs) < max_nms]
+        box, conf, j, image = box[order], conf[order], j[order], image[order]
+
+    # Batched NMS, boxes offset by image and class
+    groups = image if agnostic else image * nc + j
+    i = torchvision.ops.batched_nms(box, conf, groups, iou_thres)  # sorted by conf
+
+    # Limit detections per image
+    i = _group_by_image(image, i)
+    rank = _rank_in_image(image[i], bs)
+    truncated |= torch.bincount(image[i], minlength=bs) > max_det
+    i = i[rank < max_det]
+
+    detections = torch.cat((box[i], conf[i, None], j[i, None].float()), 1)
+    counts = torch.bincount(image[i], minlength=bs).tolist()
+    return list(detections.split(counts)), truncated.tolist()
+
+
+def _group_by_image(image, order):
+    # Stable sort keeps score order of boxes within each image
+    return order[image[order].sort(stable=True)[1]]
+
+
+def _rank_in_image(image, bs):
+    # Position of each box within its image, boxes grouped by image
+    counts = torch.bincount(image, minlength=bs)
+    starts = torch.cumsum(counts, 0) - counts
+    return torch.arange(len(image), device=image.device) - starts[image]
 
 
 def clip_coords(boxes, shape):
@@ -1,19 +1,71 @@
+import asyncio
+import json
 import time
-from fastapi import APIRouter, Depends
-from src.dependencies import get_detector
+from functools import partial
+from typing import AsyncIterator, List, Optional, Union
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    WebSocket,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from src.config import settings
+from src.dependencies import (
+    get_fetcher,
+    get_inference_params,
+    get_job_manager,
+    get_model_manager,
+    get_pipeline,
+    get_profile,
+    get_response_format,
+    get_result_cache,
+    require_admin,
+)
+from src.exceptions import (
+    ImageFetchError,
+    InvalidImage,
+    InvalidInferenceParams,
+    ModelNotFound,
+    UnknownModelTag,
+)
 from src.logger import get_logger
 
-from src.modules.detector import Detector
+from src.modules.cache import ResultCache
+from src.modules.detector import ImageDetections, InferenceParams
+from src.modules.executors import run_io
+from src.modules.fetcher import ImageFetcher
+from src.modules.frames import FrameQueue
+from src.modules.jobs import JobManager
+from src.modules.metrics import ERRORS, FRAMES, FRAMES_DROPPED, observe_stage
+from src.modules.pipeline import InferencePipeline
+from src.modules.profiling import RequestProfile
+from src.modules.registry import ModelManager
+from src.modules.serialization import MSGPACK_MEDIA_TYPE, ResponseFormat
 from ..schemas import (
-    BatchDetectionModel,
+    BaseImageModel,
+    CacheStatsModel,
+    ImageURL,
+    InferenceParamsModel,
+    JobModel,
+    JobResultsModel,
+    ModelModel,
     PredictBatchRequest,
     PredictBatchResponse,
     PredictRequest,
     PredictResponse,
+    SchedulerStatsModel,
 )
 
 router = APIRouter()
 
+# Detection responses are also rendered as MessagePack on request
+MSGPACK_RESPONSES = {200: {"content": {MSGPACK_MEDIA_TYPE: {}}}}
+
 log = get_logger(__name__)
 
 
@@ -22,18 +74,35 @@ log = get_logger(__name__)
     name="Detect objects in the image.",
     description="Returns a list of localized object annotations.",
     response_model=PredictResponse,
+    responses=MSGPACK_RESPONSES,
 )
-async def predict(request: PredictRequest, detector: Detector = Depends(get_detector)):
+async def predict(
+    request: PredictRequest,
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    fetcher: ImageFetcher = Depends(get_fetcher),
+    profile: RequestProfile = Depends(get_profile),
+    response_format: ResponseFormat = Depends(get_response_format),
+):
     log.info(f"Running detection on single {type(request.image).__name__}...")
 
+    params = pipeline.detector.resolve_params(**request.params())
     start_time = time.perf_counter()
-    detections = detector.predict(request.image)
+    with profile:
+        data = await request.image.read(fetcher)
+        result = await pipeline.detect(data, params)
     end_time = time.perf_counter()
 
     log.info(
-        f"Finished detection with {len(detections)} objects, in {round(end_time-start_time, 3)} seconds."
+        f"Finished detection with {len(result.detections)} objects, in {round(end_time-start_time, 3)} seconds."
     )
-    return PredictResponse(detections=detections, time=round(end_time - start_time, 3))
+    with observe_stage("serialization"):
+        content = response_format.image(result, pipeline.detector)
+        content.update(
+            time=round(end_time - start_time, 3),
+            model=pipeline.detector.tag,
+            profile=profile.report(),
+        )
+        return response_format.response(content, pipeline.detector)
 
 
 @router.post(
@@ -41,24 +110,539 @@ async def predict(request: PredictRequest, detector: Detector = Depends(get_dete
     name="Batch detection on multiple images.",
     description="Returns a list of localized object annotations for each image.",
     response_model=PredictBatchResponse,
+    responses=MSGPACK_RESPONSES,
 )
 async def predict_batch(
-    request: PredictBatchRequest, detector: Detector = Depends(get_detector)
+    request: PredictBatchRequest,
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    fetcher: ImageFetcher = Depends(get_fetcher),
+    profile: RequestProfile = Depends(get_profile),
+    response_format: ResponseFormat = Depends(get_response_format),
 ):
     log.info(f"Running batch detection on {len(request.images)} images...")
 
+    params = pipeline.detector.resolve_params(**request.params())
+    start_time = time.perf_counter()
+    with profile:
+        # Download all images concurrently, failed downloads are reported per image
+        datas = await asyncio.gather(
+            *(_read_image(request_image, fetcher) for request_image in request.images)
+        )
+        loaded = [i for i, data in enumerate(datas) if isinstance(data, bytes)]
+        batch_detections = await pipeline.detect_batch(
+            [datas[i] for i in loaded], params
+        )
+    results_by_index = dict(zip(loaded, batch_detections))
+
     results = []
+    for i, request_image in enumerate(request.images):
+        result = results_by_index.get(i, datas[i])
+        failed = isinstance(result, Exception)
+        results.append(
+            {
+                "source": str(request_image.__root__),
+                **response_format.image(
+                    ImageDetections([]) if failed else result, pipeline.detector
+                ),
+                "error": str(result) if failed else None,
+            }
+        )
+    end_time = time.perf_counter()
+
+    log.info(f"Finished batch detection, in {round(end_time-start_time, 3)} seconds.")
+    with observe_stage("serialization"):
+        return response_format.response(
+            {
+                "batchResults": results,
+                "time": round(end_time - start_time, 3),
+                "model": pipeline.detector.tag,
+                "profile": profile.report(),
+            },
+            pipeline.detector,
+        )
+
+
+@router.post(
+    "/object-detection/predict/batch/stream",
+    name="Streamed batch detection on multiple images.",
+    description="Returns localized object annotations as newline delimited JSON, one line per image as soon as it is done, in completion order.",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}, MSGPACK_MEDIA_TYPE: {}}}},
+)
+async def predict_batch_stream(
+    request: PredictBatchRequest,
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    fetcher: ImageFetcher = Depends(get_fetcher),
+    response_format: ResponseFormat = Depends(get_response_format),
+):
+    log.info(f"Running streamed batch detection on {len(request.images)} images...")
+    params = pipeline.detector.resolve_params(**request.params())
+    return StreamingResponse(
+        _stream_detections(request, pipeline, fetcher, params, response_format),
+        # MessagePack objects are delimited by themselves
+        media_type=MSGPACK_MEDIA_TYPE
+        if response_format.msgpack
+        else "application/x-ndjson",
+    )
+
+
+@router.post(
+    "/object-detection/predict/upload",
+    name="Detect objects in the uploaded image.",
+    description="Returns a list of localized object annotations for image uploaded as multipart/form-data file.",
+    response_model=PredictResponse,
+    responses=MSGPACK_RESPONSES,
+)
+async def predict_upload(
+    file: UploadFile = File(...),
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    inference_params: InferenceParamsModel = Depends(get_inference_params),
+    profile: RequestProfile = Depends(get_profile),
+    response_format: ResponseFormat = Depends(get_response_format),
+):
+    log.info(f"Running detection on uploaded file '{file.filename}'...")
+
+    params = pipeline.detector.resolve_params(**inference_params.params())
+    start_time = time.perf_counter()
+    with profile:
+        data = await _read_upload(file)
+        result = await pipeline.detect(data, params)
+    end_time = time.perf_counter()
+
+    log.info(
+        f"Finished detection with {len(result.detections)} objects, in {round(end_time-start_time, 3)} seconds."
+    )
+    with observe_stage("serialization"):
+        content = response_format.image(result, pipeline.detector)
+        content.update(
+            time=round(end_time - start_time, 3),
+            model=pipeline.detector.tag,
+            profile=profile.report(),
+        )
+        return response_format.response(content, pipeline.detector)
+
+
+@router.post(
+    "/object-detection/predict/raw",
+    name="Detect objects in the raw image body.",
+    description="Returns a list of localized object annotations for image sent as application/octet-stream body.",
+    response_model=PredictResponse,
+    responses=MSGPACK_RESPONSES,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            },
+        }
+    },
+)
+async def predict_raw(
+    request: Request,
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    inference_params: InferenceParamsModel = Depends(get_inference_params),
+    profile: RequestProfile = Depends(get_profile),
+    response_format: ResponseFormat = Depends(get_response_format),
+):
+    log.info("Running detection on raw image body...")
+
+    params = pipeline.detector.resolve_params(**inference_params.params())
+    start_time = time.perf_counter()
+    with profile:
+        data = await _read_body(request)
+        result = await pipeline.detect(data, params)
+    end_time = time.perf_counter()
+
+    log.info(
+        f"Finished detection with {len(result.detections)} objects, in {round(end_time-start_time, 3)} seconds."
+    )
+    with observe_stage("serialization"):
+        content = response_format.image(result, pipeline.detector)
+        content.update(
+            time=round(end_time - start_time, 3),
+            model=pipeline.detector.tag,
+            profile=profile.report(),
+        )
+        return response_format.response(content, pipeline.detector)
+
+
+@router.post(
+    "/object-detection/predict/batch/upload",
+    name="Batch detection on multiple uploaded images.",
+    description="Returns a list of localized object annotations for each image uploaded as multipart/form-data file.",
+    response_model=PredictBatchResponse,
+    responses=MSGPACK_RESPONSES,
+)
+async def predict_batch_upload(
+    files: List[UploadFile] = File(...),
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    inference_params: InferenceParamsModel = Depends(get_inference_params),
+    profile: RequestProfile = Depends(get_profile),
+    response_format: ResponseFormat = Depends(get_response_format),
+):
+    log.info(f"Running batch detection on {len(files)} uploaded files...")
+
+    params = pipeline.detector.resolve_params(**inference_params.params())
     start_time = time.perf_counter()
-    for request_image in request.images:
-        detections = detector.predict(request_image)
+    with profile:
+        datas = [await _read_upload(file) for file in files]
+        batch_detections = await pipeline.detect_batch(datas, params)
+    results = []
+    for file, result in zip(files, batch_detections):
+        failed = isinstance(result, Exception)
         results.append(
-            BatchDetectionModel(
-                source=str(request_image.__root__), detections=detections
-            )
+            {
+                "source": file.filename,
+                **response_format.image(
+                    ImageDetections([]) if failed else result, pipeline.detector
+                ),
+                "error": str(result) if failed else None,
+            }
         )
     end_time = time.perf_counter()
 
     log.info(f"Finished batch detection, in {round(end_time-start_time, 3)} seconds.")
-    return PredictBatchResponse(
-        batchResults=results, time=round(end_time - start_time, 3)
+    with observe_stage("serialization"):
+        return response_format.response(
+            {
+                "batchResults": results,
+                "time": round(end_time - start_time, 3),
+                "model": pipeline.detector.tag,
+                "profile": profile.report(),
+            },
+            pipeline.detector,
+        )
+
+
+@router.websocket(
+    "/object-detection/predict/ws", name="Detect objects in stream of frames."
+)
+async def predict_frames(
+    websocket: WebSocket,
+    model: Optional[str] = Query(
+        None, description="Model tag to run, defaults to the active model."
+    ),
+    inference_params: InferenceParamsModel = Depends(get_inference_params),
+    response_format: ResponseFormat = Depends(get_response_format),
+):
+    """Each binary message is an encoded frame, answered by a text message with
+    JSON of its detections as `FrameDetectionModel`, or binary message with
+    MessagePack if requested. Frames arriving faster than they are detected
+    replace the frames still waiting, the response counts dropped frames."""
+    await websocket.accept()
+    try:
+        pipeline = await get_model_manager().get_pipeline(model)
+        params = pipeline.detector.resolve_params(**inference_params.params())
+    except (ModelNotFound, UnknownModelTag, InvalidInferenceParams) as exc:
+        ERRORS.labels(type(exc).__name__).inc()
+        # Close reason is limited to 123 bytes
+        await websocket.close(code=1008, reason=str(exc)[:123])
+        return
+
+    tag = pipeline.detector.tag
+    log.info(f"Started frame stream of model '{tag}'.")
+    frames = FrameQueue(settings.FRAME_MAX_PENDING)
+
+    detector = pipeline.detector
+
+    async def detect_frames():
+        nonlocal detector
+        while True:
+            frame = await frames.get()
+            error = None
+            try:
+                # Frames are not repeated, caching them would evict other results
+                result = await pipeline.detect(frame.data, params, cache=False)
+            except Exception as exc:
+                log.warning(f"Detection of frame {frame.index} failed: {exc}")
+                ERRORS.labels(type(exc).__name__).inc()
+                result, error = ImageDetections([]), str(exc)
+            with observe_stage("serialization"):
+                message = response_format.message(
+                    {
+                        "frame": frame.index,
+                        **response_format.image(result, pipeline.detector),
+                        "time": round(time.perf_counter() - frame.received_at, 3),
+                        "dropped": frames.dropped,
+                        "error": error,
+                    },
+                    # Class names of compact format are listed once, in the first message
+                    detector,
+                )
+            detector = None
+            if response_format.msgpack:
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message.decode())
+
+    workers = [
+        asyncio.ensure_future(detect_frames())
+        for _ in range(settings.FRAME_MAX_IN_FLIGHT)
+    ]
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("bytes")
+            if data is None:
+                await websocket.close(
+                    code=1003, reason="Frames are sent as binary messages."
+                )
+                break
+            if len(data) > settings.UPLOAD_MAX_BYTES:
+                await websocket.close(
+                    code=1009, reason="Frame exceeds the upload size limit."
+                )
+                break
+
+            FRAMES.labels(tag).inc()
+            if frames.put(data):
+                FRAMES_DROPPED.labels(tag).inc()
+    finally:
+        # Detections of remaining frames have no one to go to
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    log.info(
+        f"Finished frame stream, {frames.received} frames received, {frames.dropped} dropped."
+    )
+
+
+@router.get(
+    "/object-detection/scheduler",
+    name="Inference scheduler statistics.",
+    description="Returns queue depth and batching statistics of the micro-batching scheduler.",
+    response_model=SchedulerStatsModel,
+)
+async def scheduler_stats(pipeline: InferencePipeline = Depends(get_pipeline)):
+    return pipeline.scheduler.stats()
+
+
+@router.post(
+    "/jobs",
+    name="Submit batch detection job.",
+    description="Queues images for detection in the background, returns job to poll for progress and page through results.",
+    response_model=JobModel,
+    status_code=202,
+)
+async def submit_job(
+    request: PredictBatchRequest,
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    job_manager: JobManager = Depends(get_job_manager),
+):
+    return await _submit_job(request.images, request, pipeline, job_manager)
+
+
+@router.post(
+    "/jobs/upload",
+    name="Submit batch detection job from file.",
+    description="Queues images of uploaded JSON lines file for detection in the background, one request body with `image` or `images` per line.",
+    response_model=JobModel,
+    status_code=202,
+)
+async def submit_job_upload(
+    file: UploadFile = File(...),
+    pipeline: InferencePipeline = Depends(get_pipeline),
+    inference_params: InferenceParamsModel = Depends(get_inference_params),
+    job_manager: JobManager = Depends(get_job_manager),
+):
+    images = await run_io(_read_jobs_file, file)
+    return await _submit_job(images, inference_params, pipeline, job_manager)
+
+
+@router.get(
+    "/jobs/{job_id}",
+    name="Job status.",
+    description="Returns status and progress of batch detection job.",
+    response_model=JobModel,
+)
+async def get_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    return await job_manager.get(job_id)
+
+
+@router.get(
+    "/jobs/{job_id}/results",
+    name="Job results.",
+    description="Returns page of processed images of batch detection job, in image order.",
+    response_model=JobResultsModel,
+)
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    job_manager: JobManager = Depends(get_job_manager),
+):
+    return ORJSONResponse(await job_manager.results(job_id, offset, limit))
+
+
+@router.post(
+    "/jobs/{job_id}/cancel",
+    name="Cancel job.",
+    description="Stops queued or running batch detection job, already processed images are kept.",
+    response_model=JobModel,
+)
+async def cancel_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    return await job_manager.cancel(job_id)
+
+
+@router.get(
+    "/models",
+    name="List resident models.",
+    description="Returns models loaded in memory, marking the default one.",
+    response_model=List[ModelModel],
+)
+async def list_models(manager: ModelManager = Depends(get_model_manager)):
+    return manager.models()
+
+
+@router.post(
+    "/models/{tag}/activate",
+    name="Activate model.",
+    description="Loads model in the background and makes it the default model once loaded, requires X-Admin-Token header.",
+    status_code=202,
+    dependencies=[Depends(require_admin)],
+)
+async def activate_model(tag: str, manager: ModelManager = Depends(get_model_manager)):
+    manager.activate_in_background(tag)
+    return {"message": f"Activating model '{tag}'."}
+
+
+async def _stream_detections(
+    request: PredictBatchRequest,
+    pipeline: InferencePipeline,
+    fetcher: ImageFetcher,
+    params: InferenceParams,
+    response_format: ResponseFormat,
+) -> AsyncIterator[bytes]:
+    start_time = time.perf_counter()
+    # Image bytes are not echoed back, they are referred to by their position
+    sources = [
+        request_image.__root__
+        if isinstance(request_image, ImageURL)
+        else f"images[{i}]"
+        for i, request_image in enumerate(request.images)
+    ]
+
+    def reads():
+        # Drop images from the request as they are read, so that each image
+        # is released once detected
+        for i, request_image in enumerate(request.images):
+            request.images[i] = None
+            yield partial(request_image.read, fetcher)
+
+    separator = b"" if response_format.msgpack else b"\n"
+    detector = pipeline.detector
+    async for i, result in pipeline.detect_as_completed(
+        reads(), params, settings.STREAM_MAX_CONCURRENCY
+    ):
+        failed = isinstance(result, Exception)
+        with observe_stage("serialization"):
+            line = response_format.message(
+                {
+                    "source": sources[i],
+                    **response_format.image(
+                        ImageDetections([]) if failed else result, pipeline.detector
+                    ),
+                    "error": str(result) if failed else None,
+                    "index": i,
+                },
+                # Class names of compact format are listed once, in the first line
+                detector,
+            )
+        detector = None
+        yield line + separator
+
+    log.info(
+        f"Finished streamed batch detection, in {round(time.perf_counter()-start_time, 3)} seconds."
+    )
+
+
+async def _submit_job(
+    images: List[BaseImageModel],
+    inference_params: InferenceParamsModel,
+    pipeline: InferencePipeline,
+    job_manager: JobManager,
+) -> dict:
+    if len(images) > settings.JOB_MAX_IMAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Job exceeds the limit of {settings.JOB_MAX_IMAGES} images.",
+        )
+    # Invalid parameters are rejected now rather than failing the job later
+    pipeline.detector.resolve_params(**inference_params.params())
+    return await job_manager.submit(
+        images, pipeline.detector.tag, inference_params.params()
     )
+
+
+def _read_jobs_file(file: UploadFile) -> List[BaseImageModel]:
+    images = []
+    for number, line in enumerate(file.file, 1):
+        if not line.strip():
+            continue
+        try:
+            body = json.loads(line)
+            if "image" in body:
+                images.append(PredictRequest.parse_obj(body).image)
+            else:
+                images += PredictBatchRequest.parse_obj(body).images
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid request on line {number} of '{file.filename}': {exc}",
+            )
+        if len(images) > settings.JOB_MAX_IMAGES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Job exceeds the limit of {settings.JOB_MAX_IMAGES} images.",
+            )
+    return images
+
+
+async def _read_image(
+    image: BaseImageModel, fetcher: ImageFetcher
+) -> Union[bytes, ImageFetchError, InvalidImage]:
+    try:
+        return await image.read(fetcher)
+    except (ImageFetchError, InvalidImage) as exc:
+        log.warning(str(exc))
+        ERRORS.labels(type(exc).__name__).inc()
+        return exc
+
+
+@router.get(
+    "/object-detection/cache",
+    name="Result cache statistics.",
+    description="Returns size and hit/miss counters of the detection result cache.",
+    response_model=CacheStatsModel,
+)
+async def cache_stats(result_cache: ResultCache = Depends(get_result_cache)):
+    return result_cache.stats()
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    data = await file.read(settings.UPLOAD_MAX_BYTES + 1)
+    if len(data) > settings.UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File '{file.filename}' exceeds the size limit of {settings.UPLOAD_MAX_BYTES} bytes.",
+        )
+    return data
+
+
+async def _read_body(request: Request) -> bytes:
+    # Chunks are joined once at the end rather than copied into a growing buffer
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > settings.UPLOAD_MAX_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request body exceeds the size limit of {settings.UPLOAD_MAX_BYTES} bytes.",
+            )
+    return b"".join(chunks)
@@ -1,33 +1,39 @@
 from abc import ABC, abstractmethod
 import base64
-from io import BytesIO
-from typing import Any, Dict, List, Union
-from pydantic import BaseModel, constr, conbytes
+import binascii
+from typing import Any, Dict, List, Optional, Union
+from pydantic import BaseModel, confloat, conint, constr, conbytes
 
-from PIL import Image
-import requests
+from src.config import settings
+from src.exceptions import InvalidImage
+from src.modules.fetcher import ImageFetcher
+from src.modules.metrics import observe_stage
 
 UrlType = constr(regex="(https|http)?:\/\/.+")
 
 
 class BaseImageModel(ABC, BaseModel):
     @abstractmethod
-    def to_pil_image(self) -> Image:
+    async def read(self, fetcher: ImageFetcher) -> bytes:
         return NotImplementedError
 
 
 class ImageURL(BaseImageModel):
     __root__: UrlType
 
-    def to_pil_image(self) -> Image:
-        return Image.open(BytesIO(requests.get(self.__root__).content)).convert("RGB")
+    async def read(self, fetcher: ImageFetcher) -> bytes:
+        return await fetcher.fetch(self.__root__)
 
 
 class ImageBytes(BaseImageModel):
     __root__: bytes
 
-    def to_pil_image(self) -> Image:
-        return Image.open(BytesIO(base64.b64decode(self.__root__))).convert("RGB")
+    async def read(self, fetcher: ImageFetcher) -> bytes:
+        with observe_stage("base64_decode"):
+            try:
+                return base64.b64decode(self.__root__)
+            except binascii.Error as exc:
+                raise InvalidImage(f"Invalid base64 image data: {exc}")
 
 
 class CoordinatesModel(BaseModel):
@@ -44,21 +50,124 @@ class DetectionModel(BaseModel):
 class BatchDetectionModel(BaseModel):
     source: str
     detections: List[DetectionModel]
-
-
-class PredictRequest(BaseModel):
+    truncated: bool = False
+    error: Optional[str] = None
+
+
+class IndexedDetectionModel(BatchDetectionModel):
+    # Position of the image in the request, results may come in completion order
+    index: int
+
+
+class FrameDetectionModel(BaseModel):
+    # Position of the frame in the stream, including dropped frames
+    frame: int
+    detections: List[DetectionModel] = []
+    truncated: bool = False
+    # Seconds since the frame was received
+    time: float = 0.0
+    # Frames of the stream dropped so far, replaced by newer frames
+    dropped: int = 0
+    error: Optional[str] = None
+
+
+class InferenceParamsModel(BaseModel):
+    confidence: Optional[confloat(ge=0, le=1)] = None
+    iou: Optional[confloat(ge=0, le=1)] = None
+    # Class names or ids to detect, all classes if not set
+    classes: Optional[List[Union[conint(ge=0), str]]] = None
+    maxDetections: Optional[conint(ge=1, le=settings.MAX_DETECTIONS)] = None
+    # Multiple of the model stride
+    imgSize: Optional[
+        conint(ge=settings.MIN_IMG_SIZE, le=settings.MAX_IMG_SIZE, multiple_of=32)
+    ] = None
+    # Detect in overlapping tiles of full resolution image, for very large images
+    tiled: Optional[bool] = None
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "confidence": self.confidence,
+            "iou": self.iou,
+            "classes": self.classes,
+            "max_detections": self.maxDetections,
+            "img_size": self.imgSize,
+            "tiled": self.tiled,
+        }
+
+
+class PredictRequest(InferenceParamsModel):
     image: Union[ImageURL, ImageBytes]
 
 
-class PredictBatchRequest(BaseModel):
+class PredictBatchRequest(InferenceParamsModel):
     images: List[Union[ImageURL, ImageBytes]]
 
 
+class ProfileModel(BaseModel):
+    stages: Dict[str, float]
+    total: float
+    traces: List[str] = []
+
+
 class PredictResponse(BaseModel):
     detections: List[DetectionModel]
+    truncated: bool = False
     time: float
+    model: str
+    profile: Optional[ProfileModel] = None
 
 
 class PredictBatchResponse(BaseModel):
     batchResults: List[BatchDetectionModel]
     time: float
+    model: str
+    profile: Optional[ProfileModel] = None
+
+
+class SchedulerStatsModel(BaseModel):
+    queueDepth: int
+    maxQueueSize: int
+    maxBatchSize: int
+    maxWaitMs: float
+    batches: int
+    images: int
+    averageBatchSize: float
+
+
+class CacheStatsModel(BaseModel):
+    entries: int
+    maxEntries: int
+    hits: int
+    misses: int
+    hitRate: float
+
+
+class ModelModel(BaseModel):
+    tag: str
+    backend: str
+    precision: str
+    sizeMb: float
+    default: bool
+
+
+class JobModel(BaseModel):
+    id: str
+    status: str
+    model: str
+    total: int
+    processed: int
+    failed: int
+    progress: float
+    error: Optional[str] = None
+    createdAt: float
+    startedAt: Optional[float] = None
+    finishedAt: Optional[float] = None
+
+
+class JobResultsModel(BaseModel):
+    id: str
+    status: str
+    offset: int
+    limit: int
+    processed: int
+    results: List[IndexedDetectionModel]
@@ -0,0 +1,12 @@
+import pytest
+
+from benchmarks.synthetic import build_model
+from src.modules.detector import Detector
+from src.modules.model import Model
+
+
+@pytest.fixture
+def detector(tmp_path):
+    build_model(str(tmp_path), "synthetic", num_classes=4)
+    model = Model(model_root=str(tmp_path), tag="synthetic", backend="torchscript")
+    return Detector(model=model, shape_buckets=[0.6, 0.75])
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from src.exceptions import SchedulerOverloaded
+from src.modules.batching import BatchScheduler
+from src.modules.detector import ImageDetections, InferenceParams
+
+PARAMS = InferenceParams(0.15, 0.25, None, 300, 640)
+
+
+class FakeDetector:
+    """Detects images given as (name, shape), recording names of each batch.
+
+    Inference blocks while `gate` is cleared, keeping the scheduler busy.
+    """
+
+    tag = "fake"
+    backend = "torchscript"
+    default_params = PARAMS
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def preprocess(self, image, img_size):
+        name, shape = image
+        return np.zeros(shape, np.uint8), name
+
+    def infer(self, imgs, img0s, params):
+        self.batches.append(list(img0s))
+        self.gate.wait()
+        return [ImageDetections([{"name": name}]) for name in img0s]
+
+
+def image(name, shape=(480, 640, 3)):
+    return name, shape
+
+
+async def gather(*coros):
+    return await asyncio.gather(*coros)
+
+
+async def until(condition):
+    while not condition():
+        await asyncio.sleep(0.001)
+
+
+def run(scheduler, coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            scheduler.detector.gate.set()
+            await scheduler.stop()
+
+    return asyncio.run(main())
+
+
+class TestBatchScheduler:
+    def test_batches_up_to_max_batch_size(self):
+        scheduler = BatchScheduler(FakeDetector(), max_batch_size=4, max_wait_ms=50)
+        results = run(
+            scheduler,
+            gather(*(scheduler.submit(image(i)) for i in range(10))),
+        )
+        assert [result.detections[0]["name"] for result in results] == list(range(10))
+        assert [len(batch) for batch in scheduler.detector.batches] == [4, 4, 2]
+
+    def test_flushes_after_max_wait(self):
+        scheduler = BatchScheduler(FakeDetector(), max_batch_size=8, max_wait_ms=50)
+
+        async def submit():
+            loop = asyncio.get_running_loop()
+            start_time = loop.time()
+            await scheduler.submit(image("a"))
+            return loop.time() - start_time
+
+        elapsed = run(scheduler, submit())
+        assert 0.05 <= elapsed < 0.5
+        assert scheduler.detector.batches == [["a"]]
+
+    def test_full_queue_is_overloaded(self):
+        detector = FakeDetector()
+        scheduler = BatchScheduler(detector, max_wait_ms=1, max_queue_size=2)
+
+        async def submit():
+            detector.gate.clear()
+            running = asyncio.ensure_future(scheduler.submit(image("a")))
+            await until(lambda: detector.batches)
+            queued = [
+                asyncio.ensure_future(scheduler.submit(image(name)))
+                for name in ("b", "c")
+            ]
+            await until(lambda: scheduler.queue_depth == 2)
+            with pytest.raises(SchedulerOverloaded):
+                await scheduler.submit(image("d"))
+            detector.gate.set()
+            await asyncio.gather(running, *queued)
+
+        run(scheduler, submit())
+        assert sorted(sum(scheduler.detector.batches, [])) == ["a", "b", "c"]
+
+    def test_cancelled_requests_are_skipped(self):
+        detector = FakeDetector()
+        scheduler = BatchScheduler(detector, max_wait_ms=1)
+
+        async def submit():
+            detector.gate.clear()
+            running = asyncio.ensure_future(scheduler.submit(image("a")))
+            await until(lambda: detector.batches)
+            cancelled = asyncio.ensure_future(scheduler.submit(image("b")))
+            queued = asyncio.ensure_future(scheduler.submit(image("c")))
+            await until(lambda: scheduler.queue_depth == 2)
+            cancelled.cancel()
+            detector.gate.set()
+            await asyncio.gather(running, queued)
+
+        run(scheduler, submit())
+        assert detector.batches == [["a"], ["c"]]
+
+    def test_groups_by_params_and_shape(self):
+        scheduler = BatchScheduler(
+            FakeDetector(), max_wait_ms=50, max_concurrent_batches=3
+        )
+        other_params = PARAMS._replace(confidence=0.5)
+        run(
+            scheduler,
+            gather(
+                scheduler.submit(image("a")),
+                scheduler.submit(image("b", (640, 480, 3))),
+                scheduler.submit(image("c"), other_params),
+                scheduler.submit(image("d")),
+            ),
+        )
+        batches = sorted(sorted(batch) for batch in scheduler.detector.batches)
+        assert batches == [["a", "d"], ["b"], ["c"]]
+
+    def test_interactive_before_bulk(self):
+        detector = FakeDetector()
+        scheduler = BatchScheduler(detector, max_batch_size=1, max_wait_ms=1)
+
+        async def submit():
+            detector.gate.clear()
+            running = asyncio.ensure_future(scheduler.submit(image("a")))
+            await until(lambda: detector.batches)
+            # Queued one by one, as images are preprocessed concurrently
+            queued = []
+            for name, bulk in (("bulk1", True), ("bulk2", True), ("b", False)):
+                queued.append(
+                    asyncio.ensure_future(scheduler.submit(image(name), bulk=bulk))
+                )
+                await until(lambda: scheduler.queue_depth == len(queued))
+            detector.gate.set()
+            await asyncio.gather(running, *queued)
+
+        run(scheduler, submit())
+        assert detector.batches == [["a"], ["b"], ["bulk1"], ["bulk2"]]
+
+    def test_drain_waits_for_running_batches(self):
+        detector = FakeDetector()
+        scheduler = BatchScheduler(detector, max_wait_ms=1)
+
+        async def submit():
+            detector.gate.clear()
+            running = asyncio.ensure_future(scheduler.submit(image("a")))
+            await until(lambda: detector.batches)
+            stopping = asyncio.ensure_future(scheduler.stop(drain=True))
+            await asyncio.sleep(0.05)
+            assert not stopping.done()
+            detector.gate.set()
+            await stopping
+            return await running
+
+        result = run(scheduler, submit())
+        assert result.detections == [{"name": "a"}]
+        assert not scheduler._batch_tasks
+
+    def test_stop_cancels_running_batches(self):
+        detector = FakeDetector()
+        scheduler = BatchScheduler(detector, max_wait_ms=1)
+
+        async def submit():
+            detector.gate.clear()
+            running = asyncio.ensure_future(scheduler.submit(image("a")))
+            await until(lambda: detector.batches)
+            await scheduler.stop()
+            assert not scheduler._batch_tasks
+            with pytest.raises(SchedulerOverloaded):
+                await running
+
+        run(scheduler, submit())
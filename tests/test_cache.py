@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from src.modules.cache import ResultCache
+from src.modules.detector import ImageDetections, InferenceParams
+
+DETECTOR = SimpleNamespace(
+    tag="latest",
+    backend="torchscript",
+    precision="fp32",
+)
+PARAMS = InferenceParams(
+    confidence=0.15, iou=0.25, classes=None, max_detections=300, img_size=640
+)
+DETECTIONS = ImageDetections([[0.1, 0.2, 0.3, 0.4, 0.9, 0]])
+
+
+class TestResultCache:
+    def test_lookup_miss_then_hit(self):
+        cache = ResultCache(max_entries=2)
+        key, detections = cache.lookup(b"image", DETECTOR, PARAMS)
+        assert detections is None
+
+        cache.put(key, DETECTIONS)
+        assert cache.lookup(b"image", DETECTOR, PARAMS) == (key, DETECTIONS)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_key_depends_on_inference_params(self):
+        key = ResultCache.key(b"image", DETECTOR, PARAMS)
+        assert key != ResultCache.key(b"image", DETECTOR, PARAMS._replace(iou=0.5))
+        assert key != ResultCache.key(
+            b"image", DETECTOR, PARAMS._replace(classes=(0, 56))
+        )
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        cache.put("a", DETECTIONS)
+        cache.put("b", DETECTIONS)
+        cache.get("a")
+        cache.put("c", DETECTIONS)
+        assert cache.get("b") is None
+        assert cache.get("a") == DETECTIONS
+
+    def test_ttl_expiry(self):
+        cache = ResultCache(max_entries=2, ttl=-1)
+        cache.put("a", DETECTIONS)
+        assert cache.get("a") is None
+
+    def test_disk_backend(self, tmp_path):
+        ResultCache(disk_dir=str(tmp_path)).put("abc", DETECTIONS)
+        assert ResultCache(disk_dir=str(tmp_path)).get("abc") == DETECTIONS
+
+    def test_disabled(self):
+        cache = ResultCache(max_entries=0)
+        assert cache.lookup(b"image", DETECTOR, PARAMS) == ("", None)
@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.exceptions import ImageFetchError
+from src.modules.fetcher import ImageFetcher
+
+IMAGE = b"\xff\xd8" + b"\x00" * 1024
+
+
+async def handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/image.jpg":
+        return httpx.Response(200, content=IMAGE)
+    if request.url.path == "/slow.jpg":
+        await asyncio.sleep(1)
+        return httpx.Response(200, content=IMAGE)
+    return httpx.Response(404)
+
+
+@pytest.fixture
+def fetcher():
+    return ImageFetcher(
+        timeout=0.2, max_bytes=2048, transport=httpx.MockTransport(handler)
+    )
+
+
+class TestImageFetcher:
+    def test_fetch(self, fetcher):
+        assert asyncio.run(fetcher.fetch("http://images/image.jpg")) == IMAGE
+
+    def test_fetch_too_large(self, fetcher):
+        fetcher.max_bytes = 512
+        with pytest.raises(ImageFetchError, match="size limit"):
+            asyncio.run(fetcher.fetch("http://images/image.jpg"))
+
+    def test_fetch_timeout(self, fetcher):
+        with pytest.raises(ImageFetchError, match="Timed out"):
+            asyncio.run(fetcher.fetch("http://images/slow.jpg"))
+
+    def test_fetch_status(self, fetcher):
+        with pytest.raises(ImageFetchError, match="404"):
+            asyncio.run(fetcher.fetch("http://images/missing.jpg"))
+
+    def test_aclose(self, fetcher):
+        async def run():
+            fetcher.start()
+            client = fetcher._client
+            await fetcher.fetch("http://images/image.jpg")
+            await fetcher.aclose()
+            return client
+
+        assert asyncio.run(run()).is_closed
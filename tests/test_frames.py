@@ -0,0 +1,27 @@
+import asyncio
+
+from src.modules.frames import FrameQueue
+
+
+class TestFrameQueue:
+    def test_oldest_pending_frames_are_dropped(self):
+        async def run():
+            frames = FrameQueue(max_pending=2)
+            dropped = [frames.put(data) for data in (b"0", b"1", b"2", b"3")]
+            return dropped, [await frames.get() for _ in range(2)], frames
+
+        dropped, taken, frames = asyncio.run(run())
+        assert dropped == [False, False, True, True]
+        assert [(frame.index, frame.data) for frame in taken] == [(2, b"2"), (3, b"3")]
+        assert (frames.received, frames.dropped) == (4, 2)
+
+    def test_get_waits_for_next_frame(self):
+        async def run():
+            frames = FrameQueue()
+            task = asyncio.ensure_future(frames.get())
+            await asyncio.sleep(0)
+            assert not task.done()
+            frames.put(b"0")
+            return await asyncio.wait_for(task, 1)
+
+        assert asyncio.run(run()).data == b"0"
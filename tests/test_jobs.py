@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import fcntl
+from types import SimpleNamespace
+
+from src.exceptions import ImageFetchError
+from src.modules.cache import ResultCache
+from src.modules.detector import ImageDetections
+from src.modules.jobs import COMPLETED, CANCELLED, RUNNING, JobManager, JobStore
+from src.modules.pipeline import InferencePipeline
+from src.schemas import ImageBytes, ImageURL
+
+from tests.test_pipeline import FakeScheduler
+
+IMAGES = [
+    ImageBytes(__root__=base64.b64encode(b"1")),
+    ImageURL(__root__="http://images/2.jpg"),
+    ImageBytes(__root__=base64.b64encode(b"3")),
+]
+
+
+class FakeFetcher:
+    async def fetch(self, url):
+        return url.rsplit("/", 1)[1].split(".")[0].encode()
+
+
+def job_manager(store: JobStore, **options) -> JobManager:
+    scheduler = FakeScheduler()
+    scheduler.detector.resolve_params = lambda **params: None
+    pipeline = InferencePipeline(scheduler, ResultCache(max_entries=0))
+
+    async def get_pipeline(tag):
+        return pipeline
+
+    return JobManager(
+        store,
+        SimpleNamespace(get_pipeline=get_pipeline),
+        FakeFetcher(),
+        page_size=2,
+        **options,
+    )
+
+
+async def wait_for_job(manager: JobManager, job_id: str):
+    while (await manager.get(job_id))["status"] in ("queued", "running"):
+        await asyncio.sleep(0.01)
+    return await manager.get(job_id)
+
+
+class TestJobStore:
+    def test_results_in_image_order(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.db"))
+        store.create("job", "latest", {}, IMAGES)
+        assert [idx for idx, _ in store.pending("job")] == [0, 1, 2]
+
+        store.save_result("job", 2, ImageDetections([{"name": "3"}]))
+        store.save_result("job", 0, ImageFetchError("Fetching image failed."))
+        assert [idx for idx, _ in store.pending("job")] == [1]
+        assert store.get("job")["processed"] == 2
+        assert store.get("job")["failed"] == 1
+
+        results = store.results("job")
+        assert [result["index"] for result in results] == [0, 2]
+        assert results[0]["error"] == "Fetching image failed."
+        assert results[1]["detections"] == [{"name": "3"}]
+
+
+class TestJobManager:
+    def test_processes_job(self, tmp_path):
+        async def run():
+            manager = job_manager(JobStore(str(tmp_path / "jobs.db")))
+            await manager.start()
+            job = await manager.submit(IMAGES, "latest", {})
+            job = await wait_for_job(manager, job["id"])
+            results = await manager.results(job["id"], offset=1, limit=5)
+            await manager.stop()
+            return job, results
+
+        job, results = asyncio.run(run())
+        assert (job["status"], job["processed"], job["progress"]) == (COMPLETED, 3, 1)
+        assert [result["detections"][0]["name"] for result in results["results"]] == [
+            "2",
+            "3",
+        ]
+        assert results["results"][0]["source"] == "http://images/2.jpg"
+
+    def test_cancel_queued_job(self, tmp_path):
+        async def run():
+            manager = job_manager(JobStore(str(tmp_path / "jobs.db")))
+            await manager.start()
+            await manager.stop()
+            job = await manager.submit(IMAGES, "latest", {})
+            return await manager.cancel(job["id"])
+
+        job = asyncio.run(run())
+        assert (job["status"], job["processed"]) == (CANCELLED, 0)
+
+    def test_resumes_unfinished_jobs(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.db"))
+        store.create("job", "latest", {}, IMAGES)
+        assert store.claim_next() == "job"
+        assert store.save_result("job", 0, ImageDetections([{"name": "1"}])) == RUNNING
+
+        async def run():
+            manager = job_manager(store)
+            await manager.start()
+            job = await wait_for_job(manager, "job")
+            await manager.stop()
+            return job
+
+        job = asyncio.run(run())
+        assert (job["status"], job["processed"]) == (COMPLETED, 3)
+
+    def test_jobs_run_by_single_process(self, tmp_path):
+        async def run():
+            running = job_manager(JobStore(str(tmp_path / "jobs.db")))
+            other = job_manager(JobStore(str(tmp_path / "jobs.db")))
+            await running.start()
+            await other.start()
+            job = await other.submit(IMAGES, "latest", {})
+            job = await wait_for_job(other, job["id"])
+            workers = len(running._tasks), len(other._tasks)
+            await running.stop()
+            await other.stop()
+            return job, workers
+
+        job, workers = asyncio.run(run())
+        assert job["status"] == COMPLETED
+        assert workers == (1, 0)
+
+    def test_takes_over_jobs_once_lock_is_released(self, tmp_path):
+        store = JobStore(str(tmp_path / "jobs.db"))
+        # Held by another process, which exits with a job left running
+        lock_file = open(f"{store.path}.lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        store.create("job", "latest", {}, IMAGES)
+        assert store.claim_next() == "job"
+
+        async def run():
+            manager = job_manager(store, poll_interval=0.01)
+            await manager.start()
+            assert not manager._tasks
+            lock_file.close()
+            job = await wait_for_job(manager, "job")
+            workers = len(manager._tasks)
+            await manager.stop()
+            return job, workers
+
+        job, workers = asyncio.run(run())
+        assert job["status"] == COMPLETED
+        assert workers == 1
@@ -0,0 +1,83 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import torch
+from prometheus_client import REGISTRY
+
+from src.modules.cache import ResultCache
+from src.modules.metrics import observe_stage
+import src.modules.metrics
+from src.modules.profiling import RequestProfile, record_trace
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetrics:
+    def test_observe_stage(self):
+        before = sample("stage_duration_seconds_count", stage="test")
+        with observe_stage("test"):
+            pass
+        assert sample("stage_duration_seconds_count", stage="test") == before + 1
+
+    def test_cache_counters(self):
+        hits, misses = (
+            sample("result_cache_hits_total"),
+            sample("result_cache_misses_total"),
+        )
+        cache = ResultCache(max_entries=2)
+        cache.get("a")
+        cache.put("a", [])
+        cache.get("a")
+        assert sample("result_cache_hits_total") == hits + 1
+        assert sample("result_cache_misses_total") == misses + 1
+
+    def test_request_profile_collects_stages(self):
+        profile = RequestProfile(enabled=True)
+        with profile:
+            with observe_stage("test"):
+                pass
+        with observe_stage("other"):
+            pass
+        report = profile.report()
+        assert list(report["stages"]) == ["test"]
+        assert report["total"] >= report["stages"]["test"]
+
+    def test_disabled_profile_reports_nothing(self):
+        with RequestProfile() as profile:
+            with observe_stage("test"):
+                pass
+        assert profile.report() is None
+
+    def test_stages_from_concurrent_threads(self, monkeypatch):
+        # Each stage takes one second by the clock of its thread
+        clocks = threading.local()
+
+        def perf_counter():
+            clocks.now = getattr(clocks, "now", 0) + 1
+            return clocks.now
+
+        monkeypatch.setattr(
+            src.modules.metrics, "time", SimpleNamespace(perf_counter=perf_counter)
+        )
+
+        def observe():
+            for _ in range(1000):
+                with observe_stage("test"):
+                    pass
+
+        with RequestProfile(enabled=True) as profile:
+            with ThreadPoolExecutor(8) as executor:
+                for _ in range(8):
+                    executor.submit(contextvars.copy_context().run, observe)
+        assert profile.timings["test"] == 8000
+
+    def test_old_traces_are_removed(self, tmp_path):
+        for _ in range(3):
+            with RequestProfile(trace=True, trace_dir=str(tmp_path), max_traces=2):
+                with record_trace():
+                    torch.ones(4).sum()
+        assert len(list(tmp_path.glob("*.json"))) == 2
@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.synthetic import build_model, build_onnx_model, synthetic_image
+from src.modules.detector import Detector
+from src.modules.model import Model
+from src.modules.quantization import compare_detections
+
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+
+def detect(detector, datas):
+    imgs, imgs0 = zip(*(detector.preprocess(data) for data in datas))
+    return [result.detections for result in detector.infer(list(imgs), list(imgs0))]
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    build_model(str(tmp_path), "synthetic", num_classes=4)
+    model = Model(model_root=str(tmp_path), tag="synthetic", backend="torchscript")
+    return Detector(model=model)
+
+
+@pytest.fixture
+def datas():
+    return [synthetic_image(640, 480, seed=seed) for seed in range(3)]
+
+
+@pytest.mark.parametrize("batch_size", [None, 1], ids=["dynamic", "fixed"])
+def test_onnx_matches_torchscript(tmp_path, baseline, datas, batch_size):
+    build_onnx_model(str(tmp_path), "onnx", num_classes=4, batch_size=batch_size)
+    model = Model(model_root=str(tmp_path), tag="onnx", backend="onnx")
+    detector = Detector(model=model)
+    assert detector.class_names == baseline.class_names
+    # Fixed batch size model runs batches image by image
+    assert detector.model.batch_size == batch_size
+
+    expected = detect(baseline, datas)
+    report = compare_detections(expected, detect(detector, datas))
+    assert sum(map(len, expected))
+    assert report["precision"] == report["recall"] == 1.0
+    assert report["meanScoreDiff"] < 1e-3
@@ -0,0 +1,58 @@
+import pytest
+
+from benchmarks.synthetic import synthetic_image
+from src.exceptions import InvalidInferenceParams
+import src.modules.detector
+
+
+def detect(detector, params):
+    img, img0 = detector.preprocess(synthetic_image(640, 480), params.img_size)
+    return detector.infer([img], [img0], params)[0]
+
+
+class TestResolveParams:
+    def test_defaults(self, detector):
+        assert detector.resolve_params() == detector.default_params
+
+    def test_class_names_and_ids(self, detector):
+        params = detector.resolve_params(classes=["class3", 1, "3"])
+        assert params.classes == (1, 3)
+
+    def test_empty_classes_select_all(self, detector):
+        assert detector.resolve_params(classes=[]).classes is None
+
+    @pytest.mark.parametrize("classes", [["dog"], [4], ["7"]])
+    def test_unknown_classes(self, detector, classes):
+        with pytest.raises(InvalidInferenceParams):
+            detector.resolve_params(classes=classes)
+
+    def test_img_size_not_multiple_of_stride(self, detector):
+        with pytest.raises(InvalidInferenceParams):
+            detector.resolve_params(img_size=500)
+
+
+class TestParamsPassedToNMS:
+    def test_nms_arguments(self, detector, monkeypatch):
+        calls = []
+        nms = src.modules.detector.non_max_suppression
+        monkeypatch.setattr(
+            src.modules.detector,
+            "non_max_suppression",
+            lambda *args, **kwargs: calls.append(kwargs) or nms(*args, **kwargs),
+        )
+        params = detector.resolve_params(
+            confidence=0.5, iou=0.3, classes=["class1"], max_detections=7
+        )
+        detect(detector, params)
+        assert calls == [dict(conf_thres=0.5, iou_thres=0.3, classes=(1,), max_det=7)]
+
+    def test_detections_follow_params(self, detector):
+        params = detector.resolve_params(classes=["class2"], max_detections=5)
+        result = detect(detector, params)
+        assert len(result.detections) == 5
+        assert result.truncated
+        assert {detection[5] for detection in result.detections} == {2}
+
+    def test_empty_classes_detect_all(self, detector):
+        result = detect(detector, detector.resolve_params(classes=[]))
+        assert len({detection[5] for detection in result.detections}) > 1
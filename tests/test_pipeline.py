@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+from benchmarks.synthetic import synthetic_image
+from src.exceptions import ImageFetchError, InvalidImage, SchedulerOverloaded
+from src.modules.cache import ResultCache
+from src.modules.detector import ImageDetections, InferenceParams
+from src.modules.pipeline import InferencePipeline
+import src.modules.pipeline
+
+
+def detections(data: bytes):
+    return [[0.0, 0.0, 1.0, 1.0, 0.5, int(data)]]
+
+
+class FakeScheduler:
+    """Detects images after a delay given by their content, tracking concurrency."""
+
+    def __init__(self):
+        self.detector = SimpleNamespace(
+            tag="latest",
+            default_params=InferenceParams(0.15, 0.25, None, 300, 640),
+            class_names=None,
+        )
+        self.running = self.max_running = 0
+
+    async def submit(self, data, params, bulk=False):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(int(data) / 100)
+        self.running -= 1
+        return ImageDetections(detections(data))
+
+
+class OverloadedScheduler(FakeScheduler):
+    """Rejects the first `overloads` images as with a full queue."""
+
+    def __init__(self, overloads):
+        super().__init__()
+        self.overloads = overloads
+
+    async def submit(self, data, params, bulk=False):
+        if self.overloads:
+            self.overloads -= 1
+            raise SchedulerOverloaded("Inference queue is full.")
+        return await super().submit(data, params, bulk)
+
+
+def read(data: bytes):
+    async def read():
+        return data
+
+    return read
+
+
+async def fail():
+    raise ImageFetchError("Fetching image failed.")
+
+
+def detect_as_completed(pipeline, reads, max_concurrency, bulk=False):
+    async def collect():
+        return [
+            result
+            async for result in pipeline.detect_as_completed(
+                reads, max_concurrency=max_concurrency, bulk=bulk
+            )
+        ]
+
+    return asyncio.run(collect())
+
+
+class TestDetectAsCompleted:
+    def test_yields_in_completion_order(self):
+        scheduler = FakeScheduler()
+        pipeline = InferencePipeline(scheduler, ResultCache(max_entries=0))
+        results = detect_as_completed(
+            pipeline, [read(b"3"), read(b"1"), read(b"2")], max_concurrency=3
+        )
+        assert [i for i, _ in results] == [1, 2, 0]
+        assert results[0][1].detections == detections(b"1")
+
+    def test_limits_concurrency(self):
+        scheduler = FakeScheduler()
+        pipeline = InferencePipeline(scheduler, ResultCache(max_entries=0))
+        results = detect_as_completed(
+            pipeline, [read(b"1") for _ in range(5)], max_concurrency=2
+        )
+        assert sorted(i for i, _ in results) == [0, 1, 2, 3, 4]
+        assert scheduler.max_running == 2
+
+    def test_failed_images_yield_exception(self):
+        pipeline = InferencePipeline(FakeScheduler(), ResultCache(max_entries=0))
+        results = dict(detect_as_completed(pipeline, [fail, read(b"1")], 2))
+        assert isinstance(results[0], ImageFetchError)
+        assert results[1].detections == detections(b"1")
+
+    def test_bulk_images_are_retried_when_overloaded(self, monkeypatch):
+        monkeypatch.setattr(src.modules.pipeline, "OVERLOAD_RETRY_DELAY", 0.001)
+        scheduler = OverloadedScheduler(overloads=3)
+        pipeline = InferencePipeline(scheduler, ResultCache(max_entries=0))
+        results = dict(detect_as_completed(pipeline, [read(b"1")], 1, bulk=True))
+        assert results[0].detections == detections(b"1")
+        assert scheduler.overloads == 0
+
+    def test_interactive_images_are_not_retried(self):
+        pipeline = InferencePipeline(
+            OverloadedScheduler(overloads=1), ResultCache(max_entries=0)
+        )
+        results = dict(detect_as_completed(pipeline, [read(b"1")], 1))
+        assert isinstance(results[0], SchedulerOverloaded)
+
+
+class TestDetectBatch:
+    def test_invalid_images_are_reported_per_image(self, detector):
+        pipeline = InferencePipeline(
+            SimpleNamespace(detector=detector), ResultCache(max_entries=0)
+        )
+        datas = [synthetic_image(640, 480), b"not an image", synthetic_image(480, 640)]
+        results = asyncio.run(pipeline.detect_batch(datas))
+        assert isinstance(results[0], ImageDetections)
+        assert isinstance(results[1], InvalidImage)
+        assert isinstance(results[2], ImageDetections)
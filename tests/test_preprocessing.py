@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from benchmarks.synthetic import synthetic_image
+from src.modules.augmentations import letterbox, letterbox_into
+from src.modules.buffers import InputBuffers
+from src.exceptions import ImageTooLarge, InvalidImage
+from src.modules.cache import ResultCache
+from src.modules.detector import batches_by_shape
+from src.modules.loaders import decode_image
+from src.modules.pipeline import InferencePipeline
+from src.schemas import ImageBytes
+
+
+def image(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 255, (height, width, 3), np.uint8)
+
+
+@pytest.mark.parametrize("shape", [(480, 640), (3000, 4000), (100, 37), (640, 640)])
+def test_letterbox_into_matches_letterbox(shape):
+    img0 = image(*shape)
+    out = np.empty((320, 320, 3), np.uint8)
+    assert np.array_equal(
+        letterbox_into(img0, out), letterbox(img0, 320, auto=False)[0]
+    )
+
+
+class TestInvalidImages:
+    def test_unrecognized_format(self):
+        with pytest.raises(InvalidImage):
+            decode_image(b"not an image")
+
+    def test_truncated_image(self):
+        with pytest.raises(InvalidImage):
+            decode_image(synthetic_image(640, 480)[:1000])
+
+    def test_decompression_bomb(self, monkeypatch):
+        monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+        with pytest.raises(ImageTooLarge):
+            decode_image(synthetic_image(640, 480))
+
+    def test_max_pixels(self, detector):
+        detector.max_pixels = 640 * 480 - 1
+        with pytest.raises(ImageTooLarge):
+            detector.preprocess(synthetic_image(640, 480))
+
+    def test_invalid_base64(self):
+        with pytest.raises(InvalidImage):
+            asyncio.run(ImageBytes(__root__=b"abc").read(None))
+
+
+class TestInputBuffers:
+    def test_batch_matches_normalized_images(self):
+        imgs = [image(64, 64, seed) for seed in range(3)]
+        with InputBuffers(torch.device("cpu")).batch(imgs) as batch:
+            expected = torch.from_numpy(np.stack(imgs).transpose(0, 3, 1, 2)) / 255.0
+            assert torch.equal(batch, expected)
+
+    def test_buffers_are_reused(self):
+        buffers = InputBuffers(torch.device("cpu"))
+        with buffers.batch([image(64, 64)] * 4) as batch:
+            data_ptr = batch.data_ptr()
+        with buffers.batch([image(64, 64)] * 2) as batch:
+            assert batch.shape == (2, 3, 64, 64)
+            assert batch.data_ptr() == data_ptr
+        with buffers.batch([image(32, 64)]) as batch:
+            assert batch.data_ptr() != data_ptr
+
+
+class TestShapeBuckets:
+    @pytest.mark.parametrize(
+        "shape, input_shape",
+        [
+            ((1080, 1920), (384, 640)),
+            ((1920, 1080), (640, 384)),
+            ((480, 640), (480, 640)),
+            ((500, 640), (640, 640)),
+            ((100, 1000), (384, 640)),
+        ],
+    )
+    def test_input_shape(self, detector, shape, input_shape):
+        assert detector.input_shape(shape, 640) == input_shape
+
+    def test_input_shape_rounds_to_stride(self, detector):
+        assert detector.input_shape((1080, 1920), 320) == (192, 320)
+        assert detector.input_shape((480, 640), 256) == (192, 256)
+
+    def test_batches_by_shape(self):
+        imgs = [np.empty(shape) for shape in [(2, 3), (3, 2), (2, 3), (2, 3)]]
+        assert list(batches_by_shape(imgs, 2)) == [[0, 2], [3], [1]]
+
+    def test_detect_batch_keeps_image_order(self, detector):
+        pipeline = InferencePipeline(
+            SimpleNamespace(detector=detector), ResultCache(max_entries=0)
+        )
+        datas = [
+            synthetic_image(width, height, seed=seed)
+            for seed, (width, height) in enumerate([(640, 480), (360, 640), (640, 480)])
+        ]
+        results = asyncio.run(pipeline.detect_batch(datas))
+        for data, result in zip(datas, results):
+            assert result == asyncio.run(pipeline.detect_batch([data]))[0]
+
+    def test_warmup_disables_failing_buckets(self, detector):
+        model = detector.model
+
+        def square_only(x):
+            assert x.shape[2] == x.shape[3], "Input shape is fixed"
+            return model(x)
+
+        detector.model = square_only
+        detector.warmup(runs=1)
+        assert detector.shape_buckets == [1.0]
@@ -0,0 +1,42 @@
+from benchmarks.precision import run
+from benchmarks.synthetic import synthetic_image
+from src.modules.quantization import compare_detections
+
+
+def detection(class_id, score, x0, y0, x1, y1):
+    return [x0, y0, x1, y1, score, class_id]
+
+
+class TestCompareDetections:
+    def test_identical(self):
+        detections = [[detection(0, 0.9, 0.1, 0.1, 0.5, 0.5)]]
+        report = compare_detections(detections, detections)
+        assert report["precision"] == report["recall"] == report["meanIoU"] == 1.0
+
+    def test_missing_and_extra_detections(self):
+        baseline = [
+            [
+                detection(0, 0.9, 0.1, 0.1, 0.5, 0.5),
+                detection(1, 0.8, 0.5, 0.5, 0.9, 0.9),
+            ]
+        ]
+        candidate = [
+            [
+                detection(0, 0.8, 0.1, 0.1, 0.5, 0.45),
+                detection(1, 0.5, 0.0, 0.0, 0.1, 0.1),
+            ]
+        ]
+        report = compare_detections(baseline, candidate)
+        assert report["precision"] == 0.5
+        assert report["recall"] == 0.5
+        assert round(report["meanScoreDiff"], 2) == 0.1
+
+
+def test_precision_benchmark_runs_mixed_aspect_ratios(detector):
+    datas = [
+        synthetic_image(width, height)
+        for width, height in ((640, 480), (480, 640), (640, 640), (640, 480))
+    ]
+    results, _ = run(detector, datas, batch_size=4)
+    assert len(results) == 4
+    assert results[0] == results[3]
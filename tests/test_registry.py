@@ -0,0 +1,192 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from src.exceptions import ModelNotFound, UnknownModelTag
+from src.modules.registry import ModelManager
+
+
+class FakeFactory:
+    """Creates pipelines of 1 MB models, tags in `missing` fail to load."""
+
+    def __init__(self):
+        self.loads = []
+        self.missing = set()
+
+    def __call__(self, tag, backend):
+        self.loads.append(tag)
+        if tag in self.missing:
+            raise ModelNotFound(f"Model '{tag}' not found.")
+
+        async def stop(drain=False):
+            pass
+
+        return SimpleNamespace(
+            tag=tag,
+            detector=SimpleNamespace(precision="fp32", size_bytes=2**20),
+            scheduler=SimpleNamespace(stop=stop),
+        )
+
+
+def model_manager(**kwargs) -> ModelManager:
+    return ModelManager(FakeFactory(), "latest", "torchscript", **kwargs)
+
+
+class TestReadiness:
+    def test_ready_once_default_model_is_loaded(self):
+        async def run():
+            manager = model_manager()
+            manager.load_in_background("latest")
+            assert not manager.ready
+            while manager._tasks:
+                await asyncio.sleep(0.01)
+            assert manager.ready
+
+        asyncio.run(run())
+
+    def test_failed_load_is_retried_by_requests(self):
+        async def run():
+            manager = model_manager()
+            manager.factory.missing.add("latest")
+            manager.load_in_background("latest")
+            while manager._tasks:
+                await asyncio.sleep(0.01)
+            assert not manager.ready
+
+            manager.factory.missing.clear()
+            await manager.get_pipeline()
+            assert manager.ready
+
+        asyncio.run(run())
+
+
+class TestTags:
+    @pytest.mark.parametrize("tag", ["../etc", "a/b", ".hidden", "x" * 65, ""])
+    def test_malformed_tags_are_rejected(self, tag):
+        manager = model_manager()
+        with pytest.raises(UnknownModelTag):
+            manager.check_tag(tag)
+
+    def test_tags_outside_allowlist_are_rejected(self):
+        manager = model_manager(allowed_tags=["latest", "v2"])
+        manager.check_tag("v2")
+        with pytest.raises(UnknownModelTag):
+            asyncio.run(manager.get_pipeline("v3"))
+        assert manager.factory.loads == []
+
+    def test_default_and_canary_tags_are_allowed(self):
+        manager = model_manager(canary_tag="v2", allowed_tags=[])
+        manager.check_tag("latest")
+        manager.check_tag("v2")
+        with pytest.raises(UnknownModelTag):
+            manager.check_tag("v3")
+
+
+class TestLoading:
+    def test_concurrent_loads_are_shared(self):
+        async def run():
+            manager = model_manager()
+            pipelines = await asyncio.gather(
+                *(manager.get_pipeline("v2") for _ in range(5))
+            )
+            assert manager.factory.loads == ["v2"]
+            assert all(pipeline is pipelines[0] for pipeline in pipelines)
+
+        asyncio.run(run())
+
+    def test_least_recently_used_model_is_evicted(self):
+        async def run():
+            manager = model_manager(memory_budget_mb=3)
+            for tag in ("latest", "v1", "v2"):
+                await manager.get_pipeline(tag)
+            await manager.get_pipeline("v1")
+            await manager.get_pipeline("v3")
+            assert [model["tag"] for model in manager.models()] == [
+                "latest",
+                "v1",
+                "v3",
+            ]
+
+        asyncio.run(run())
+
+    def test_default_model_is_not_evicted(self):
+        async def run():
+            manager = model_manager(memory_budget_mb=1)
+            await manager.get_pipeline()
+            await manager.get_pipeline("v1")
+            await manager.get_pipeline("v2")
+            assert [model["tag"] for model in manager.models()] == ["latest", "v2"]
+
+        asyncio.run(run())
+
+
+class TestRouting:
+    def test_canary_share(self):
+        manager = model_manager(canary_tag="v2", canary_weight=0.25)
+        random.seed(0)
+        tags = [manager.resolve_tag() for _ in range(1000)]
+        assert 200 < tags.count("v2") < 300
+        assert set(tags) == {"latest", "v2"}
+
+    def test_explicit_tag_skips_canary(self):
+        manager = model_manager(canary_tag="v2", canary_weight=1.0)
+        assert manager.resolve_tag("v1") == "v1"
+
+
+class TestActivation:
+    def test_default_switches_once_loaded(self):
+        async def run():
+            manager = model_manager()
+            await manager.get_pipeline()
+            manager.activate_in_background("v2")
+            assert manager.default_tag == "latest"
+            while manager._tasks:
+                await asyncio.sleep(0.01)
+            assert manager.default_tag == "v2"
+            assert (await manager.get_pipeline()).tag == "v2"
+
+        asyncio.run(run())
+
+    def test_failed_activation_keeps_default(self):
+        async def run():
+            manager = model_manager()
+            manager.factory.missing.add("v2")
+            manager.activate_in_background("v2")
+            while manager._tasks:
+                await asyncio.sleep(0.01)
+            assert manager.default_tag == "latest"
+
+        asyncio.run(run())
+
+    def test_unknown_tag_is_rejected(self):
+        async def run():
+            manager = model_manager(allowed_tags=["latest"])
+            with pytest.raises(UnknownModelTag):
+                manager.activate_in_background("v2")
+            assert not manager._tasks
+
+        asyncio.run(run())
+
+    def test_activation_is_shared_by_workers(self, tmp_path):
+        async def wait(manager):
+            while manager._tasks:
+                await asyncio.sleep(0.01)
+
+        async def run():
+            path = str(tmp_path / "active-tag")
+            workers = [
+                model_manager(active_tag_file=path, sync_interval=0) for _ in range(2)
+            ]
+            await asyncio.gather(*(worker.get_pipeline() for worker in workers))
+            workers[0].activate_in_background("v2")
+            await wait(workers[0])
+            assert workers[1].default_tag == "latest"
+
+            await workers[1].get_pipeline()
+            await wait(workers[1])
+            assert [worker.default_tag for worker in workers] == ["v2", "v2"]
+            assert workers[0].factory.loads == ["latest", "v2"]
+
+        asyncio.run(run())
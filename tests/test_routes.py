@@ -0,0 +1,246 @@
+import base64
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from benchmarks.synthetic import build_model, synthetic_image
+from src import dependencies
+from src.config import settings
+from src.main import app
+
+API = settings.API_V1_PREFIX
+IMAGE = synthetic_image(640, 480)
+CACHED = (
+    dependencies.get_model_manager,
+    dependencies.get_job_manager,
+    dependencies.get_fetcher,
+    dependencies.get_result_cache,
+)
+
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    model_dir = tmp_path_factory.mktemp("models")
+    build_model(str(model_dir), "synthetic", num_classes=4)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in dict(
+            MODEL_DIR=str(model_dir),
+            WANDB_DEFAULT_TAG="synthetic",
+            MODEL_ADMIN_TOKEN="secret",
+            WARMUP_RUNS=0,
+            JOBS_DB=str(model_dir / "jobs.db"),
+        ).items():
+            monkeypatch.setattr(settings, name, value)
+        for dependency in CACHED:
+            dependency.cache_clear()
+
+        with TestClient(app) as client:
+            while client.get("/health/ready").status_code != 200:
+                time.sleep(0.01)
+            yield client
+
+        for dependency in CACHED:
+            dependency.cache_clear()
+
+
+class TestPredict:
+    def test_predict(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict", json={"image": b64(IMAGE)}
+        )
+        assert response.status_code == 200
+        assert response.json()["model"] == "synthetic"
+        assert response.json()["detections"]
+
+    def test_invalid_base64(self, client):
+        response = client.post(f"{API}/object-detection/predict", json={"image": "abc"})
+        assert response.status_code == 400
+
+    def test_upload(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict/upload",
+            files={"file": ("image.jpg", IMAGE, "image/jpeg")},
+        )
+        assert response.status_code == 200
+        assert response.json()["detections"]
+
+    def test_raw(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict/raw",
+            data=IMAGE,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert response.status_code == 200
+        assert response.json()["detections"]
+
+    def test_raw_invalid_image(self, client):
+        response = client.post(f"{API}/object-detection/predict/raw", data=b"junk")
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("route", ["raw", "upload"])
+    def test_too_large(self, client, monkeypatch, route):
+        monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", len(IMAGE) - 1)
+        if route == "raw":
+            response = client.post(f"{API}/object-detection/predict/raw", data=IMAGE)
+        else:
+            response = client.post(
+                f"{API}/object-detection/predict/upload",
+                files={"file": ("image.jpg", IMAGE, "image/jpeg")},
+            )
+        assert response.status_code == 413
+
+    def test_unknown_model(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict?model=nope", json={"image": b64(IMAGE)}
+        )
+        assert response.status_code == 404
+
+
+class TestBatch:
+    images = [b64(IMAGE), "abc", b64(b"junk")]
+
+    def test_batch_reports_errors_per_image(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict/batch", json={"images": self.images}
+        )
+        assert response.status_code == 200
+        results = response.json()["batchResults"]
+        assert results[0]["error"] is None and results[0]["detections"]
+        assert "base64" in results[1]["error"]
+        assert results[2]["error"] and not results[2]["detections"]
+
+    def test_batch_upload_reports_errors_per_image(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict/batch/upload",
+            files=[
+                ("files", ("a.jpg", IMAGE, "image/jpeg")),
+                ("files", ("b.jpg", b"junk", "image/jpeg")),
+            ],
+        )
+        assert response.status_code == 200
+        results = response.json()["batchResults"]
+        assert [result["source"] for result in results] == ["a.jpg", "b.jpg"]
+        assert results[0]["error"] is None and results[0]["detections"]
+        assert results[1]["error"]
+
+    def test_stream_reports_errors_per_image(self, client):
+        response = client.post(
+            f"{API}/object-detection/predict/batch/stream", json={"images": self.images}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = {
+            line["index"]: line for line in map(json.loads, response.text.splitlines())
+        }
+        assert sorted(lines) == [0, 1, 2]
+        assert lines[0]["error"] is None and lines[0]["detections"]
+        assert lines[1]["error"] and lines[2]["error"]
+
+
+class TestFrames:
+    def test_round_trip_with_bad_frame(self, client):
+        with client.websocket_connect(
+            f"{API}/object-detection/predict/ws"
+        ) as websocket:
+            websocket.send_bytes(IMAGE)
+            first = websocket.receive_json()
+            websocket.send_bytes(b"junk")
+            second = websocket.receive_json()
+            websocket.send_text("not a frame")
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_json()
+
+        assert first["frame"] == 0 and first["detections"] and first["error"] is None
+        assert second["frame"] == 1 and second["error"]
+        assert exc_info.value.code == 1003
+
+    def test_unknown_model_closes_stream(self, client):
+        with client.websocket_connect(
+            f"{API}/object-detection/predict/ws?model=nope"
+        ) as websocket:
+            with pytest.raises(WebSocketDisconnect) as exc_info:
+                websocket.receive_json()
+        assert exc_info.value.code == 1008
+
+
+class TestJobs:
+    def wait(self, client, job_id):
+        while True:
+            job = client.get(f"{API}/jobs/{job_id}").json()
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(0.01)
+
+    def test_job_results(self, client):
+        response = client.post(
+            f"{API}/jobs", json={"images": [b64(IMAGE), "abc", b64(IMAGE)]}
+        )
+        assert response.status_code == 202
+        job = self.wait(client, response.json()["id"])
+        assert (job["status"], job["processed"], job["failed"]) == ("completed", 3, 1)
+
+        response = client.get(f"{API}/jobs/{job['id']}/results?limit=2")
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["index"] for result in results] == [0, 1]
+        assert results[0]["detections"] and results[1]["error"]
+
+    def test_job_upload(self, client):
+        lines = [
+            json.dumps({"image": b64(IMAGE)}),
+            json.dumps({"images": [b64(IMAGE)]}),
+        ]
+        response = client.post(
+            f"{API}/jobs/upload",
+            files={"file": ("jobs.jsonl", "\n".join(lines), "application/x-ndjson")},
+        )
+        assert response.status_code == 202
+        assert self.wait(client, response.json()["id"])["processed"] == 2
+
+    def test_invalid_job_file(self, client):
+        response = client.post(
+            f"{API}/jobs/upload",
+            files={"file": ("jobs.jsonl", "not json", "application/x-ndjson")},
+        )
+        assert response.status_code == 400
+
+    def test_unknown_job(self, client):
+        assert client.get(f"{API}/jobs/nope").status_code == 404
+        assert client.post(f"{API}/jobs/nope/cancel").status_code == 404
+
+
+class TestModels:
+    def test_list_models(self, client):
+        models = client.get(f"{API}/models").json()
+        assert [(model["tag"], model["default"]) for model in models] == [
+            ("synthetic", True)
+        ]
+
+    def test_activation_requires_token(self, client):
+        response = client.post(f"{API}/models/synthetic/activate")
+        assert response.status_code == 401
+        response = client.post(
+            f"{API}/models/synthetic/activate", headers={"X-Admin-Token": "wrong"}
+        )
+        assert response.status_code == 401
+
+    def test_activation_disabled_without_token(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "MODEL_ADMIN_TOKEN", None)
+        response = client.post(
+            f"{API}/models/synthetic/activate", headers={"X-Admin-Token": "secret"}
+        )
+        assert response.status_code == 403
+
+    def test_activation(self, client):
+        headers = {"X-Admin-Token": "secret"}
+        response = client.post(f"{API}/models/synthetic/activate", headers=headers)
+        assert response.status_code == 202
+        response = client.post(f"{API}/models/nope/activate", headers=headers)
+        assert response.status_code == 404
@@ -0,0 +1,75 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.modules.detector import ImageDetections
+from src.modules.serialization import (
+    ResponseFormat,
+    ResultFormat,
+    default_detections,
+)
+from src.schemas import FrameDetectionModel, PredictResponse
+
+DETECTOR = SimpleNamespace(class_names=["chair", "table"])
+RESULT = ImageDetections([[0.1, 0.2, 0.3, 0.4, 0.5, 1]])
+DETECTIONS = [
+    {
+        "name": "table",
+        "score": 0.5,
+        "boundingBox": [
+            {"x": 0.1, "y": 0.2},
+            {"x": 0.3, "y": 0.2},
+            {"x": 0.3, "y": 0.4},
+            {"x": 0.1, "y": 0.4},
+        ],
+    }
+]
+
+
+def render(response_format: ResponseFormat) -> bytes:
+    content = response_format.image(RESULT, DETECTOR)
+    content.update(time=0.1, model="latest", profile=None)
+    return response_format.response(content, DETECTOR).body
+
+
+class TestResponseFormat:
+    def test_default_matches_response_model(self):
+        expected = PredictResponse(
+            detections=DETECTIONS, time=0.1, model="latest"
+        ).dict()
+        assert json.loads(render(ResponseFormat())) == expected
+
+    def test_compact(self):
+        content = json.loads(render(ResponseFormat(ResultFormat.compact)))
+        assert content["detections"] == [[0.1, 0.2, 0.3, 0.4, 0.5, 1]]
+        assert content["classes"] == ["chair", "table"]
+
+    def test_msgpack(self):
+        msgpack = pytest.importorskip("msgpack")
+        response_format = ResponseFormat(ResultFormat.compact, msgpack=True)
+        content = msgpack.unpackb(render(response_format))
+        assert content["detections"] == [[0.1, 0.2, 0.3, 0.4, 0.5, 1]]
+
+    def test_stream_messages_match_model(self):
+        response_format = ResponseFormat()
+        content = {"frame": 3, **response_format.image(RESULT, DETECTOR)}
+        expected = FrameDetectionModel(frame=3, detections=DETECTIONS)
+        assert json.loads(response_format.message(content)) == expected.dict(
+            exclude={"time", "dropped", "error"}
+        )
+
+    def test_compact_stream_lists_classes_once_given(self):
+        response_format = ResponseFormat(ResultFormat.compact)
+        first = json.loads(
+            response_format.message(response_format.image(RESULT, DETECTOR), DETECTOR)
+        )
+        other = json.loads(
+            response_format.message(response_format.image(RESULT, DETECTOR))
+        )
+        assert first["classes"] == ["chair", "table"]
+        assert "classes" not in other
+
+
+def test_default_detections_without_class_names():
+    assert default_detections(RESULT.detections)[0]["name"] == "1"
@@ -0,0 +1,97 @@
+import pytest
+import torch
+
+from benchmarks.synthetic import synthetic_image
+from src.modules.loaders import decode_image
+from src.modules.tiling import merge_tile_detections, tile_windows
+
+
+def detections(*boxes):
+    return torch.tensor(boxes, dtype=torch.float32).reshape(-1, 6)
+
+
+class TestTileWindows:
+    def test_tiles_cover_image_with_overlap(self):
+        windows = tile_windows((1000, 2000), 640, overlap=0.2)
+        assert {(x1 - x0, y1 - y0) for x0, y0, x1, y1 in windows} == {(640, 640)}
+        assert sorted({x0 for x0, _, _, _ in windows}) == [0, 453, 907, 1360]
+        assert sorted({y0 for _, y0, _, _ in windows}) == [0, 360]
+        assert max(x1 for _, _, x1, _ in windows) == 2000
+        assert max(y1 for _, _, _, y1 in windows) == 1000
+
+    def test_small_image_is_single_tile(self):
+        assert tile_windows((300, 500), 640) == [(0, 0, 500, 300)]
+
+
+class TestMergeTileDetections:
+    windows = [(0, 0, 640, 640), (512, 0, 1152, 640)]
+    shape = (640, 1152)
+
+    def test_duplicates_across_tiles_are_suppressed(self):
+        merged, truncated = merge_tile_detections(
+            [
+                detections([520, 10, 600, 90, 0.9, 0]),
+                detections([521, 11, 601, 90, 0.8, 0]),
+            ],
+            self.windows,
+            self.shape,
+        )
+        assert merged.tolist() == detections([520, 10, 600, 90, 0.9, 0]).tolist()
+        assert not truncated
+
+    def test_cut_detection_is_dropped(self):
+        # Object spanning 560-700 is cut by the right border of the first tile
+        merged, _ = merge_tile_detections(
+            [
+                detections([560, 10, 640, 90, 0.9, 0]),
+                detections([560, 10, 700, 90, 0.7, 0]),
+            ],
+            self.windows,
+            self.shape,
+        )
+        assert merged[:, 4].tolist() == pytest.approx([0.7])
+
+    def test_cut_detection_of_other_class_is_kept(self):
+        merged, _ = merge_tile_detections(
+            [
+                detections([560, 10, 640, 90, 0.9, 1]),
+                detections([560, 10, 700, 90, 0.7, 0]),
+            ],
+            self.windows,
+            self.shape,
+        )
+        assert len(merged) == 2
+
+    def test_max_det_truncation_is_reported(self):
+        boxes = [[x, 10, x + 20, 30, 0.5, 0] for x in range(0, 400, 40)]
+        merged, truncated = merge_tile_detections(
+            [detections(*boxes), detections()], self.windows, self.shape, max_det=3
+        )
+        assert len(merged) == 3
+        assert truncated
+
+
+class TestTiledDetection:
+    def test_single_tile_matches_untiled(self, detector):
+        data = synthetic_image(640, 480)
+        img0 = decode_image(data, None)
+        windows = tile_windows(img0.shape[:2], 640)
+        params = detector.default_params._replace(tiled=True)
+        tiled = detector.merge_tiles(
+            detector.detect_tiles(img0, windows, params), windows, img0.shape, params
+        )
+        img, img0 = detector.preprocess(data)
+        assert tiled == detector.infer([img], [img0])[0]
+
+    def test_detections_in_image_coordinates(self, detector):
+        img0 = decode_image(synthetic_image(2000, 1000), None)
+        windows = tile_windows(img0.shape[:2], 640)
+        tiles = detector.detect_tiles(img0, windows, detector.default_params)
+        for (x0, y0, x1, y1), detection in zip(windows, tiles):
+            assert len(detection)
+            assert (detection[:, [0, 2]] >= x0).all() and (
+                detection[:, [0, 2]] <= x1
+            ).all()
+            assert (detection[:, [1, 3]] >= y0).all() and (
+                detection[:, [1, 3]] <= y1
+            ).all()
@@ -0,0 +1,42 @@
+import torch
+
+from src.modules.utils import non_max_suppression
+
+
+def prediction(batch_size=2, anchors=200, num_classes=4, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.rand(batch_size, anchors, 5 + num_classes, generator=generator)
+    x[..., :2] *= 640
+    x[..., 2:4] *= 100
+    return x
+
+
+class TestNonMaxSuppression:
+    def test_batch_matches_single_images(self):
+        x = prediction()
+        batch, truncated = non_max_suppression(x, 0.15, 0.25)
+        for image, detections in zip(x, batch):
+            single, _ = non_max_suppression(image[None], 0.15, 0.25)
+            assert torch.equal(single[0], detections)
+        assert truncated == [False, False]
+
+    def test_detections_sorted_by_score(self):
+        detections, _ = non_max_suppression(prediction(), 0.15, 0.25)
+        for image in detections:
+            assert torch.equal(image[:, 4], image[:, 4].sort(descending=True)[0])
+
+    def test_max_det_truncation_is_reported(self):
+        full, _ = non_max_suppression(prediction(), 0.15, 0.25)
+        detections, truncated = non_max_suppression(prediction(), 0.15, 0.25, max_det=3)
+        assert [len(image) for image in detections] == [3, 3]
+        assert truncated == [True, True]
+        assert torch.equal(detections[0], full[0][:3])
+
+    def test_classes_filter(self):
+        detections, _ = non_max_suppression(prediction(), 0.15, 0.25, classes=[1])
+        assert all((image[:, 5] == 1).all() for image in detections)
+
+    def test_no_candidates(self):
+        detections, truncated = non_max_suppression(torch.zeros(2, 10, 9), 0.15, 0.25)
+        assert [image.shape for image in detections] == [(0, 6), (0, 6)]
+        assert truncated == [False, False]